@@ -14,20 +14,33 @@ date_range = pd.date_range(start=start_date, end=pd.Timestamp('today'))
 start_date_str = str(start_date)
 days_range = len(date_range)
 db_path = r"C:\Users\onno\OneDrive\Beleggen\2025 - portefeuille database 02.03 - STOCKDATA.accdb"
+# Intraday bars ('5min' of '1hour') in de Parquet store; dagbars worden daaruit afgeleid. None = dagbars van IB
+INTRADAY_BAR = None
+intraday_flags = ['--intraday', INTRADAY_BAR] if INTRADAY_BAR else []
 
 
 # Run multiple scripts sequentially
 
 subprocess.run(
-    ['python', '1 A - stockprice ibkr fetch 1.1 - optimized.py', str(days_range)],
+    ['python', '1 A - stockprice ibkr fetch 1.1 - optimized.py', str(days_range)] + intraday_flags,
     cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update'
 )
 subprocess.run(['python', '1 B - stockprice merge into historical data correct.py'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
 subprocess.run(['python', '1 C - delete temp stock price table.py'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
 stock_price_time = time.time()
+# Gaten in historical_data_correct gericht opnieuw ophalen (gat-index in historical_data_gaps)
+subprocess.run(['python', '1 A - stockprice ibkr fetch 1.1 - optimized.py', '--gaps'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+subprocess.run(['python', '1 B - stockprice merge into historical data correct.py'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+subprocess.run(['python', '1 C - delete temp stock price table.py'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+gap_time = time.time()
+# Parquet kopie van historical_data_correct (slaat zichzelf over zonder pyarrow)
+subprocess.run(['python', '10 parquet export 1.0.py', '--date', start_date_str, '--db', db_path, '--tables', 'historical_data_correct'],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+export_time = time.time()
 
 
 print(f"Time taken to run the script: {stock_price_time - start_time} seconds, for stockprices insert naar historicat_data_correct, script 1, A, B, C")
+print(f"Time taken to run the script: {gap_time - stock_price_time} seconds, for gap refetch, script 1 A --gaps, B, C")
+print(f"Time taken to run the script: {export_time - gap_time} seconds, for parquet export")
 
 
 
@@ -1,4 +1,5 @@
 import subprocess
+import sys
 import time 
 import pandas as pd
 
@@ -12,6 +13,20 @@ date_range = pd.date_range(start=start_date, end=pd.Timestamp('today'))
 
 # Convert the date to a string in YYYY-MM-DD format for the script
 start_date_str = str(start_date)
+# --profile-startup: elke stage rapporteert zijn import- en compile-tijd
+stage_flags = ['--profile-startup'] if '--profile-startup' in sys.argv else []
+# True: stages 3-8 in één proces, per_dag_asset_result in één brede upsert
+SINGLE_WRITE = False
+# True: stages 3-8 rekenen alleen op handelsdagen, weekenden/feestdagen worden bij het schrijven aangevuld
+TRADING_DAYS = False
+grid_flags = ['--trading-days'] if TRADING_DAYS else []
+# Aantal asset-shards (processen) voor stage 3 en het gecombineerde script; 0 = één proces, -1 = alle cores
+SHARDS = 0
+shard_flags = ['--shards', str(SHARDS)] if SHARDS else []
+# True: het gecombineerde script schrijft via een lokale wachtrij op de achtergrond (retry bij locks)
+WRITE_BEHIND = False
+write_flags = ['--write-behind'] if WRITE_BEHIND else []
+
 db_path = r"C:\Users\onno\OneDrive\Beleggen\2025 - portefeuille database 02.03 - ONNO.accdb"
 
 
@@ -22,19 +37,31 @@ db_path = r"C:\Users\onno\OneDrive\Beleggen\2025 - portefeuille database 02.03 -
 # subprocess.run(['python', '1 C - delete temp stock price table.py'])
 stock_price_time = time.time()
 
-subprocess.run(['python', '3 asset_berekening_aandelen 1.5.5.py','--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+subprocess.run(['python', '2 asset prijs matrix bijwerken 1.0.py','--db',db_path] + stage_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+price_matrix_time = time.time()
+if SINGLE_WRITE:
+    subprocess.run(['python', '3-8 asset_berekening gecombineerd 1.0.py', '--date', start_date_str,'--db',db_path] + stage_flags + grid_flags + shard_flags + write_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+    dividend_time = time.time()
+else:
+    subprocess.run(['python', '3 asset_berekening_aandelen 1.5.5.py','--date', start_date_str,'--db',db_path] + stage_flags + grid_flags + shard_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
 
-asset_berekening_aandelen_time = time.time()
-subprocess.run(['python', '4 asset_berekening_opties open tabel. 1.3.py', '--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
-opties_open_time_deel1 = time.time()
-subprocess.run(['python', '5 asset_berekening_optie open to result table 2.2.py', '--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
-opties_open_time_deel2 = time.time()
-subprocess.run(['python', '6 asset_berekening_optie closed to result table  2.1.py', '--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
-opties_closed_time = time.time()
-subprocess.run(['python', '7 asset_berekening_sprinters 1.6.py', '--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
-sprinters_time = time.time()
-subprocess.run(['python', '8 asset berekening dividend 1.1.py', '--date', start_date_str,'--db',db_path],cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
-dividend_time = time.time()
+    asset_berekening_aandelen_time = time.time()
+    subprocess.run(['python', '4 asset_berekening_opties open tabel. 1.3.py', '--date', start_date_str,'--db',db_path] + stage_flags + grid_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+    # script 4 schrijft ook de opties_open kolommen van per_dag_asset_result (voorheen script 5)
+    opties_open_time_deel2 = time.time()
+    subprocess.run(['python', '6 asset_berekening_optie closed to result table  2.1.py', '--date', start_date_str,'--db',db_path] + stage_flags + grid_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+    opties_closed_time = time.time()
+    subprocess.run(['python', '7 asset_berekening_sprinters 1.6.py', '--date', start_date_str,'--db',db_path] + stage_flags + grid_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+    sprinters_time = time.time()
+    subprocess.run(['python', '8 asset berekening dividend 1.1.py', '--date', start_date_str,'--db',db_path] + stage_flags + grid_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+    dividend_time = time.time()
+subprocess.run(['python', '9 portefeuille rollup bijwerken 1.0.py', '--date', start_date_str,'--db',db_path] + stage_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+rollup_time = time.time()
+subprocess.run(['python', '12 risico statistieken bijwerken 1.0.py', '--date', start_date_str,'--db',db_path] + stage_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+risk_time = time.time()
+# Parquet kopie voor analyses (slaat zichzelf over zonder pyarrow)
+subprocess.run(['python', '10 parquet export 1.0.py', '--date', start_date_str,'--db',db_path] + stage_flags,cwd=r'C:\python_coding\database_scripts\daily_update\result_per_dag_update')
+export_time = time.time()
 
 end_time = time.time()
 
@@ -42,12 +69,18 @@ end_time = time.time()
 elapsed_time = end_time - start_time
 
 print(f"Time taken to run the script: {stock_price_time - start_time} seconds, for stockprices insert naar historicat_data_correct, script 1, A, B, C")
-print(f"Time taken to run the script: {asset_berekening_aandelen_time - stock_price_time} seconds, for aandeel insert naar per_dag_asset_result")
-print(f"Time taken to run the script: {opties_open_time_deel1 - asset_berekening_aandelen_time} seconds, for optie_open hulptabel bijwerken")
-print(f"Time taken to run the script: {opties_open_time_deel2 - opties_open_time_deel1} seconds, for opties_open insert naar per_dag_asset_result")
-print(f"Time taken to run the script: {opties_closed_time - opties_open_time_deel2} seconds, for opties_closed insert naar per_dag_asset_result")
-print(f"Time taken to run the script: {sprinters_time - opties_closed_time} seconds, for sprinter_open insert naar per_dag_asset_result")
-print(f"Time taken to run the script: {dividend_time- sprinters_time} seconds, for dividend tabel bijwerken")
+print(f"Time taken to run the script: {price_matrix_time - stock_price_time} seconds, for prijsmatrix per_dag_asset_prijs bijwerken")
+if SINGLE_WRITE:
+    print(f"Time taken to run the script: {dividend_time - price_matrix_time} seconds, for aandelen, opties, sprinters en dividend in één schrijfronde naar per_dag_asset_result")
+else:
+    print(f"Time taken to run the script: {asset_berekening_aandelen_time - price_matrix_time} seconds, for aandeel insert naar per_dag_asset_result")
+    print(f"Time taken to run the script: {opties_open_time_deel2 - asset_berekening_aandelen_time} seconds, for optie_open hulptabel + opties_open insert naar per_dag_asset_result")
+    print(f"Time taken to run the script: {opties_closed_time - opties_open_time_deel2} seconds, for opties_closed insert naar per_dag_asset_result")
+    print(f"Time taken to run the script: {sprinters_time - opties_closed_time} seconds, for sprinter_open insert naar per_dag_asset_result")
+    print(f"Time taken to run the script: {dividend_time- sprinters_time} seconds, for dividend tabel bijwerken")
+print(f"Time taken to run the script: {rollup_time - dividend_time} seconds, for portefeuille totalen per dag bijwerken")
+print(f"Time taken to run the script: {risk_time - rollup_time} seconds, for rendementen en risicostatistieken bijwerken")
+print(f"Time taken to run the script: {export_time - risk_time} seconds, for parquet export")
 
 print(f"Time taken to run the script: {elapsed_time:.2f} seconds")
 
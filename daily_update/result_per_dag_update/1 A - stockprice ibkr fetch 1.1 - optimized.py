@@ -11,6 +11,10 @@ import pyodbc
 import random
 import sys
 
+from bulk_writer import bulk_insert
+from price_gaps import refresh_gap_index, refetch_requests, mark_requested
+import intraday_store
+
 # -------------------------
 # Access connection (READ asset list + WRITE temp table)
 # -------------------------
@@ -23,6 +27,16 @@ sql_query_stock_range = "SELECT * FROM asset_rollup_data"
 # Column used to filter valid rows
 currency_column = 'ib_currency'
 
+# --gaps: alleen de ontbrekende ranges uit historical_data_gaps ophalen
+# (één verzoek per cluster van gaten per symbool) i.p.v. de laatste N dagen
+GAP_MODE = '--gaps' in sys.argv
+
+# --intraday 5min|1hour: intraday bars naar de lokale Parquet store (per verzoek
+# weggeschreven); alleen de daarvan afgeleide dagbars gaan naar de temp tabel
+INTRADAY_BAR = sys.argv[sys.argv.index('--intraday') + 1] if '--intraday' in sys.argv else None
+if INTRADAY_BAR is not None and INTRADAY_BAR not in intraday_store.BAR_SIZES:
+    sys.exit(f"--intraday: kies uit {', '.join(intraday_store.BAR_SIZES)}")
+
 # -------------------------
 # Pacing / status codes
 # -------------------------
@@ -48,6 +62,12 @@ next_idx = 0         # next row index to submit
 # -------------------------
 rows = []  # list of tuples: (date, symbol, asset_rollup, open, high, low, close, volume, wap)
 
+# Intraday modus: bars per reqId tot historicalDataEnd, daarna naar de store
+intraday_buffers = {}
+intraday_touched = set()  # (jaar, maand) partities met nieuwe parts
+intraday_symbols = set()
+intraday_first = []      # vroegste bar per verzoek
+
 # will be loaded in main()
 all_data = pd.DataFrame()
 
@@ -106,15 +126,21 @@ class TestApp(wrapper.EWrapper, EClient):
             except Exception:
                 wap_val = None
 
-        rows.append((
+        row = (
             bar.date, symbol, asset_rollup,
             bar.open, bar.high, bar.low, bar.close, bar.volume, wap_val
-        ))
+        )
+        if INTRADAY_BAR:
+            intraday_buffers.setdefault(reqId, []).append(row)
+        else:
+            rows.append(row)
 
     @iswrapper
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         super().historicalDataEnd(reqId, start, end)
         self.retry_counts.pop(reqId, None)
+        if INTRADAY_BAR:
+            flush_intraday(reqId)
 
         if reqId in pending:
             pending.discard(reqId)
@@ -213,12 +239,17 @@ def send_request_for_index(app: TestApp, idx: int):
     except Exception:
         duration_days = "5 D"
 
+    # Gat-verzoek: eigen venster per rij
+    end_datetime = _safe_str(row.get('end_datetime', ''))
+    if _safe_str(row.get('duration', '')):
+        duration_days = _safe_str(row.get('duration'))
+
     app.reqHistoricalData(
         idx,            # reqId == index (so callbacks map back to all_data)
         contract,
-        "",             # endDateTime ("" = now)
+        end_datetime,   # endDateTime ("" = now)
         duration_days,  # duration
-        "1 day",        # barSize
+        intraday_store.BAR_SIZES.get(INTRADAY_BAR, "1 day"),  # barSize
         what_to_show,   # whatToShow
         1,              # useRTH
         1,              # formatDate
@@ -227,6 +258,35 @@ def send_request_for_index(app: TestApp, idx: int):
     )
 
 
+def intraday_root():
+    db_path = conn_str.split('DBQ=', 1)[1]
+    return intraday_store.default_root(db_path)
+
+
+def flush_intraday(reqId: int):
+    """Schrijft de bars van één afgerond verzoek als nieuw part naar de intraday store."""
+    buffered = intraday_buffers.pop(reqId, [])
+    if not buffered:
+        return
+    df = intraday_store.normalize_bars(pd.DataFrame(
+        buffered, columns=['date', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
+    ))
+    intraday_touched.update(intraday_store.append_bars(intraday_root(), df, INTRADAY_BAR))
+    intraday_symbols.update(df['symbol'].unique())
+    if not df.empty:
+        intraday_first.append(df['datetime'].min())
+
+
+def intraday_daily_bars(start) -> pd.DataFrame:
+    """Compacteert de geraakte partities en leidt dagbars af voor de opgehaalde symbolen."""
+    root = intraday_root()
+    intraday_store.compact(root, INTRADAY_BAR, intraday_touched)
+    df_bars = intraday_store.read_bars(root, INTRADAY_BAR, start=start, symbols=intraday_symbols)
+    print(f"Intraday ({INTRADAY_BAR}): {len(df_bars)} bars in de store voor {len(intraday_symbols)} symbolen "
+          f"vanaf {pd.Timestamp(start).date()}")
+    return intraday_store.daily_bars(df_bars)
+
+
 def kick_off_more(app: TestApp):
     """Maintain up to MAX_IN_FLIGHT concurrent historical requests."""
     global next_idx
@@ -274,10 +334,6 @@ def save_df_to_access_temp(df: pd.DataFrame, conn_str: str):
     columns_order = ['datum', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
     df_to_write = df_to_write[columns_order]
 
-    # Convert datetime to Python datetime objects (pyodbc)
-    if pd.api.types.is_datetime64_any_dtype(df_to_write['datum']):
-        df_to_write['datum'] = df_to_write['datum'].dt.to_pydatetime()
-
     temp_table_name = "temp_stock_prices_temp"
     create_temp_table_query = f"""
     CREATE TABLE {temp_table_name} (
@@ -292,11 +348,6 @@ def save_df_to_access_temp(df: pd.DataFrame, conn_str: str):
         wap DOUBLE
     )
     """
-    placeholders = ", ".join(["?"] * len(columns_order))
-    insert_temp_table_query = f"INSERT INTO {temp_table_name} ({', '.join(columns_order)}) VALUES ({placeholders})"
-
-    data = [tuple(row) for row in df_to_write.to_numpy()]
-
     try:
         with pyodbc.connect(conn_str) as conn:
             cur = conn.cursor()
@@ -309,19 +360,46 @@ def save_df_to_access_temp(df: pd.DataFrame, conn_str: str):
             except pyodbc.Error:
                 print(f"Table {temp_table_name} already exists, skipping creation.")
 
-            # Insert all rows (append)
-            cur.executemany(insert_temp_table_query, data)
-            conn.commit()
-            print(f"Inserted {len(data)} rows into {temp_table_name}.")
+            # Insert all rows (append); datetime -> Python datetime gebeurt in bulk_writer
+            n_rows = bulk_insert(conn, cur, temp_table_name, df_to_write, columns_order)
+            print(f"Inserted {n_rows} rows into {temp_table_name}.")
 
     except pyodbc.Error as e:
         print("Error writing temp table to Access:", e)
 
 
+def build_gap_requests(universe: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ververst de gat-index en geeft één rij per verzoek terug: de universe-rij
+    van het symbool plus end_datetime/duration. Verstuurde ranges krijgen attempts + 1.
+    """
+    groups = dict(zip(universe['ib_symbol'].map(_safe_str), universe[currency_column]))
+    with pyodbc.connect(conn_str) as conn:
+        cur = conn.cursor()
+        gaps = refresh_gap_index(conn, cur, groups=groups)
+        requests = refetch_requests(gaps)
+        requests = requests[requests['symbol'].isin(groups.keys())]
+        mark_requested(conn, cur, requests)
+
+    keyed = universe.assign(symbol=universe['ib_symbol'].map(_safe_str))
+    out = keyed.merge(
+        requests[['symbol', 'asset_rollup', 'end_datetime', 'duration']],
+        on=['symbol', 'asset_rollup']
+    ).drop(columns='symbol')
+    print(f"Gat-verzoeken: {len(out)} voor {out['ib_symbol'].nunique() if not out.empty else 0} symbolen.")
+    return out.reset_index(drop=True)
+
+
 def main():
     global all_data, next_idx
     t0 = time()
 
+    if INTRADAY_BAR and GAP_MODE:
+        sys.exit("--intraday en --gaps gaan niet samen (gat-ranges zijn te lang voor intraday bars)")
+    if INTRADAY_BAR and not intraday_store.pyarrow_available():
+        print("pyarrow niet geïnstalleerd; intraday modus niet mogelijk.")
+        return
+
     # -------- Load symbol universe from Access --------
     with pyodbc.connect(conn_str) as connection:
         all_data = pd.read_sql(sql_query_stock_range, connection)
@@ -329,6 +407,12 @@ def main():
     # Filter: require non-null currency
     all_data = all_data[all_data[currency_column].notna()].reset_index(drop=True)
 
+    if GAP_MODE:
+        all_data = build_gap_requests(all_data)
+        if all_data.empty:
+            print("Geen gaten om op te halen.")
+            return
+
     print("Filtered data (first 5 rows):")
     print(all_data.head())
     print()
@@ -337,6 +421,10 @@ def main():
     pending.clear()
     next_idx = 0
     rows.clear()
+    intraday_buffers.clear()
+    intraday_touched.clear()
+    intraday_symbols.clear()
+    intraday_first.clear()
 
     # -------- Start IB connection --------
     app = TestApp()
@@ -349,10 +437,15 @@ def main():
     app.run()
 
     # -------- Build DataFrame once from rows --------
-    all_stock_prices_df = pd.DataFrame(
-        rows,
-        columns=['date', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
-    )
+    if INTRADAY_BAR:
+        # dagbars uit de store vanaf de eerste opgehaalde dag (incl. eerder opgeslagen bars van die dagen)
+        all_stock_prices_df = (intraday_daily_bars(min(intraday_first)) if intraday_first
+                               else intraday_store.daily_bars(pd.DataFrame()))
+    else:
+        all_stock_prices_df = pd.DataFrame(
+            rows,
+            columns=['date', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
+        )
 
     print("All requests completed.")
     print("Collected bars:", len(all_stock_prices_df))
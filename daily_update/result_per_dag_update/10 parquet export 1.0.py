@@ -0,0 +1,56 @@
+import argparse
+import time
+from datetime import datetime
+
+import startup_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporteert resultaat- en prijstabellen naar Parquet (per jaar/maand)")
+    parser.add_argument('--date', type=str, help="Herschrijf maanden vanaf deze datum (YYYY-MM-DD); zonder: alles")
+    parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    parser.add_argument("--out", type=str, help="Doelmap (standaard lokaal: ~/.per_dag_pipeline/parquet/<naam database>.<hash>, of PER_DAG_PARQUET_DIR)")
+    parser.add_argument("--tables", nargs='+', help="Te exporteren tabellen (standaard de resultaat- en prijstabellen)")
+    parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+    args = parser.parse_args()
+
+    with startup_profile.timed('import pyodbc/pandas'):
+        import pyodbc
+        import pandas as pd
+
+    with startup_profile.timed('import pipeline modules (pyarrow)'):
+        from parquet_store import export_tables, default_root, pyarrow_available, EXPORT_TABLES
+
+    if not pyarrow_available():
+        print("pyarrow niet geïnstalleerd; Parquet export overgeslagen.")
+        return
+
+    start_date = None
+    if args.date:
+        try:
+            start_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Parsed Date: {start_date}")
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            exit(1)
+
+    t0 = time.time()
+    root = args.out or default_root(args.db)
+
+    conn_str = (
+        r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};'
+        f'DBQ={args.db}'
+    )
+    conn = pyodbc.connect(conn_str)
+    cursor = conn.cursor()
+
+    export_tables(cursor, root, pd.Timestamp(start_date) if start_date else None, args.tables or EXPORT_TABLES)
+
+    cursor.close()
+    conn.close()
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 10 - parquet export)")
+    startup_profile.report('script 10')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import sys
+import time
+from datetime import datetime
+
+import pipeline_service
+
+
+def main():
+    # -----------------------------
+    # Lokale pipeline service met warme caches:
+    #   serve  start de service (laat dit venster open)
+    #   run    stuurt een run-verzoek (stages 2, 3-8, 9, 12) naar de service
+    #   stop   stopt de service
+    # Sleutel: PIPELINE_SERVICE_KEY of het sleutelbestand dat serve aanmaakt
+    # (pipeline_service.KEY_FILE, alleen voor de eigen gebruiker)
+    # -----------------------------
+    parser = argparse.ArgumentParser(description="Pipeline service met warme verbindingen, data en kernels")
+    parser.add_argument("--port", type=int, default=pipeline_service.DEFAULT_PORT, help="Lokale poort van de service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("serve", help="Start de service")
+
+    run = commands.add_parser("run", help="Voer stages uit via de service")
+    run.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    run.add_argument('--date', type=str, help="Date in YYYY-MM-DD format")
+    run.add_argument("--stages", nargs="+", choices=pipeline_service.STAGES, default=pipeline_service.STAGES,
+                     help="Uit te voeren stages, in deze volgorde")
+    run.add_argument("--full-history", action="store_true",
+                     help="Dividend/fees: tel alle fees opnieuw op i.p.v. te starten vanaf de opgeslagen stand")
+    run.add_argument("--per-sector", action="store_true", help="Ook per_dag_sector_result bijwerken")
+    run.add_argument("--trading-days", action="store_true",
+                     help="Reken alleen op handelsdagen; overige dagen krijgen bij het schrijven de vorige handelsdag")
+
+    commands.add_parser("stop", help="Stop de service")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        pipeline_service.serve(args.port)
+        return
+
+    if args.command == "stop":
+        print(pipeline_service.request({'stop': True}, args.port)['log'], end="")
+        return
+
+    if args.date:
+        try:
+            parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Parsed Date: {parsed_date}")
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            exit(1)
+
+    t0 = time.time()
+    reply = pipeline_service.request({
+        'db': args.db,
+        'date': args.date,
+        'stages': args.stages,
+        'trading_days': args.trading_days,
+        'full_history': args.full_history,
+        'per_sector': args.per_sector,
+    }, args.port)
+
+    print(reply['log'], end="")
+    if not reply['ok']:
+        print(reply['error'], file=sys.stderr)
+        exit(1)
+    for label, dt in reply['timings']:
+        print(f"  {label:<35} {dt:8.2f}s")
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 11 - pipeline service, "
+          f"service {reply['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
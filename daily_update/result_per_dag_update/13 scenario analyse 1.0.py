@@ -0,0 +1,104 @@
+import argparse
+import time
+from datetime import datetime
+
+import startup_profile
+
+
+def parse_asset_shock(value):
+    """'NVDA=0.2' -> ('NVDA', 0.2)"""
+    asset, sep, level = value.rpartition('=')
+    if not sep or not asset:
+        raise argparse.ArgumentTypeError(f"Verwacht ASSET=SCHOK (bijv. NVDA=0.2), niet {value!r}")
+    return asset, float(level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Herwaardeert alle open aandelen, opties en sprinters onder een grid van koersschokken")
+    parser.add_argument('--date', type=str, help="Peildatum in YYYY-MM-DD format (standaard de laatste datum in per_dag_asset_result)")
+    parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    parser.add_argument("--market", type=float, nargs="+",
+                        help="Marktbrede schokken als fractie, bijv. -0.1 0.1 (standaard -0.3 t/m +0.3 per 0.05)")
+    parser.add_argument("--shock", type=parse_asset_shock, action="append", default=[],
+                        help="Schok voor één asset_rollup, bijv. NVDA=0.2 (herhaalbaar)")
+    parser.add_argument("--cross", action="store_true", help="Combineer ook elke marktschok met elke asset-schok")
+    parser.add_argument("--beta", action="store_true",
+                        help="Marktschok per asset schalen met de beta uit stage 12 (zonder beta: 1)")
+    parser.add_argument("--horizon-days", type=int, default=0, help="Looptijd van de opties zoveel dagen korter")
+    parser.add_argument("--per-asset", action="store_true", help="Print ook het resultaat per asset en scenario")
+    parser.add_argument("--out", type=str, help="CSV met het resultaat per scenario en asset")
+    parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+    args = parser.parse_args()
+
+    with startup_profile.timed('import pyodbc/pandas'):
+        import pyodbc
+        import pandas as pd
+
+    with startup_profile.timed('import pipeline modules'):
+        import scenarios
+
+    t0 = time.time()
+
+    conn_str = (
+        r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};'
+        f'DBQ={args.db}'
+    )
+    conn = pyodbc.connect(conn_str)
+    cursor = conn.cursor()
+
+    if args.date:
+        try:
+            parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Parsed Date: {parsed_date}")
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            exit(1)
+    else:
+        parsed_date = scenarios.latest_date(cursor)
+        if parsed_date is None:
+            print("per_dag_asset_result is leeg; geen posities om te herwaarderen.")
+            exit(1)
+        print(f"No date provided. Using latest date: {parsed_date.date()}")
+
+    positions = scenarios.load_positions(cursor, pd.Timestamp(parsed_date))
+    betas = scenarios.latest_betas(cursor, parsed_date) if args.beta else None
+    cursor.close()
+    conn.close()
+    t_load = time.time()
+
+    market = scenarios.DEFAULT_MARKET_SHOCKS if args.market is None and not args.shock else (args.market or [])
+    try:
+        names, shocks = scenarios.scenario_grid(positions['assets'], market, args.shock, betas, args.cross)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+    with startup_profile.timed('import numba + option_kernels'):
+        from option_kernels import warm_up
+    # Alleen de eerste dispatch (cache-load of compilatie) telt als opstartkost
+    with startup_profile.timed('value_options cache-load/compile'):
+        warm_up()
+    t_warm = time.time()
+    values = scenarios.revalue(positions, shocks, args.horizon_days)
+    t_revalue = time.time()
+
+    summary = scenarios.scenario_summary(names, values)
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:,.2f}'.format):
+        print(f"Peildatum {positions['as_of'].date()}: {len(positions['assets'])} assets, "
+              f"{len(positions['opties']['strike'])} open optierijen, {len(names)} scenario's")
+        print(summary)
+        if args.per_asset or args.out:
+            per_asset = scenarios.scenario_per_asset(names, positions['assets'], values)
+            if args.per_asset:
+                print(per_asset[per_asset['resultaat'].abs() > 0.005].to_string(index=False))
+            if args.out:
+                per_asset.to_csv(args.out, index=False)
+                print(f"Resultaat per asset geschreven naar {args.out}")
+
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 13 - scenario analyse; "
+          f"laden {t_load - t0:.2f}s, kernel {t_warm - t_load:.2f}s, herwaardering {t_revalue - t_warm:.3f}s)")
+    startup_profile.report('script 13')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+import time
+
+import startup_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Werkt de prijsmatrix per_dag_asset_prijs incrementeel bij")
+    parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+    args = parser.parse_args()
+
+    with startup_profile.timed('import pyodbc'):
+        import pyodbc
+
+    with startup_profile.timed('import pipeline modules'):
+        from price_matrix import refresh_price_matrix
+
+    t0 = time.time()
+
+    conn_str = (
+        r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};'
+        f'DBQ={args.db}'
+    )
+    conn = pyodbc.connect(conn_str)
+    cursor = conn.cursor()
+
+    refresh_price_matrix(conn, cursor)
+
+    cursor.close()
+    conn.close()
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 2 - prijsmatrix)")
+    startup_profile.report('script 2')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import time
+from datetime import datetime
+
+import stage_flags
+import startup_profile
+
+
+def main():
+    # -----------------------------
+    # Stages 3, 4, 6, 7 en 8 in één proces: alle kolomgroepen van
+    # per_dag_asset_result in het geheugen, daarna één diff-upsert
+    # -----------------------------
+    parser = argparse.ArgumentParser(description="Script that accepts a date")
+    parser.add_argument('--date', type=str, help="Date in YYYY-MM-DD format")
+    parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    parser.add_argument("--full-history", action="store_true",
+                        help="Dividend/fees: tel alle fees opnieuw op i.p.v. te starten vanaf de opgeslagen stand")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Herbereken vanaf --date (standaard: eerste transactie) in vensters, hervat na onderbreking")
+    parser.add_argument("--window-days", type=int,
+                        help="Vensterlengte in dagen voor --rebuild (standaard rebuild.WINDOW_DAYS)")
+    parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+    parser.add_argument(stage_flags.TRADING_DAYS, action="store_true", help=stage_flags.TRADING_DAYS_HELP)
+    parser.add_argument(stage_flags.SHARDS, type=int, default=0, help=stage_flags.SHARDS_HELP)
+    parser.add_argument(stage_flags.WRITE_BEHIND, action="store_true", help=stage_flags.WRITE_BEHIND_HELP)
+    args = parser.parse_args()
+
+    with startup_profile.timed('import pyodbc/pandas'):
+        import pyodbc
+        import pandas as pd
+
+    with startup_profile.timed('import pipeline modules'):
+        from combined_stages import load_inputs, run_window
+        import rebuild
+        import sharding
+        import trading_calendar
+        import write_queue
+
+    window_days = args.window_days or rebuild.WINDOW_DAYS
+    if args.date:
+        try:
+            parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Parsed Date: {parsed_date}")
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            exit(1)
+    else:
+        parsed_date = (pd.Timestamp('today') - pd.Timedelta(days=50)).date()
+        if not args.rebuild:
+            print(f"No date provided. Using default date: {parsed_date}")
+
+    t0 = time.time()
+    start_ts = pd.to_datetime(parsed_date)
+    end_ts = pd.Timestamp('today').normalize()
+
+    conn_str = (
+        r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};'
+        f'DBQ={args.db}'
+    )
+    conn = pyodbc.connect(conn_str)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT asset_rollup FROM asset_rollup_data")
+    asset_list = [row[0] for row in cursor.fetchall()]
+    n_shards = sharding.shard_count(args.shards)
+    inputs = load_inputs(cursor)
+
+    # Openstaande batches van een eerdere write-behind run gaan altijd eerst
+    if args.write_behind:
+        queue = write_queue.WriteQueue(args.db)
+        queue.wait()
+    else:
+        write_queue.replay_pending(args.db)
+        queue = None
+
+    if args.rebuild:
+        # --- Volledige historie in vensters; de stand gaat via de opgeslagen rijen mee ---
+        if not args.date:
+            start_ts = rebuild.first_transaction_date(cursor) or start_ts
+        todo, n_windows = rebuild.pending_windows(conn, cursor, start_ts, end_ts, window_days)
+        print(f"Rebuild {start_ts.date()} t/m {end_ts.date()}: {len(todo)} vensters van {window_days} dagen.")
+        totals = {}
+        for i, (w_start, w_end) in enumerate(todo, start=n_windows - len(todo) + 1):
+            t = time.time()
+            n_inserted, n_updated, timings = run_window(
+                conn, cursor, args.db, asset_list, inputs, w_start, w_end, n_shards,
+                trading_days=args.trading_days, full_history=args.full_history, queue=queue
+            )
+            if queue is not None:
+                queue.submit('mark_window_done', start_ts, w_end)
+            else:
+                rebuild.mark_window_done(conn, cursor, start_ts, w_end)
+            for label, dt in timings:
+                totals[label] = totals.get(label, 0.0) + dt
+            rss = startup_profile.peak_rss_mb()
+            written = ("schrijven op de achtergrond" if queue is not None
+                       else f"{n_inserted} ingevoegd, {n_updated} bijgewerkt")
+            print(f"[{i}/{n_windows}] {w_start.date()} t/m {w_end.date()}: {written}, {time.time() - t:.1f}s"
+                  + (f", piek RSS {rss:.0f} MB" if rss is not None else ""))
+        timings = list(totals.items())
+    else:
+        n_inserted, n_updated, timings = run_window(
+            conn, cursor, args.db, asset_list, inputs, start_ts, end_ts, n_shards,
+            trading_days=args.trading_days, full_history=args.full_history, queue=queue
+        )
+        if queue is None:
+            print(f"per_dag_asset_result: {n_inserted} ingevoegd, {n_updated} bijgewerkt.")
+
+    if queue is not None:
+        t = time.time()
+        queue.close()
+        timings.append(('wachtrij leegschrijven', time.time() - t))
+
+    cursor.close()
+    conn.close()
+
+    for label, dt in timings:
+        print(f"  {label:<35} {dt:8.2f}s")
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 3-8 - gecombineerd)")
+    startup_profile.report('script 3-8')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
-import pyodbc
-import pandas as pd
 import argparse
 from datetime import datetime
 
+import stage_flags
+import startup_profile
+
 parser = argparse.ArgumentParser(description="Script that accepts a date")
 parser.add_argument('--date', type=str, help="Date in YYYY-MM-DD format")
 parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+parser.add_argument(stage_flags.TRADING_DAYS, action="store_true", help=stage_flags.TRADING_DAYS_HELP)
 args = parser.parse_args()
+
+with startup_profile.timed('import pyodbc/pandas/numpy'):
+    import pyodbc
+    import pandas as pd
+
+with startup_profile.timed('import pipeline modules'):
+    from diff_writer import write_changed_rows
+    from closed_options import build_closed_option_rows
+    from open_options import load_option_transactions
+    import trading_calendar
+
 if args.date:
     try:
         parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
@@ -34,96 +48,45 @@ asset_list = [row[0] for row in rows]
 #asset_list = {'INFINEON'}
 
 # Fetching transactions data
-cursor.execute("SELECT * FROM transacties_bron_data WHERE asset_type='optie'")
-rows = cursor.fetchall()
-columns = [column[0] for column in cursor.description]
-df_opties_alle_transacties_closed = pd.DataFrame.from_records(rows, columns=columns)
-
-updates_closed_opties = pd.DataFrame()
+df_opties_alle_transacties_closed = load_option_transactions(cursor, normalize=False)
 
 # Set the start date for the date range
-# start_date = pd.Timestamp('2024-01-01').date() # DATUM NIET WIJZIGEN, werkt snel genoeg zo, heeft fouten
-
+# (event-engine: ook een volledige historie herberekenen is goedkoop)
 start_date=parsed_date
-first_date_asset = df_opties_alle_transacties_closed['datum'].min()
+first_date_asset = start_date
 
 if not df_opties_alle_transacties_closed.empty and df_opties_alle_transacties_closed['datum'].notna().any():
     first_date_asset = df_opties_alle_transacties_closed['datum'].min().date()
     if pd.isna(first_date_asset):
         first_date_asset = start_date
-else:
-    first_date_asset = start_date
 
 start_date = max(start_date, first_date_asset)
-date_range = pd.date_range(start=start_date, end=pd.Timestamp('today'))
-
-for date in date_range:
-    date_only = date.date()
-
-    df_optie_open_transacties_till_date = df_opties_alle_transacties_closed[(df_opties_alle_transacties_closed['datum'] <= date)]
-    
-    df_grouped = df_optie_open_transacties_till_date.groupby(
-        'uniek_id', as_index=False
-    ).agg({
-        'broker': 'first',
-        'asset_rollup': 'first',
-        'optie_exp_date': 'first',
-        'optie_strike': 'first',
-        'optie_call_put': 'first',
-        'transactie_euro_totaal': 'sum',
-        'transactie_aantal': 'sum',
-        'transactie_fee': 'sum'
-    })
-
-    # Filter for closed options
-    df_grouped_open = df_grouped[df_grouped['transactie_aantal'] == 0].copy()
-
-    # Check if df_grouped_open is not empty before proceeding with aggregation
-    if not df_grouped_open.empty:
-        # Aggregate on asset_rollup and datum
-        df_grouped_open['datum'] = date_only  # Assign date_only to 'datum' column
-        df_grouped_open = df_grouped_open.groupby(['asset_rollup', 'datum'], as_index=False).agg({
-            'transactie_euro_totaal': 'sum',
-            'transactie_fee': 'sum'
-        })
-
-        # Concatenate DataFrame
-        updates_closed_opties = pd.concat([updates_closed_opties, df_grouped_open], ignore_index=True)
+
+# Sluitdag per contract één keer bepalen, daarna cumsum + forward-fill per asset
+days = trading_calendar.stage_days(cursor, start_date, pd.Timestamp('today'), args.trading_days)
+updates_closed_opties = build_closed_option_rows(
+    df_opties_alle_transacties_closed, start_date, pd.Timestamp('today'), days=days
+)
+if args.trading_days:
+    updates_closed_opties = trading_calendar.expand_to_calendar(
+        updates_closed_opties, ['asset_rollup'], days, pd.Timestamp('today')
+    )
 
 # Display the DataFrame of closed options
 print('updates_closed_opties dataframe klaar')
 
 
-# Step 1: Create a temporary table for updates
-cursor.execute("""
-    CREATE TABLE TempUpdates (
-        datum DATE,
-        asset_rollup TEXT(255),
-        hist_premie DOUBLE,
-        optie_closed_fee DOUBLE
+# Only write rows whose values actually changed
+df_updates = updates_closed_opties
+if not df_updates.empty:
+    write_changed_rows(
+        conn, cursor, 'per_dag_asset_result', df_updates,
+        key_cols=['datum', 'asset_rollup'],
+        value_cols=['hist_premie', 'optie_closed_fee'],
+        temp_table='TempUpdates',
+        start_date=start_date,
+        insert_missing=False
     )
-""")
-
-print('# Step 2: Insert aggregated data into the temporary table')
-for index, row in updates_closed_opties.iterrows():
-    cursor.execute("""
-        INSERT INTO TempUpdates (datum, asset_rollup, hist_premie, optie_closed_fee)
-        VALUES (?, ?, ?, ?)
-    """, (row['datum'], row['asset_rollup'], row['transactie_euro_totaal'], row['transactie_fee']))
-
-print('# Step 3: Perform the bulk update')
-update_query = """
-    UPDATE per_dag_asset_result
-    INNER JOIN TempUpdates ON per_dag_asset_result.datum = TempUpdates.datum AND per_dag_asset_result.asset_rollup = TempUpdates.asset_rollup
-    SET 
-        per_dag_asset_result.hist_premie = TempUpdates.hist_premie,
-        per_dag_asset_result.optie_closed_fee = TempUpdates.optie_closed_fee
-"""
-
-cursor.execute(update_query)
-
-# Step 4: Clean up by dropping the temporary table
-cursor.execute("DROP TABLE TempUpdates")
 
 # Commit the transaction
 conn.commit()
@@ -133,5 +96,6 @@ cursor.close()
 conn.close()
 
 print("Bulk update completed successfully.")
+startup_profile.report('script 6')
 
 
@@ -1,9 +1,10 @@
-import pyodbc
-import pandas as pd
-import time
 import argparse
+import time
 from datetime import datetime
 
+import stage_flags
+import startup_profile
+
 start_time = time.time()
 
 # ----------------------
@@ -12,8 +13,22 @@ start_time = time.time()
 parser = argparse.ArgumentParser(description="Script that accepts a date")
 parser.add_argument('--date', type=str, help="Date in YYYY-MM-DD format")
 parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+parser.add_argument("--full-history", action="store_true",
+                    help="Tel alle fees opnieuw op i.p.v. te starten vanaf de opgeslagen stand op datum - 1")
+parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+parser.add_argument(stage_flags.TRADING_DAYS, action="store_true", help=stage_flags.TRADING_DAYS_HELP)
 args = parser.parse_args()
 
+with startup_profile.timed('import pyodbc/pandas/numpy'):
+    import pyodbc
+    import pandas as pd
+
+with startup_profile.timed('import pipeline modules'):
+    from diff_writer import write_changed_rows
+    from dividends import dividend_rows
+    import trading_calendar
+
+
 if args.date:
     try:
         parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
@@ -44,50 +59,17 @@ try:
     # Data ophalen
     # ----------------------
     asset_list = pd.read_sql("SELECT DISTINCT asset_rollup FROM asset_rollup_data", conn)['asset_rollup'].tolist()
-    fees_dividend_list = pd.read_sql("SELECT * FROM fees_dividend", conn)
-
-    # ----------------------
-    # Filter alleen relevante fee types
-    # ----------------------
-    relevant_fees = ["dividend", "div_belasting", "871_fee", "transactiebelasting"]
-    fees_dividend_list = fees_dividend_list[fees_dividend_list['fee_type'].isin(relevant_fees)]
 
     # ----------------------
-    # Berekeningen in Pandas
+    # Berekeningen: opgeslagen stand op start_date - 1 + fees binnen het venster
     # ----------------------
     start_date = parsed_date
     end_date = pd.Timestamp('today').date()
-    date_range = pd.date_range(start=start_date, end=end_date)
-
-    update_data_list = []
-
-    for asset in asset_list:
-        if asset in fees_dividend_list['asset'].dropna().unique():
-            df_asset = fees_dividend_list[fees_dividend_list['asset'] == asset].copy()
-
-            # Aggregeer per datum
-            df_asset = df_asset.groupby('datum', as_index=False).agg({'amount':'sum'})
-            df_asset.sort_values('datum', inplace=True)
-
-            # Cumulatieve som maken
-            df_asset['cumsum'] = df_asset['amount'].cumsum()
-
-            # Reindex naar volledige datumbereik
-            df_asset = df_asset.set_index('datum').reindex(date_range, method='ffill').reset_index()
-            df_asset.rename(columns={'index':'datum','cumsum':'dividend'}, inplace=True)
-            df_asset['asset'] = asset
-
-            # Vul ontbrekende waarden met 0
-            df_asset['dividend'] = df_asset['dividend'].fillna(0)
-
-            update_data_list.append(df_asset[['datum','asset','dividend']])
-        else:
-            # Geen fees/dividend voor dit asset → altijd 0
-            df_empty = pd.DataFrame({'datum': date_range, 'asset': asset, 'dividend': 0})
-            update_data_list.append(df_empty)
-
-    update_data = pd.concat(update_data_list, ignore_index=True)
-    update_data.rename(columns={'asset':'asset_rollup','dividend':'fees_dividend_belasting'}, inplace=True)
+    days = trading_calendar.stage_days(cursor, start_date, end_date, args.trading_days)
+    update_data = dividend_rows(cursor, asset_list, start_date, end_date,
+                                full_history=args.full_history, days=days)
+    if args.trading_days:
+        update_data = trading_calendar.expand_to_calendar(update_data, ['asset_rollup'], days, end_date)
 
     elapsed_time = time.time() - start_time
     print(f"Build update_data: {elapsed_time:.2f} seconds")
@@ -95,32 +77,14 @@ try:
     # ----------------------
     # Schrijven naar DB
     # ----------------------
-    try:
-        cursor.execute("DROP TABLE TempUpdates")
-    except Exception:
-        pass
-
-    cursor.execute("""
-        CREATE TABLE TempUpdates (
-            datum DATE,
-            asset_rollup TEXT(255),
-            fees_dividend_belasting DOUBLE
-        )
-    """)
-
-    cursor.executemany("""
-        INSERT INTO TempUpdates (datum, asset_rollup, fees_dividend_belasting)
-        VALUES (?, ?, ?)
-    """, update_data[['datum','asset_rollup','fees_dividend_belasting']].values.tolist())
-
-    update_query = """
-        UPDATE per_dag_asset_result
-        INNER JOIN TempUpdates ON per_dag_asset_result.datum = TempUpdates.datum
-                              AND per_dag_asset_result.asset_rollup = TempUpdates.asset_rollup
-        SET per_dag_asset_result.fees_dividend_belasting = TempUpdates.fees_dividend_belasting
-    """
-    cursor.execute(update_query)
-    cursor.execute("DROP TABLE TempUpdates")
+    write_changed_rows(
+        conn, cursor, 'per_dag_asset_result', update_data,
+        key_cols=['datum', 'asset_rollup'],
+        value_cols=['fees_dividend_belasting'],
+        temp_table='TempUpdates',
+        start_date=start_date,
+        insert_missing=False
+    )
 
     conn.commit()
     print("✅ Bulk update completed successfully.")
@@ -138,3 +102,4 @@ finally:
 
 end_time = time.time()
 print(f"Time taken: {end_time - start_time:.2f} seconds")
+startup_profile.report('script 8')
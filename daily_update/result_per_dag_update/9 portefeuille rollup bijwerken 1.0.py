@@ -0,0 +1,52 @@
+import argparse
+import time
+from datetime import datetime
+
+import startup_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Werkt de portefeuille-totalen per dag bij vanaf --date")
+    parser.add_argument('--date', type=str, help="Date in YYYY-MM-DD format")
+    parser.add_argument("--db", type=str, required=True, help="Pad naar Access database")
+    parser.add_argument("--per-sector", action="store_true", help="Ook per_dag_sector_result bijwerken")
+    parser.add_argument(startup_profile.FLAG, action="store_true", help="Print import/compile tijden van deze stage")
+    args = parser.parse_args()
+
+    with startup_profile.timed('import pyodbc/pandas'):
+        import pyodbc
+        import pandas as pd
+
+    with startup_profile.timed('import pipeline modules'):
+        from portfolio_rollup import refresh_rollups
+
+    if args.date:
+        try:
+            parsed_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+            print(f"Parsed Date: {parsed_date}")
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD.")
+            exit(1)
+    else:
+        parsed_date = (pd.Timestamp('today') - pd.Timedelta(days=50)).date()
+        print(f"No date provided. Using default date: {parsed_date}")
+
+    t0 = time.time()
+
+    conn_str = (
+        r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};'
+        f'DBQ={args.db}'
+    )
+    conn = pyodbc.connect(conn_str)
+    cursor = conn.cursor()
+
+    refresh_rollups(conn, cursor, pd.Timestamp(parsed_date), per_sector=args.per_sector)
+
+    cursor.close()
+    conn.close()
+    print(f"Time taken: {time.time() - t0:.2f} seconds (script 9 - portefeuille rollup)")
+    startup_profile.report('script 9')
+
+
+if __name__ == "__main__":
+    main()
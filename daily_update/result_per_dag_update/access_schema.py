@@ -0,0 +1,21 @@
+"""
+Kleine schema-helpers voor de Access database.
+"""
+
+
+def ensure_columns(conn, cursor, table, columns):
+    """
+    Voegt ontbrekende kolommen toe aan `table`.
+    columns: dict {kolomnaam: Access type}, bijv. {'optie_delta': 'DOUBLE'}
+    """
+    existing = {row.column_name.lower() for row in cursor.columns(table=table)}
+    for name, col_type in columns.items():
+        if name.lower() in existing:
+            continue
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+            conn.commit()
+            print(f"Kolom {name} toegevoegd aan {table}.")
+        except Exception as e:
+            conn.rollback()
+            print(f"Kon kolom {name} niet toevoegen aan {table}: {e}")
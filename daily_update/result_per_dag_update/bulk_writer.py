@@ -0,0 +1,89 @@
+"""
+Gedeelde bulk writer voor Access (temp tabellen, inserts, deletes per sleutel).
+
+- Zet een DataFrame één keer kolomsgewijs om naar getypeerde parameter-rijen
+  (Python float/int/str/datetime, NaN/NaT -> None), nooit per rij via iterrows.
+- Schrijft in chunks van CHUNK_SIZE met executemany; fast_executemany
+  (parameter arrays) wordt gebruikt als de driver het ondersteunt. Meldt de
+  driver SQLSTATE HYC00 (optionele functie niet geïmplementeerd), dan wordt de
+  transactie van deze aanroep teruggedraaid en gaan alle rijen opnieuw met
+  gewone executemany. Andere fouten worden niet opgevangen.
+- Openstaand werk van de aanroeper wordt vóór het schrijven gecommit, zodat
+  een rollback alleen de chunks van deze aanroep ongedaan maakt.
+- De fast_executemany-stand van de cursor van de aanroeper wordt hersteld.
+- Rapporteert rijen/sec per aanroep.
+"""
+import time
+
+import pandas as pd
+import pyodbc
+
+CHUNK_SIZE = 5000
+# SQLSTATE: optional feature not implemented (geen parameter arrays)
+FEATURE_NOT_IMPLEMENTED = 'HYC00'
+
+
+def _column_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.to_pydatetime()
+        return [None if pd.isna(v) else v for v in values]
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _sqlstate(error):
+    return error.args[0] if error.args else None
+
+
+def to_param_rows(df, columns):
+    """DataFrame -> lijst van tuples met Python-typen, kolomsgewijs omgezet."""
+    return list(zip(*(_column_values(df[c]) for c in columns)))
+
+
+def bulk_execute(conn, cursor, sql, df, columns, label=None, chunk_size=CHUNK_SIZE):
+    """Voert `sql` uit voor elke rij van df[columns] in chunks. Geeft het aantal rijen terug."""
+    if df.empty:
+        return 0
+
+    t0 = time.time()
+    params = to_param_rows(df, columns)
+
+    def send(fast):
+        cursor.fast_executemany = fast
+        for start in range(0, len(params), chunk_size):
+            cursor.executemany(sql, params[start:start + chunk_size])
+
+    previous = cursor.fast_executemany
+    conn.commit()
+    try:
+        try:
+            send(True)
+        except pyodbc.Error as e:
+            # Access ODBC driver ondersteunt parameter arrays niet overal
+            if _sqlstate(e) != FEATURE_NOT_IMPLEMENTED:
+                raise
+            print(f"fast_executemany niet ondersteund ({e}); opnieuw met gewone executemany.")
+            conn.rollback()
+            send(False)
+    finally:
+        cursor.fast_executemany = previous
+    conn.commit()
+
+    dt = time.time() - t0
+    print(f"{label or sql.split('(')[0].strip()}: {len(params)} rijen in {dt:.2f}s "
+          f"({len(params) / dt if dt > 0 else float('inf'):.0f} rijen/s)")
+    return len(params)
+
+
+def bulk_insert(conn, cursor, table, df, columns=None, chunk_size=CHUNK_SIZE):
+    """INSERT van df[columns] in `table`."""
+    columns = list(columns if columns is not None else df.columns)
+    placeholders = ', '.join(['?'] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    return bulk_execute(conn, cursor, sql, df, columns, label=f"INSERT {table}", chunk_size=chunk_size)
+
+
+def bulk_delete(conn, cursor, table, df_keys, key_cols, chunk_size=CHUNK_SIZE):
+    """DELETE per sleutel voor elke rij van df_keys[key_cols]."""
+    where = " AND ".join(f"[{k}] = ?" for k in key_cols)
+    sql = f"DELETE FROM {table} WHERE {where}"
+    return bulk_execute(conn, cursor, sql, df_keys, list(key_cols), label=f"DELETE {table}", chunk_size=chunk_size)
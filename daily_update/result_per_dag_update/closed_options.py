@@ -0,0 +1,75 @@
+"""
+Event-engine voor gesloten opties (stage 6).
+
+Een contract (uniek_id) telt op dag d als gesloten wanneer de som van
+transactie_aantal over alle transacties met datum <= d nul is; het draagt dan
+zijn cumulatieve transactie_euro_totaal/transactie_fee bij aan hist_premie/
+optie_closed_fee van zijn asset_rollup.
+
+Die bijdrage is per contract een stapfunctie die alleen op transactiedagen
+verandert. Per contract worden de sprongen één keer bepaald en met
+step_functions.spread_steps per asset_rollup over het datumbereik uitgezet.
+Kosten: O(transacties + assets x dagen) in plaats van O(dagen x transacties).
+"""
+import numpy as np
+import pandas as pd
+
+from step_functions import transaction_day, contract_deltas, spread_steps
+
+SUM_COLS = ['transactie_euro_totaal', 'transactie_aantal', 'transactie_fee']
+RESULT_COLUMNS = {
+    'transactie_euro_totaal': 'hist_premie',
+    'transactie_fee': 'optie_closed_fee',
+}
+_VALUE_COLS = list(RESULT_COLUMNS) + ['n_closed']
+
+
+def build_closed_option_rows(df_tx, start_ts, end_ts, days=None):
+    """
+    Geeft per (asset_rollup, datum) in [start_ts, end_ts] de som van premie en
+    fee over de op die dag gesloten contracten, alleen voor dagen met minstens
+    één gesloten contract (zoals de oude per-datum loop). days: optioneel grid
+    (bijv. handelsdagen) i.p.v. alle kalenderdagen.
+    Kolommen: asset_rollup, datum, hist_premie, optie_closed_fee.
+    """
+    out_cols = ['asset_rollup', 'datum'] + list(RESULT_COLUMNS.values())
+    start_ts = pd.Timestamp(start_ts).normalize()
+    end_ts = pd.Timestamp(end_ts).normalize()
+
+    tx = df_tx.dropna(subset=['uniek_id', 'datum']).copy()
+    if tx.empty or start_ts > end_ts:
+        return pd.DataFrame(columns=out_cols)
+
+    tx['dag'] = transaction_day(tx['datum'])
+    for col in SUM_COLS:
+        tx[col] = tx[col].astype(float).fillna(0.0)
+
+    asset_per_contract = tx.groupby('uniek_id', sort=False, observed=True)['asset_rollup'].first()
+
+    # Lopende stand per contract op elke transactiedag
+    per_day = tx.groupby(['uniek_id', 'dag'], as_index=False, sort=True, observed=True)[SUM_COLS].sum()
+    per_day[SUM_COLS] = per_day.groupby('uniek_id', observed=True)[SUM_COLS].cumsum()
+
+    # Bijdrage van het contract: (euro, fee, 1) als gesloten, anders 0
+    closed = per_day['transactie_aantal'].round(9) == 0
+    contrib = pd.DataFrame({
+        'transactie_euro_totaal': np.where(closed, per_day['transactie_euro_totaal'], 0.0),
+        'transactie_fee': np.where(closed, per_day['transactie_fee'], 0.0),
+        'n_closed': closed.astype(np.int64),
+    })
+
+    # Sprongen van de stapfunctie per contract
+    deltas = contract_deltas(contrib, per_day['uniek_id']).assign(
+        asset_rollup=per_day['uniek_id'].map(asset_per_contract).to_numpy(),
+        dag=per_day['dag'].to_numpy(),
+    ).dropna(subset=['asset_rollup'])
+    if deltas.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    # Per asset: cumulatieve stand op elke dag van het bereik
+    if days is None:
+        days = pd.date_range(start_ts, end_ts, freq='D')
+    out = spread_steps(deltas, 'asset_rollup', _VALUE_COLS, days)
+    out = out[out['n_closed'] > 0].drop(columns='n_closed')
+    out[list(RESULT_COLUMNS)] = out[list(RESULT_COLUMNS)].round(9)
+    return out.rename(columns=RESULT_COLUMNS)[out_cols].reset_index(drop=True)
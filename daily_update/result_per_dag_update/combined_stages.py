@@ -0,0 +1,129 @@
+"""
+Stages 3, 4, 6, 7 en 8 als één functie: alle kolomgroepen van
+per_dag_asset_result voor een venster in het geheugen, daarna één diff-upsert.
+
+Gebruikt door het gecombineerde script (3-8) en door de pipeline service,
+die de invoer (load_inputs) warm houdt tussen runs.
+"""
+import time
+
+import pandas as pd
+
+from closed_options import build_closed_option_rows
+from diff_writer import write_column_groups
+from dividends import dividend_rows, RESULT_COL as DIVIDEND_COL
+from open_options import (
+    load_option_transactions, value_open_option_rows, expand_open_option_rows,
+    write_open_option_table, aggregate_open_options, OPEN_RESULT_COLUMNS
+)
+from sprinters import sprinter_rows, RESULT_COLS as SPRINTER_COLS
+from stocks import build_stock_rows, load_stock_transactions, STOCK_RESULT_COLS
+from typed_load import read_frame
+import sharding
+import trading_calendar
+
+RESULT_TABLE = 'per_dag_asset_result'
+KEY_COLS = ['datum', 'asset_rollup']
+
+
+def load_inputs(cursor):
+    """Transacties en referentiedata die per venster gelijk blijven: één keer laden."""
+    df_opties = load_option_transactions(cursor, normalize=False)
+    return {
+        'aandelen': load_stock_transactions(cursor),
+        'opties': df_opties,
+        'opties_dag': df_opties.assign(datum=pd.to_datetime(df_opties['datum']).dt.normalize()),
+        'sprinter_list': read_frame(cursor, "SELECT * FROM sprinters_referentie_data"),
+        'sprinters': read_frame(cursor, "SELECT * FROM transacties_bron_data WHERE asset_type='sprinter'"),
+    }
+
+
+def run_window(conn, cursor, db_path, asset_list, inputs, start_ts, end_ts,
+               n_shards=0, trading_days=False, full_history=False, queue=None):
+    """
+    Berekent alle kolomgroepen van per_dag_asset_result voor [start_ts, end_ts]
+    en schrijft ze in één diff-upsert. Geeft (ingevoegd, bijgewerkt, timings).
+    queue: optionele write_queue.WriteQueue; de writes gaan dan op de achtergrond
+    en ingevoegd/bijgewerkt zijn None (de writer print ze zelf).
+    """
+    date_range = trading_calendar.stage_days(cursor, start_ts, end_ts, trading_days)
+
+    def on_calendar(df):
+        # handelsdag-grid: pas bij het schrijven aanvullen tot alle kalenderdagen
+        if not trading_days:
+            return df
+        return trading_calendar.expand_to_calendar(df, ['asset_rollup'], date_range, end_ts)
+
+    def sharded(func, asset_type, frames=None, **kwargs):
+        # per asset-shard in een process pool (n_shards <= 1: gewoon in dit proces)
+        weights = sharding.transaction_weights(cursor, asset_type) if n_shards > 1 else None
+        return sharding.run_sharded(func, db_path, asset_list, n_shards, weights=weights,
+                                    frames=frames, cursor=cursor, **kwargs)
+
+    timings = []
+
+    # Eerst de stages die geen opgeslagen resultaten lezen: met een write-behind
+    # queue lopen ze parallel aan het schrijven van het vorige venster
+
+    # --- 4: open opties; per_dag_open_opties_opgerold blijft een eigen tabel ---
+    t = time.time()
+    df_open = sharded(value_open_option_rows, 'optie', frames={'df_tx': inputs['opties_dag']},
+                      start_ts=start_ts, end_ts=end_ts, days=date_range)
+    if trading_days:
+        df_open = expand_open_option_rows(df_open, date_range, end_ts)
+    if queue is not None:
+        queue.submit('write_open_option_table', df_open, start_ts, end_ts)
+    else:
+        write_open_option_table(conn, cursor, df_open, start_ts, end_ts)
+    open_group = (aggregate_open_options(df_open), list(OPEN_RESULT_COLUMNS.values()), False)
+    timings.append(('opties open', time.time() - t))
+
+    # --- 6: gesloten opties ---
+    t = time.time()
+    df_closed = sharded(build_closed_option_rows, 'optie', frames={'df_tx': inputs['opties']},
+                        start_ts=start_ts, end_ts=end_ts, days=date_range)
+    closed_group = (on_calendar(df_closed), ['hist_premie', 'optie_closed_fee'], False)
+    timings.append(('opties closed', time.time() - t))
+
+    # --- 7: sprinters ---
+    t = time.time()
+    df_sprinters = sharded(sprinter_rows, 'sprinter',
+                           frames={'df_tx': inputs['sprinters'], 'sprinter_list': inputs['sprinter_list']},
+                           days=date_range)
+    sprinter_group = (on_calendar(df_sprinters), SPRINTER_COLS, False)
+    timings.append(('sprinters', time.time() - t))
+
+    # Aandelen en dividend starten vanaf de opgeslagen stand op start_ts - 1
+    if queue is not None:
+        t = time.time()
+        queue.wait()
+        timings.append(('wachten op write-behind', time.time() - t))
+
+    # --- 3: aandelen (levert alle asset x dag sleutels, mag invoegen) ---
+    t = time.time()
+    df_stocks = sharded(build_stock_rows, 'aandeel', frames={'df_tx': inputs['aandelen']},
+                        start_ts=start_ts, end_ts=end_ts, days=date_range)
+    stock_group = (on_calendar(df_stocks), STOCK_RESULT_COLS, True)
+    timings.append(('aandelen', time.time() - t))
+
+    # --- 8: dividend/fees ---
+    t = time.time()
+    dividend_group = (on_calendar(dividend_rows(cursor, asset_list, start_ts, end_ts,
+                                                full_history=full_history, days=date_range)),
+                      [DIVIDEND_COL], False)
+    timings.append(('dividend', time.time() - t))
+
+    # (df, value_cols, insert_missing) per stage
+    groups = [stock_group, open_group, closed_group, sprinter_group, dividend_group]
+    write_kwargs = dict(key_cols=KEY_COLS, temp_table=f'Temp{RESULT_TABLE}',
+                        start_date=start_ts, end_date=end_ts)
+
+    # --- Eén brede upsert: elke rij hooguit één keer bijgewerkt ---
+    t = time.time()
+    if queue is not None:
+        queue.submit('write_column_groups', RESULT_TABLE, groups, **write_kwargs)
+        timings.append((f'wachtrij {RESULT_TABLE}', time.time() - t))
+        return None, None, timings
+    n_inserted, n_updated, _ = write_column_groups(conn, cursor, RESULT_TABLE, groups, **write_kwargs)
+    timings.append((f'schrijven {RESULT_TABLE}', time.time() - t))
+    return n_inserted, n_updated, timings
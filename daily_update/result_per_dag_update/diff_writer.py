@@ -0,0 +1,213 @@
+"""
+Diff-aware schrijven naar Access tabellen met een (datum, sleutel) primaire sleutel.
+
+In plaats van elke rij in het venster opnieuw te schrijven:
+  1) bestaande doelrijen voor het venster één keer lezen
+  2) gevectoriseerd vergelijken met de nieuwe waarden (float-tolerantie)
+  3) alleen nieuwe of gewijzigde rijen wegschrijven
+"""
+import numpy as np
+import pandas as pd
+
+from bulk_writer import bulk_insert, bulk_delete
+
+# Verschillen kleiner dan dit gelden als "gelijk" (afrondingsruis van DOUBLE)
+FLOAT_ATOL = 1e-6
+
+
+def _normalize_keys(df, key_cols, date_col):
+    df = df.copy()
+    for col in key_cols:
+        if col == date_col:
+            df[col] = pd.to_datetime(df[col]).dt.normalize()
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(float)
+        else:
+            df[col] = df[col].astype(str)
+    return df
+
+
+def _access_type(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "DATE"
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return "DOUBLE"
+    return "TEXT(255)"
+
+
+def read_existing(cursor, table, key_cols, value_cols, start_date, end_date=None, date_col='datum'):
+    """Leest sleutel- en waardekolommen van `table` voor het venster in één query."""
+    cols = list(key_cols) + [c for c in value_cols if c not in key_cols]
+    query = f"SELECT {', '.join(f'[{c}]' for c in cols)} FROM {table} WHERE [{date_col}] >= ?"
+    params = [pd.Timestamp(start_date).to_pydatetime()]
+    if end_date is not None:
+        query += f" AND [{date_col}] <= ?"
+        params.append(pd.Timestamp(end_date).to_pydatetime())
+
+    cursor.execute(query, *params)
+    rows = cursor.fetchall()
+    df_old = pd.DataFrame.from_records([tuple(r) for r in rows], columns=cols)
+    return _normalize_keys(df_old, key_cols, date_col)
+
+
+def diff_rows(df_new, df_old, key_cols, value_cols, atol=FLOAT_ATOL, date_col='datum'):
+    """
+    Vergelijkt nieuwe rijen met bestaande rijen op `key_cols`.
+    Geeft (df_insert, df_changed, df_vanished) terug:
+      - df_insert:   sleutel bestaat nog niet in df_old
+      - df_changed:  sleutel bestaat, minstens één waardekolom wijkt af
+      - df_vanished: sleutel bestaat alleen in df_old (alleen sleutelkolommen)
+    NULL/NaN aan beide kanten geldt als gelijk.
+    """
+    df_new = _normalize_keys(df_new, key_cols, date_col)
+    df_old = _normalize_keys(df_old, key_cols, date_col)
+    df_old = df_old.drop_duplicates(subset=list(key_cols), keep='last')
+
+    merged = df_new.merge(
+        df_old[list(key_cols) + list(value_cols)],
+        on=list(key_cols), how='left', suffixes=('', '__old'), indicator=True
+    )
+    is_new = (merged['_merge'] == 'left_only').to_numpy()
+
+    changed = np.zeros(len(merged), dtype=bool)
+    for col in value_cols:
+        new_vals = merged[col]
+        old_vals = merged[f"{col}__old"]
+        new_na = new_vals.isna().to_numpy()
+        old_na = old_vals.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(new_vals):
+            a = pd.to_numeric(new_vals, errors='coerce').to_numpy(dtype=np.float64)
+            b = pd.to_numeric(old_vals, errors='coerce').to_numpy(dtype=np.float64)
+            with np.errstate(invalid='ignore'):
+                equal = np.isclose(a, b, rtol=0.0, atol=atol)
+        else:
+            equal = (new_vals.astype(str) == old_vals.astype(str)).to_numpy()
+        equal = np.where(new_na | old_na, new_na & old_na, equal)
+        changed |= ~equal
+
+    df_insert = df_new.loc[is_new].reset_index(drop=True)
+    df_changed = df_new.loc[~is_new & changed].reset_index(drop=True)
+
+    vanished_mask = ~df_old.set_index(list(key_cols)).index.isin(
+        df_new.set_index(list(key_cols)).index
+    )
+    df_vanished = df_old.loc[vanished_mask, list(key_cols)].reset_index(drop=True)
+    return df_insert, df_changed, df_vanished
+
+
+def write_changed_rows(conn, cursor, table, df_new, key_cols, value_cols,
+                       temp_table, start_date, end_date=None,
+                       insert_missing=True, delete_vanished=False,
+                       atol=FLOAT_ATOL, date_col='datum', df_old=None):
+    """
+    Schrijft alleen nieuwe/gewijzigde rijen van df_new naar `table`.
+      - gewijzigde rijen: via `temp_table` + één UPDATE ... INNER JOIN
+      - nieuwe rijen:     direct INSERT (alleen als insert_missing=True;
+                          anders worden ze overgeslagen, zoals een INNER JOIN update)
+      - verdwenen rijen:  DELETE per sleutel (alleen als delete_vanished=True;
+                          df_new moet dan het hele venster beschrijven)
+    df_old: bestaande rijen als die al gelezen zijn (anders read_existing).
+    Geeft (n_inserted, n_updated, n_deleted) terug.
+    """
+    key_cols = list(key_cols)
+    value_cols = list(value_cols)
+    all_cols = key_cols + value_cols
+
+    if df_old is None:
+        df_old = read_existing(cursor, table, key_cols, value_cols, start_date, end_date, date_col)
+    df_insert, df_changed, df_vanished = diff_rows(
+        df_new[all_cols], df_old, key_cols, value_cols, atol, date_col
+    )
+
+    print(f"{table}: {len(df_new)} rijen berekend, {len(df_changed)} gewijzigd, "
+          f"{len(df_insert)} nieuw{'' if insert_missing else ' (overgeslagen)'}"
+          f"{f', {len(df_vanished)} verdwenen' if delete_vanished else ''}")
+
+    n_updated = 0
+    if not df_changed.empty:
+        try:
+            cursor.execute(f"DROP TABLE {temp_table}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+
+        col_defs = ",\n".join(f"{c} {_access_type(df_changed[c])}" for c in all_cols)
+        cursor.execute(f"CREATE TABLE {temp_table} (\n{col_defs}\n)")
+        conn.commit()
+
+        bulk_insert(conn, cursor, temp_table, df_changed, all_cols)
+
+        on_clause = " AND ".join(f"{table}.{k} = {temp_table}.{k}" for k in key_cols)
+        set_clause = ",\n            ".join(f"{table}.{c} = {temp_table}.{c}" for c in value_cols)
+        cursor.execute(f"""
+            UPDATE {table}
+            INNER JOIN {temp_table}
+            ON {on_clause}
+            SET {set_clause}
+        """)
+        conn.commit()
+
+        cursor.execute(f"DROP TABLE {temp_table}")
+        conn.commit()
+        n_updated = len(df_changed)
+
+    n_inserted = 0
+    if insert_missing and not df_insert.empty:
+        n_inserted = bulk_insert(conn, cursor, table, df_insert, all_cols)
+
+    n_deleted = 0
+    if delete_vanished and not df_vanished.empty:
+        n_deleted = bulk_delete(conn, cursor, table, df_vanished, key_cols)
+
+    return n_inserted, n_updated, n_deleted
+
+
+def write_column_groups(conn, cursor, table, groups, key_cols, temp_table,
+                        start_date, end_date=None, atol=FLOAT_ATOL, date_col='datum'):
+    """
+    Voegt meerdere kolomgroepen (elk met eigen sleutelset) samen tot één breed
+    frame en schrijft dat met één write_changed_rows: elke rij wordt hooguit
+    één keer bijgewerkt in plaats van één UPDATE ... INNER JOIN per groep.
+
+    groups: lijst van (df, value_cols, insert_missing). Voor een sleutel die een
+    groep niet levert blijven de opgeslagen waarden van die kolommen staan
+    (zoals bij een losse INNER JOIN update). Nieuwe sleutels worden alleen
+    ingevoegd als een groep met insert_missing=True ze levert.
+    """
+    key_cols = list(key_cols)
+    value_cols = [c for _, cols, _ in groups for c in cols]
+    if len(set(value_cols)) != len(value_cols):
+        raise ValueError("Kolomgroepen overlappen: elke kolom mag maar in één groep staan.")
+
+    df_old = read_existing(cursor, table, key_cols, value_cols, start_date, end_date, date_col)
+    old = df_old.drop_duplicates(subset=key_cols, keep='last').set_index(key_cols)
+
+    indexed = []
+    for df, cols, insert_missing in groups:
+        df = _normalize_keys(df[key_cols + list(cols)], key_cols, date_col)
+        indexed.append((df.drop_duplicates(subset=key_cols, keep='last').set_index(key_cols),
+                        list(cols), insert_missing))
+
+    index = old.index[:0]
+    for df, _, _ in indexed:
+        index = index.union(df.index)
+
+    # Sleutels die (nog) niet bestaan alleen als een insert-groep ze levert
+    insertable = index.isin(old.index)
+    for df, _, insert_missing in indexed:
+        if insert_missing:
+            insertable |= index.isin(df.index)
+    index = index[insertable]
+
+    wide = pd.DataFrame(index=index)
+    for df, cols, _ in indexed:
+        values = df[cols].reindex(index)
+        missing = ~index.isin(df.index)
+        values.loc[missing] = old[cols].reindex(index[missing]).to_numpy()
+        wide[cols] = values
+
+    print(f"{table}: {len(groups)} kolomgroepen samengevoegd tot {len(wide)} rijen x {len(value_cols)} kolommen")
+    return write_changed_rows(
+        conn, cursor, table, wide.reset_index(), key_cols, value_cols, temp_table,
+        start_date, end_date, insert_missing=True, atol=atol, date_col=date_col, df_old=df_old
+    )
@@ -0,0 +1,99 @@
+"""
+Cumulatieve dividend/fees per asset (stage 8): fees_dividend_belasting.
+
+fees_dividend_belasting op dag d = som van amount (relevante fee types) met
+datum <= d. In plaats van elke run de hele historie op te tellen wordt
+gestart vanaf de opgeslagen stand op start_date - 1 in per_dag_asset_result;
+alleen assets zonder opgeslagen stand krijgen de som van hun historie tot
+die dag uit één GROUP BY query. Daarna alleen de fees binnen het venster:
+één gegroepeerde cumsum + forward-fill naar het asset x dag grid.
+"""
+import numpy as np
+import pandas as pd
+
+from step_functions import transaction_day, spread_steps
+from typed_load import read_frame
+
+FEES_TABLE = "fees_dividend"
+RESULT_TABLE = "per_dag_asset_result"
+RESULT_COL = "fees_dividend_belasting"
+RELEVANT_FEES = ["dividend", "div_belasting", "871_fee", "transactiebelasting"]
+
+
+def _fee_type_filter():
+    return f"fee_type IN ({', '.join(['?'] * len(RELEVANT_FEES))})"
+
+
+def read_baseline(cursor, cutoff):
+    """Opgeslagen fees_dividend_belasting per asset_rollup op dag `cutoff` (NULL -> NaN)."""
+    cursor.execute(
+        f"SELECT asset_rollup, {RESULT_COL} FROM {RESULT_TABLE} WHERE datum = ?",
+        pd.Timestamp(cutoff).to_pydatetime()
+    )
+    rows = cursor.fetchall()
+    return pd.Series({r[0]: (np.nan if r[1] is None else float(r[1])) for r in rows}, dtype=float)
+
+
+def sum_fees_until(cursor, cutoff):
+    """Som van amount per asset over alle fees met datum <= cutoff (middernacht)."""
+    cursor.execute(
+        f"SELECT asset, SUM(amount) FROM {FEES_TABLE} WHERE {_fee_type_filter()} AND datum <= ? GROUP BY asset",
+        *RELEVANT_FEES, pd.Timestamp(cutoff).to_pydatetime()
+    )
+    rows = cursor.fetchall()
+    return pd.Series({r[0]: (0.0 if r[1] is None else float(r[1])) for r in rows}, dtype=float)
+
+
+def load_fees(cursor, after=None):
+    """Relevante fees (asset, datum, amount), optioneel alleen met datum > after."""
+    query = f"SELECT asset, datum, amount FROM {FEES_TABLE} WHERE {_fee_type_filter()}"
+    params = list(RELEVANT_FEES)
+    if after is not None:
+        query += " AND datum > ?"
+        params.append(pd.Timestamp(after).to_pydatetime())
+    return read_frame(cursor, query, *params)
+
+
+def build_dividend_rows(df_fees, asset_list, days, baseline=None):
+    """
+    Per asset_rollup x dag: baseline (stand vóór het venster, standaard 0) plus
+    de cumulatieve som van df_fees tot en met die dag.
+    Kolommen: datum, asset_rollup, fees_dividend_belasting.
+    """
+    days = pd.DatetimeIndex(days)
+    fees = df_fees.dropna(subset=['asset', 'datum'])
+    fees = fees[fees['asset'].isin(asset_list)]
+    deltas = pd.DataFrame({
+        'asset_rollup': fees['asset'].to_numpy(),
+        'dag': transaction_day(fees['datum']).to_numpy(),
+        RESULT_COL: fees['amount'].astype(float).fillna(0.0).to_numpy(),
+    })
+    out = spread_steps(deltas, 'asset_rollup', [RESULT_COL], days, keys=asset_list)
+    if baseline is not None:
+        out[RESULT_COL] += out['asset_rollup'].map(baseline).fillna(0.0).to_numpy()
+    out[RESULT_COL] = out[RESULT_COL].round(9)
+    return out[['datum', 'asset_rollup', RESULT_COL]]
+
+
+def dividend_rows(cursor, asset_list, start_date, end_date, full_history=False, days=None):
+    """
+    Berekent fees_dividend_belasting voor [start_date, end_date] (of op het
+    grid `days`). Met full_history=True (of zonder opgeslagen stand) wordt de
+    historie opnieuw opgeteld.
+    """
+    if days is None:
+        days = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize())
+    days = pd.DatetimeIndex(days)
+    cutoff = days[0] - pd.Timedelta(days=1)
+
+    if full_history:
+        return build_dividend_rows(load_fees(cursor), asset_list, days)
+
+    baseline = read_baseline(cursor, cutoff).reindex(asset_list)
+    missing = baseline.index[baseline.isna()]
+    if len(missing):
+        print(f"Geen opgeslagen {RESULT_COL} op {cutoff.date()} voor {len(missing)} assets; "
+              f"historie tot die dag wordt opgeteld.")
+        baseline.loc[missing] = sum_fees_until(cursor, cutoff).reindex(missing).fillna(0.0).to_numpy()
+
+    return build_dividend_rows(load_fees(cursor, after=cutoff), asset_list, days, baseline)
@@ -0,0 +1,191 @@
+"""
+Lokale kolomgewijze opslag voor intraday bars (5 min / 1 uur) en de
+afgeleide dagbars.
+
+Intraday bars zijn 50-100x zoveel rijen als dagbars; ze gaan niet naar Access
+maar naar Parquet, gepartitioneerd per barmaat en maand:
+
+    <root>/intraday_bars/bar=5min/year=YYYY/month=MM/part-*.parquet
+
+<root> is standaard lokaal (default_root, zelfde map als parquet_store), nooit
+naast de database op OneDrive: de store krijgt per IB-verzoek een nieuw
+part-bestand en compact() herschrijft maanden.
+
+append_bars schrijft elke binnengekomen batch (bijv. één IB-verzoek) als een
+nieuw part-bestand, zonder bestaande bestanden te lezen. compact() voegt de
+parts van een maand samen tot part-0 (laatst geschreven bar wint bij dubbele
+(symbol, datetime)). daily_bars() leidt er in één gevectoriseerde groupby
+dag-OHLC, volume en VWAP uit af, in het formaat van de dagbars van stage 1A;
+alleen die gaan via temp_stock_prices_temp naar historical_data_correct.
+
+pyarrow is optioneel (zoals bij parquet_store): zonder pyarrow is er geen
+intraday modus.
+"""
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optioneel
+    pa = pq = None
+
+from parquet_store import default_root as _parquet_root
+
+DATASET = 'intraday_bars'
+# CLI-waarde -> barSize van reqHistoricalData
+BAR_SIZES = {'5min': '5 mins', '1hour': '1 hour'}
+BAR_COLUMNS = ['datetime', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
+VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'wap']
+COMPACT_FILE = 'part-0.parquet'
+
+
+def pyarrow_available():
+    return pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is nodig voor de intraday store (pip install pyarrow)")
+
+
+def _schema():
+    return pa.schema([
+        ('datetime', pa.timestamp('us')), ('symbol', pa.string()), ('asset_rollup', pa.string()),
+    ] + [(c, pa.float64()) for c in VALUE_COLUMNS])
+
+
+def parse_bar_times(values):
+    """IB bar-tijden ('YYYYMMDD HH:MM:SS', evt. met dubbele spatie of tijdzone) -> datetime64."""
+    s = pd.Series(values, dtype=object).astype(str).str.split().str[:2].str.join(' ')
+    return pd.to_datetime(s, format='%Y%m%d %H:%M:%S', errors='coerce')
+
+
+def default_root(db_path):
+    """Lokale root per database; PER_DAG_INTRADAY_DIR gaat voor de map van parquet_store."""
+    override = os.environ.get('PER_DAG_INTRADAY_DIR')
+    if override:
+        return Path(override) / Path(_parquet_root(db_path)).name
+    return _parquet_root(db_path)
+
+
+def _partition_dir(root, bar, year, month):
+    return Path(root) / DATASET / f"bar={bar}" / f"year={year:04d}" / f"month={month:02d}"
+
+
+def _write(df, path, name):
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / (name + '.tmp')
+    pq.write_table(pa.Table.from_pandas(df[BAR_COLUMNS], schema=_schema(), preserve_index=False), tmp)
+    os.replace(tmp, path / name)  # lezers zien nooit een half geschreven bestand
+
+
+def normalize_bars(df):
+    """Rijen zoals ze uit historicalData komen (date, ...) -> BAR_COLUMNS met juiste typen."""
+    out = pd.DataFrame({
+        'datetime': parse_bar_times(df['date']).to_numpy(),
+        'symbol': df['symbol'].astype(str).to_numpy(),
+        'asset_rollup': df['asset_rollup'].astype(str).to_numpy(),
+    })
+    for c in VALUE_COLUMNS:
+        out[c] = pd.to_numeric(df[c], errors='coerce').astype(float).to_numpy()
+    return out[out['datetime'].notna()].reset_index(drop=True)
+
+
+def append_bars(root, df_bars, bar):
+    """
+    Schrijft genormaliseerde bars als nieuwe part-bestanden (één per maand).
+    Geeft de geraakte (jaar, maand) partities terug.
+    """
+    _require_pyarrow()
+    if df_bars.empty:
+        return set()
+    # naam begint met een tijdstempel: bestandsvolgorde = schrijfvolgorde
+    name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+    touched = set()
+    dt = df_bars['datetime']
+    for (y, m), df_part in df_bars.groupby([dt.dt.year, dt.dt.month], sort=True):
+        _write(df_part, _partition_dir(root, bar, int(y), int(m)), name)
+        touched.add((int(y), int(m)))
+    return touched
+
+
+def _read_partition(path, filters=None):
+    """Alle parts van één partitie in schrijfvolgorde, dubbele (symbol, datetime): laatste wint."""
+    files = sorted(path.glob('part-*.parquet'))
+    if not files:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    frames = [pq.read_table(f, columns=BAR_COLUMNS, filters=filters).to_pandas() for f in files]
+    df = pd.concat(frames, ignore_index=True)
+    return df.drop_duplicates(['symbol', 'datetime'], keep='last')
+
+
+def compact(root, bar, partitions):
+    """Voegt de parts van de opgegeven (jaar, maand) partities samen tot part-0."""
+    _require_pyarrow()
+    for y, m in sorted(partitions):
+        path = _partition_dir(root, bar, y, m)
+        files = sorted(path.glob('part-*.parquet'))
+        if len(files) <= 1:
+            continue
+        df = _read_partition(path).sort_values(['symbol', 'datetime'], kind='stable')
+        _write(df, path, COMPACT_FILE)
+        for f in files:
+            if f.name != COMPACT_FILE:
+                f.unlink()
+
+
+def read_bars(root, bar, start=None, end=None, symbols=None):
+    """Intraday bars in [start, end] (datums, end inclusief), optioneel alleen `symbols`."""
+    _require_pyarrow()
+    start_ts = pd.Timestamp(start).normalize() if start is not None else None
+    end_ts = pd.Timestamp(end).normalize() + pd.Timedelta(days=1) if end is not None else None
+    filters = []
+    if start_ts is not None:
+        filters.append(('datetime', '>=', start_ts.to_pydatetime()))
+    if end_ts is not None:
+        filters.append(('datetime', '<', end_ts.to_pydatetime()))
+    if symbols is not None:
+        filters.append(('symbol', 'in', sorted({str(s) for s in symbols})))
+
+    frames = []
+    for path in sorted((Path(root) / DATASET / f"bar={bar}").glob('year=*/month=*')):
+        y, m = int(path.parent.name[5:]), int(path.name[6:])
+        month = pd.Timestamp(year=y, month=m, day=1)
+        if start_ts is not None and month + pd.offsets.MonthEnd(1) < start_ts:
+            continue
+        if end_ts is not None and month >= end_ts:
+            continue
+        frames.append(_read_partition(path, filters or None))
+    if not frames:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def daily_bars(df_bars):
+    """
+    Dag-OHLC per (symbol, asset_rollup, dag): eerste open, hoogste high, laagste
+    low, laatste close, som volume en VWAP (som wap*volume / som volume; zonder
+    volume het gemiddelde van wap). Kolommen zoals de dagbars van stage 1A,
+    met date als 'YYYYMMDD'.
+    """
+    columns = ['date', 'symbol', 'asset_rollup', 'open', 'high', 'low', 'close', 'volume', 'wap']
+    if df_bars.empty:
+        return pd.DataFrame(columns=columns)
+    df = df_bars.sort_values(['symbol', 'asset_rollup', 'datetime'], kind='stable')
+    df = df.assign(day=df['datetime'].dt.normalize(),
+                   pv=df['wap'] * df['volume'].where(df['volume'] > 0))
+    grouped = df.groupby(['symbol', 'asset_rollup', 'day'], sort=True)
+    out = grouped.agg(open=('open', 'first'), high=('high', 'max'), low=('low', 'min'),
+                      close=('close', 'last'), volume=('volume', 'sum'),
+                      pv=('pv', 'sum'), wap_mean=('wap', 'mean')).reset_index()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = out['pv'] / out['volume']
+    out['wap'] = np.where(out['volume'] > 0, vwap, out['wap_mean'])
+    out['date'] = out['day'].dt.strftime('%Y%m%d')
+    return out[columns]
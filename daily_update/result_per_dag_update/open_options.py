@@ -0,0 +1,275 @@
+"""
+Interval-sweep voor openstaande opties (stage 4).
+
+Een optietransactie telt mee op dag d als datum <= d <= optie_exp_date.
+Per contract (uniek_id, multiplier_close_price) wordt de lopende positie
+één keer opgebouwd uit events (+ op transactiedatum, - de dag na expiratie).
+Tussen twee opeenvolgende events is de positie constant; alleen de intervallen
+met transactie_aantal != 0 worden in één gevectoriseerde stap naar dagrijen
+uitgeklapt.
+
+value_open_option_rows waardeert die rijen (as-of close, volatiliteit, numba
+kernel) tot de kolommen van per_dag_open_opties_opgerold.
+aggregate_open_options/write_open_option_result vatten die rijen samen per
+(datum, asset_rollup) voor per_dag_asset_result (voorheen stage 5).
+"""
+import numpy as np
+import pandas as pd
+
+import startup_profile
+from access_schema import ensure_columns
+from diff_writer import write_changed_rows
+from price_matrix import lookup_prices, lookup_volatility, PRICE_LOOKBACK_DAYS
+from trading_calendar import expand_to_calendar
+from typed_load import read_frame
+
+ATTR_COLS = ['broker', 'asset_rollup', 'optie_exp_date', 'optie_strike', 'optie_call_put']
+SUM_COLS = ['transactie_euro_totaal', 'transactie_aantal', 'transactie_fee']
+
+ONE_DAY = pd.Timedelta(days=1)
+
+OPEN_TABLE = 'per_dag_open_opties_opgerold'
+# Delta-upsert op (datum, uniek_id, multiplier)
+OPEN_TABLE_KEYS = ['datum', 'uniek_id', 'multiplier_close_price']
+# Kolommen volgens tabel Access (zonder Id)
+OPEN_TABLE_COLUMNS = [
+    'datum', 'broker', 'asset_rollup', 'uniek_id', 'optie_exp_date',
+    'optie_strike', 'optie_call_put', 'optie_aantal', 'optie_premie',
+    'asset_close', 'itm_otm', 'open_optie_waarde_itm', 'winst_verlies',
+    'optie_fee', 'optie_waarde', 'multiplier_close_price',
+    'optie_tijdswaarde', 'open_optie_waarde', 'optie_volatiliteit',
+    'optie_delta', 'optie_gamma', 'optie_theta', 'optie_vega'
+]
+GREEK_COLUMNS = [
+    'optie_tijdswaarde', 'open_optie_waarde', 'optie_volatiliteit',
+    'optie_delta', 'optie_gamma', 'optie_theta', 'optie_vega'
+]
+
+
+def option_group_keys(df_tx):
+    # ⚠️ Multiplier hoort bij het contract (na splits wijzigt hij)
+    return ['uniek_id', 'multiplier_close_price'] if 'multiplier_close_price' in df_tx.columns else ['uniek_id']
+
+
+def expand_intervals(df_intervals, start_col='van', end_col='tot'):
+    """
+    Klapt intervallen [van, tot] (inclusief, genormaliseerde datums) uit naar één
+    rij per dag. Overige kolommen worden herhaald; de dag komt in 'datum'.
+    """
+    if df_intervals.empty:
+        return df_intervals.drop(columns=[start_col, end_col]).assign(datum=pd.Series(dtype='datetime64[ns]'))
+
+    van = df_intervals[start_col].to_numpy(dtype='datetime64[D]')
+    tot = df_intervals[end_col].to_numpy(dtype='datetime64[D]')
+    lengths = (tot - van).astype(np.int64) + 1
+
+    idx = np.repeat(np.arange(len(df_intervals)), lengths)
+    # dag-offset binnen elk interval: 0, 1, ..., len-1
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    out = df_intervals.drop(columns=[start_col, end_col]).iloc[idx].reset_index(drop=True)
+    out['datum'] = pd.to_datetime(van[idx] + offsets.astype('timedelta64[D]'))
+    return out
+
+
+def build_open_option_rows(df_tx, start_ts, end_ts, days=None):
+    """
+    Geeft per dag in [start_ts, end_ts] de openstaande optiecontracten terug met
+    de kolommen van de oude per-datum groupby: group keys, ATTR_COLS, SUM_COLS, datum.
+    days: optioneel grid (bijv. handelsdagen); alleen die dagen worden teruggegeven.
+    """
+    start_ts = pd.Timestamp(start_ts).normalize()
+    end_ts = pd.Timestamp(end_ts).normalize()
+    group_keys = option_group_keys(df_tx)
+    out_cols = group_keys + ATTR_COLS + SUM_COLS + ['datum']
+
+    tx = df_tx.dropna(subset=group_keys + ['datum', 'optie_exp_date']).copy()
+    tx['datum'] = pd.to_datetime(tx['datum']).dt.normalize()
+    tx['exp_dag'] = pd.to_datetime(tx['optie_exp_date']).dt.normalize()
+    tx = tx[tx['datum'] <= tx['exp_dag']]
+    if tx.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    for col in SUM_COLS:
+        tx[col] = tx[col].astype(float)
+
+    tx['key_id'] = tx.groupby(group_keys, sort=False, observed=True).ngroup()
+    attrs = tx.groupby('key_id', sort=True)[group_keys + ATTR_COLS].first()
+
+    # Events: + bij transactie, - de dag na expiratie
+    ev_open = tx[['key_id', 'datum'] + SUM_COLS]
+    ev_close = tx[['key_id']].assign(datum=tx['exp_dag'] + ONE_DAY)
+    ev_close[SUM_COLS] = -tx[SUM_COLS].to_numpy()
+    events = (
+        pd.concat([ev_open, ev_close], ignore_index=True)
+        .groupby(['key_id', 'datum'], as_index=False, sort=True)[SUM_COLS].sum()
+    )
+
+    # Lopende positie per contract; afronden tegen float-drift van +x/-x
+    events[SUM_COLS] = events.groupby('key_id')[SUM_COLS].cumsum().round(9)
+    events['tot'] = events.groupby('key_id')['datum'].shift(-1) - ONE_DAY
+    events['tot'] = events['tot'].fillna(end_ts)
+
+    intervals = events[events['transactie_aantal'] != 0].copy()
+    intervals['van'] = intervals['datum'].clip(lower=start_ts)
+    intervals['tot'] = intervals['tot'].clip(upper=end_ts)
+    intervals = intervals[intervals['van'] <= intervals['tot']]
+
+    intervals = intervals[['key_id', 'van', 'tot'] + SUM_COLS].join(attrs, on='key_id')
+    rows = expand_intervals(intervals.drop(columns='key_id'))
+    if days is not None:
+        rows = rows[rows['datum'].isin(pd.DatetimeIndex(days))]
+    return rows[out_cols].sort_values(['datum'] + group_keys, kind='stable').reset_index(drop=True)
+
+
+def load_option_transactions(cursor, normalize=True):
+    """Alle optietransacties uit transacties_bron_data (datum standaard genormaliseerd)."""
+    df_tx = read_frame(cursor, "SELECT * FROM transacties_bron_data WHERE asset_type='optie'")
+    if normalize and 'datum' in df_tx.columns:
+        df_tx['datum'] = pd.to_datetime(df_tx['datum']).dt.normalize()
+    return df_tx
+
+
+def value_open_option_rows(cursor, df_tx, asset_list, start_ts, end_ts, days=None):
+    """
+    Open optierijen per dag in [start_ts, end_ts] (of op het grid `days`),
+    gewaardeerd met de as-of close (terugkijkvenster 10 dagen, 0 telt mee) en
+    de numba kernel. Geeft een DataFrame met OPEN_TABLE_COLUMNS.
+    """
+    updates_open_opties = build_open_option_rows(df_tx, start_ts, end_ts, days)
+    df_merged = updates_open_opties.rename(columns={
+        'transactie_aantal': 'optie_aantal',
+        'transactie_euro_totaal': 'optie_premie',
+        'transactie_fee': 'optie_fee',
+    })
+
+    # --- Close-prijs per open optierij ---
+    asset_close = lookup_prices(
+        cursor, df_merged['asset_rollup'], df_merged['datum'],
+        lookback_days=PRICE_LOOKBACK_DAYS, zero_policy='keep'
+    )['close_raw'].to_numpy()
+    df_merged['asset_close'] = np.where(df_merged['asset_rollup'].isin(asset_list), asset_close, np.nan)
+
+    # ✅ Multiplier toepassen op close_price
+    if 'multiplier_close_price' in df_merged.columns:
+        df_merged['asset_close'] = df_merged['asset_close'] * df_merged['multiplier_close_price']
+    else:
+        df_merged['multiplier_close_price'] = 1.0
+
+    missing_close_values = df_merged['asset_close'].isna().sum()
+    if missing_close_values > 0:
+        print(f"⚠️ Warning: {missing_close_values} rows have missing asset_close values after the merge.")
+
+    # --- Numba pas hier importeren: alleen de optiewaardering heeft hem nodig ---
+    with startup_profile.timed('import numba + option_kernels'):
+        from option_kernels import value_options, warm_up, DEFAULT_VOLATILITY, RISK_FREE_RATE
+    # Alleen de eerste dispatch (cache-load of compilatie) telt als opstartkost
+    with startup_profile.timed('value_options cache-load/compile'):
+        warm_up()
+
+    # --- Volatiliteit & looptijd per optierij ---
+    volatility = lookup_volatility(cursor, df_merged['asset_rollup'], df_merged['datum'])
+    df_merged['optie_volatiliteit'] = np.where(np.isnan(volatility), DEFAULT_VOLATILITY, volatility)
+    t_years = (
+        (pd.to_datetime(df_merged['optie_exp_date']).dt.normalize() - df_merged['datum']).dt.days
+        .clip(lower=0).astype(np.float64) / 365.0
+    )
+
+    # --- Batched berekening (parallel, gecachete compilatie) ---
+    # Schrijfbare kopieën: pandas (copy-on-write) geeft read-only arrays, en die
+    # zijn voor numba een andere signatuur dan die van warm_up (= nieuwe compilatie)
+    cp_int = np.where(df_merged['optie_call_put'].values == 'call', 0, 1).astype(np.int32)
+    strike = df_merged['optie_strike'].to_numpy(dtype=np.float64, copy=True)
+    close_price = df_merged['asset_close'].to_numpy(dtype=np.float64, copy=True)
+    amount = df_merged['optie_aantal'].to_numpy(dtype=np.float64, copy=True)
+
+    (itm_otm, optie_waarde, open_optie_waarde_itm, bs_price, tijdswaarde,
+     delta, gamma, theta, vega) = value_options(
+        cp_int, strike, close_price, amount,
+        t_years.to_numpy(dtype=np.float64, copy=True),
+        df_merged['optie_volatiliteit'].to_numpy(dtype=np.float64, copy=True), RISK_FREE_RATE
+    )
+
+    df_merged['itm_otm'] = itm_otm
+    df_merged['optie_waarde'] = optie_waarde
+    df_merged['open_optie_waarde_itm'] = open_optie_waarde_itm
+    df_merged['winst_verlies'] = df_merged['optie_premie'] + df_merged['open_optie_waarde_itm']
+    df_merged['optie_tijdswaarde'] = tijdswaarde
+    df_merged['open_optie_waarde'] = bs_price * amount
+    df_merged['optie_delta'] = delta
+    df_merged['optie_gamma'] = gamma
+    df_merged['optie_theta'] = theta
+    df_merged['optie_vega'] = vega
+
+    return df_merged[OPEN_TABLE_COLUMNS]
+
+
+def expand_open_option_rows(df_final, days, end_date):
+    """
+    Vult optierijen op handelsdagen aan tot alle kalenderdagen (waarden van de
+    vorige handelsdag), zonder contracten na hun expiratiedatum door te trekken.
+    """
+    df = expand_to_calendar(df_final, OPEN_TABLE_KEYS[1:], days, end_date)
+    if df.empty:
+        return df
+    still_open = pd.to_datetime(df['optie_exp_date']).dt.normalize() >= df['datum']
+    return df[still_open.to_numpy()].reset_index(drop=True)
+
+
+def write_open_option_table(conn, cursor, df_final, start_date, end_date=None):
+    """
+    Delta-upsert van per_dag_open_opties_opgerold: alleen nieuwe, gewijzigde en
+    verdwenen rijen worden geschreven i.p.v. delete + volledige herinsert.
+    end_date begrenst het venster waarin verdwenen rijen worden verwijderd.
+    """
+    ensure_columns(conn, cursor, OPEN_TABLE, {c: 'DOUBLE' for c in GREEK_COLUMNS})
+    n_inserted, n_updated, n_deleted = write_changed_rows(
+        conn, cursor, OPEN_TABLE, df_final,
+        key_cols=OPEN_TABLE_KEYS,
+        value_cols=[c for c in OPEN_TABLE_COLUMNS if c not in OPEN_TABLE_KEYS],
+        temp_table='Tempper_dag_open_opties_opgerold',
+        start_date=start_date, end_date=end_date,
+        insert_missing=True, delete_vanished=True
+    )
+    print(f"{OPEN_TABLE}: {n_inserted} ingevoegd, {n_updated} bijgewerkt, {n_deleted} verwijderd.")
+    return n_inserted, n_updated, n_deleted
+
+
+# per_dag_open_opties_opgerold kolom -> per_dag_asset_result kolom
+OPEN_RESULT_COLUMNS = {
+    'optie_premie': 'open_premie',
+    'open_optie_waarde_itm': 'asset_open_optie_waarde',
+    'optie_fee': 'optie_open_fee',
+    'short_put_aantal': 'optie_aantal_put_bezit',
+}
+
+
+def aggregate_open_options(df_open):
+    """
+    Sommeert open optierijen per (datum, asset_rollup). optie_aantal_put_bezit is
+    de som van optie_aantal over de geschreven puts (put met optie_aantal < 0).
+    """
+    if df_open.empty:
+        return pd.DataFrame(columns=['datum', 'asset_rollup'] + list(OPEN_RESULT_COLUMNS.values()))
+
+    short_put = (df_open['optie_call_put'] == 'put') & (df_open['optie_aantal'] < 0)
+    df = df_open[['datum', 'asset_rollup', 'optie_premie', 'open_optie_waarde_itm', 'optie_fee']].assign(
+        short_put_aantal=np.where(short_put, df_open['optie_aantal'].astype(float), 0.0)
+    )
+    aggregated = df.groupby(['datum', 'asset_rollup'], as_index=False, observed=True).sum()
+    return aggregated.rename(columns=OPEN_RESULT_COLUMNS)
+
+
+def write_open_option_result(conn, cursor, df_open, start_date):
+    """Schrijft de open-optie kolommen van per_dag_asset_result (alleen gewijzigde rijen)."""
+    aggregated = aggregate_open_options(df_open)
+    if aggregated.empty:
+        return 0, 0, 0
+    return write_changed_rows(
+        conn, cursor, 'per_dag_asset_result', aggregated,
+        key_cols=['datum', 'asset_rollup'],
+        value_cols=list(OPEN_RESULT_COLUMNS.values()),
+        temp_table='TempUpdates',
+        start_date=start_date,
+        insert_missing=False
+    )
@@ -0,0 +1,131 @@
+"""
+Numba kernels voor optiewaardering (stage 4).
+
+value_options rekent per open optierij, parallel over rijen (prange):
+  - intrinsieke waarde en ITM/OTM (zoals de oude compute_option_arrays)
+  - Black-Scholes prijs, tijdswaarde en delta/gamma/theta/vega
+
+cache=True: de gecompileerde code wordt op schijf bewaard en bij de volgende
+run hergebruikt, dus geen JIT-compilatie of warm-up per subprocess.
+"""
+import math
+
+import numpy as np
+from numba import njit, prange
+
+# Aannames zolang er geen marktdata voor rente/volatiliteit in de database staat
+RISK_FREE_RATE = 0.03
+DEFAULT_VOLATILITY = 0.30
+
+_INV_SQRT_2 = 1.0 / math.sqrt(2.0)
+_INV_SQRT_2PI = 1.0 / math.sqrt(2.0 * math.pi)
+
+
+@njit(cache=True)
+def _norm_cdf(x):
+    return 0.5 * (1.0 + math.erf(x * _INV_SQRT_2))
+
+
+@njit(cache=True)
+def _norm_pdf(x):
+    return _INV_SQRT_2PI * math.exp(-0.5 * x * x)
+
+
+@njit(parallel=True, cache=True)
+def value_options(call_put_int, strike, close_price, amount, t_years, volatility, rate):
+    """
+    call_put_int: 0 = call, 1 = put
+    t_years:      looptijd tot expiratie in jaren (0 op de expiratiedag)
+    Greeks per optie-eenheid; theta per kalenderdag, vega per 1%-punt volatiliteit.
+    """
+    n = len(strike)
+    itm_otm = np.empty(n, dtype=np.int32)
+    option_value = np.empty(n, dtype=np.float64)
+    open_value_itm = np.empty(n, dtype=np.float64)
+    bs_price = np.empty(n, dtype=np.float64)
+    time_value = np.empty(n, dtype=np.float64)
+    delta = np.empty(n, dtype=np.float64)
+    gamma = np.empty(n, dtype=np.float64)
+    theta = np.empty(n, dtype=np.float64)
+    vega = np.empty(n, dtype=np.float64)
+
+    for i in prange(n):
+        cp = call_put_int[i]
+        k = strike[i]
+        s = close_price[i]
+        a = amount[i]
+        t = t_years[i]
+        sigma = volatility[i]
+
+        if not (s == s):  # NaN-check
+            itm_otm[i] = 0
+            option_value[i] = 0.0
+            open_value_itm[i] = 0.0
+            bs_price[i] = 0.0
+            time_value[i] = 0.0
+            delta[i] = 0.0
+            gamma[i] = 0.0
+            theta[i] = 0.0
+            vega[i] = 0.0
+            continue
+
+        # Intrinsieke waarde
+        if cp == 0:  # call
+            itm = k <= s
+            v = s - k if itm else 0.0
+        else:  # put
+            itm = k > s
+            v = k - s if itm else 0.0
+        itm_otm[i] = 1 if itm else 0
+        option_value[i] = v
+        open_value_itm[i] = v * a
+
+        # Black-Scholes; zonder looptijd/vol/prijs valt hij terug op intrinsiek
+        if t <= 0.0 or sigma <= 0.0 or s <= 0.0 or k <= 0.0:
+            bs_price[i] = v
+            time_value[i] = 0.0
+            if cp == 0:
+                delta[i] = 1.0 if s > k else 0.0
+            else:
+                delta[i] = -1.0 if s < k else 0.0
+            gamma[i] = 0.0
+            theta[i] = 0.0
+            vega[i] = 0.0
+            continue
+
+        sqrt_t = math.sqrt(t)
+        d1 = (math.log(s / k) + (rate + 0.5 * sigma * sigma) * t) / (sigma * sqrt_t)
+        d2 = d1 - sigma * sqrt_t
+        disc = math.exp(-rate * t)
+        pdf_d1 = _norm_pdf(d1)
+
+        if cp == 0:
+            price = s * _norm_cdf(d1) - k * disc * _norm_cdf(d2)
+            delta[i] = _norm_cdf(d1)
+            theta_year = -s * pdf_d1 * sigma / (2.0 * sqrt_t) - rate * k * disc * _norm_cdf(d2)
+        else:
+            price = k * disc * _norm_cdf(-d2) - s * _norm_cdf(-d1)
+            delta[i] = _norm_cdf(d1) - 1.0
+            theta_year = -s * pdf_d1 * sigma / (2.0 * sqrt_t) + rate * k * disc * _norm_cdf(-d2)
+
+        bs_price[i] = price
+        time_value[i] = price - v
+        gamma[i] = pdf_d1 / (s * sigma * sqrt_t)
+        theta[i] = theta_year / 365.0
+        vega[i] = s * pdf_d1 * sqrt_t / 100.0
+
+    return itm_otm, option_value, open_value_itm, bs_price, time_value, delta, gamma, theta, vega
+
+
+def warm_up():
+    """
+    Eerste dispatch van value_options op één element: laadt de kernel uit de
+    cache op schijf of compileert hem. Zo is de opstartkost apart te meten van
+    de eigenlijke waardering (die daarna niet meer compileert).
+    Geeft 'cache', 'compile' of 'al geladen'.
+    """
+    if value_options.signatures:
+        return 'al geladen'
+    one = np.ones(1, dtype=np.float64)
+    value_options(np.zeros(1, dtype=np.int32), one, one, one, one, one * DEFAULT_VOLATILITY, RISK_FREE_RATE)
+    return 'cache' if sum(value_options.stats.cache_hits.values()) else 'compile'
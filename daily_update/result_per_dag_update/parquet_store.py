@@ -0,0 +1,186 @@
+"""
+Kolomgewijze kopie van Access tabellen als Parquet, gepartitioneerd per jaar/maand:
+
+    <root>/<tabel>/year=YYYY/month=MM/part-0.parquet
+
+De standaard root is lokaal (~/.per_dag_pipeline/parquet/<database>, of
+PER_DAG_PARQUET_DIR), niet naast de database: die staat op OneDrive en de
+sync zou elke herschreven maand opnieuw uploaden en bestanden kunnen locken.
+
+export_table schrijft alleen de maanden vanaf de startdatum van de run opnieuw
+(of alles als de tabel nog niet geëxporteerd is). query() draait SQL over de
+datasets met duckdb, read_table() leest met pyarrow filters; zo hoeven analyses
+niet meer via ODBC door het Access bestand.
+
+pyarrow (export/lezen) en duckdb (query) zijn optioneel: zonder pyarrow wordt
+de export overgeslagen.
+"""
+import datetime
+import decimal
+import hashlib
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optioneel
+    pa = ds = pq = None
+
+EXPORT_TABLES = ['per_dag_asset_result', 'per_dag_open_opties_opgerold', 'historical_data_correct']
+DATE_COL = 'datum'
+PART_FILE = 'part-0.parquet'
+
+PARQUET_DIR = os.environ.get('PER_DAG_PARQUET_DIR',
+                             os.path.join(os.path.expanduser('~'), '.per_dag_pipeline', 'parquet'))
+
+
+def pyarrow_available():
+    return pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is nodig voor de Parquet export (pip install pyarrow)")
+
+
+def default_root(db_path):
+    """Lokale map per database: PARQUET_DIR/<naam database>.<hash van het pad>"""
+    key = os.path.normcase(os.path.abspath(db_path))
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return Path(PARQUET_DIR) / f"{stem}.{hashlib.sha1(key.encode()).hexdigest()[:8]}"
+
+
+def table_exists(cursor, table):
+    return cursor.tables(table=table, tableType='TABLE').fetchone() is not None
+
+
+def _arrow_type(type_code):
+    if type_code is bool:
+        return pa.bool_()
+    if type_code is int:
+        return pa.int64()
+    if type_code in (float, decimal.Decimal):
+        return pa.float64()
+    if type_code in (datetime.datetime, datetime.date):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def _read_window(cursor, table, start=None):
+    query = f"SELECT * FROM {table}"
+    params = []
+    if start is not None:
+        query += f" WHERE [{DATE_COL}] >= ?"
+        params.append(pd.Timestamp(start).to_pydatetime())
+    cursor.execute(query, *params)
+    schema = pa.schema([(c[0], _arrow_type(c[1])) for c in cursor.description])
+    rows = cursor.fetchall()
+    df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=schema.names)
+    for field in schema:
+        if pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype(float)
+        elif pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name])
+    return df, schema
+
+
+def _partition_dir(root, table, year, month):
+    return Path(root) / table / f"year={year:04d}" / f"month={month:02d}"
+
+
+def _existing_partitions(root, table):
+    parts = set()
+    for f in (Path(root) / table).glob(f"year=*/month=*/{PART_FILE}"):
+        parts.add((int(f.parent.parent.name[5:]), int(f.parent.name[6:])))
+    return parts
+
+
+def _write_partition(df_part, schema, path):
+    path.mkdir(parents=True, exist_ok=True)
+    target = path / PART_FILE
+    tmp = path / (PART_FILE + '.tmp')
+    pq.write_table(pa.Table.from_pandas(df_part, schema=schema, preserve_index=False), tmp)
+    os.replace(tmp, target)  # lezers zien nooit een half geschreven bestand
+
+
+def export_table(cursor, table, root, start_date=None):
+    """
+    Schrijft de maandpartities van `table` vanaf de maand van start_date
+    opnieuw (alles als start_date None is of er nog niets geëxporteerd is).
+    Maanden in het venster zonder rijen worden verwijderd.
+    Geeft het aantal geschreven partities terug.
+    """
+    _require_pyarrow()
+    existing = _existing_partitions(root, table)
+    month_start = None
+    if start_date is not None and existing:
+        month_start = pd.Timestamp(start_date).to_period('M').to_timestamp()
+
+    df, schema = _read_window(cursor, table, month_start)
+    df = df[df[DATE_COL].notna()]
+    year = df[DATE_COL].dt.year
+    month = df[DATE_COL].dt.month
+
+    written = set()
+    for (y, m), df_part in df.groupby([year, month], sort=True):
+        _write_partition(df_part, schema, _partition_dir(root, table, int(y), int(m)))
+        written.add((int(y), int(m)))
+
+    # Maanden in het venster die nu leeg zijn
+    for y, m in existing - written:
+        if month_start is None or pd.Timestamp(year=y, month=m, day=1) >= month_start:
+            (_partition_dir(root, table, y, m) / PART_FILE).unlink()
+
+    print(f"{table}: {len(df)} rijen in {len(written)} partities geschreven naar {Path(root) / table}")
+    return len(written)
+
+
+def export_tables(cursor, root, start_date=None, tables=EXPORT_TABLES):
+    """Exporteert de tabellen uit `tables` die in deze database bestaan."""
+    for table in tables:
+        if not table_exists(cursor, table):
+            print(f"{table}: niet in deze database, overgeslagen.")
+            continue
+        export_table(cursor, table, root, start_date)
+
+
+def read_table(root, table, columns=None, start=None, end=None):
+    """Leest een geëxporteerde tabel als DataFrame, optioneel gefilterd op datum."""
+    _require_pyarrow()
+    dataset = ds.dataset(Path(root) / table, format='parquet', partitioning='hive')
+    flt = None
+    if start is not None:
+        flt = ds.field(DATE_COL) >= pd.Timestamp(start).to_pydatetime()
+    if end is not None:
+        cond = ds.field(DATE_COL) <= pd.Timestamp(end).to_pydatetime()
+        flt = cond if flt is None else flt & cond
+    return dataset.to_table(columns=columns, filter=flt).to_pandas()
+
+
+def query(root, sql):
+    """
+    Draait `sql` met duckdb; elke geëxporteerde tabel onder `root` is als view
+    beschikbaar onder zijn eigen naam, bijv.
+        query(root, "SELECT datum, SUM(asset_result) FROM per_dag_asset_result GROUP BY datum")
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("duckdb is nodig voor query() (pip install duckdb); read_table() werkt met alleen pyarrow")
+
+    con = duckdb.connect()
+    try:
+        for table_dir in Path(root).iterdir():
+            if table_dir.is_dir() and any(table_dir.glob(f"year=*/month=*/{PART_FILE}")):
+                pattern = (table_dir / 'year=*' / 'month=*' / PART_FILE).as_posix()
+                con.execute(
+                    f"CREATE VIEW {table_dir.name} AS "
+                    f"SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)"
+                )
+        return con.execute(sql).df()
+    finally:
+        con.close()
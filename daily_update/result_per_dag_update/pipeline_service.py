@@ -0,0 +1,339 @@
+"""
+Lokale pipeline service: houdt verbindingen, ingelezen brondata, de prijsbars
+en de gecompileerde numba kernels warm tussen runs.
+
+Een losse stage betaalt elke run opnieuw voor het opstarten van Python, de
+imports, de ODBC-verbinding, het inlezen van de transacties en het laden van
+de kernels. De service doet dat één keer en voert daarna run-verzoeken uit
+(database, startdatum, stages) die binnenkomen via een lokale socket
+(multiprocessing.connection op 127.0.0.1 met authkey); zie het script
+"11 pipeline service 1.0.py" voor serve/run/stop.
+
+Per database wordt bewaard:
+  - één open Access-verbinding
+  - de invoer van stages 3-8 (combined_stages.load_inputs) en de assetlijst
+  - alle bars uit per_dag_asset_prijs (price_matrix.BAR_CACHE)
+
+Caches worden vóór elke stage gecontroleerd met een vingerafdruk per tabel:
+een goedkope aggregaatquery (Access rekent, er komen een paar rijen terug)
+per groep sleutels die de cache gebruikt (asset_type/asset_rollup/
+transactie_type, asset_detail, asset_rollup) met aantal, datumbereik,
+kolomsommen, met de datum gewogen sommen (verschoven waarden tussen dagen) en
+lengtesommen van tekstkolommen. Verandert een tabel, dan wordt alleen de
+bijbehorende cache opnieuw geladen.
+Access ziet commits van andere processen (bijv. de stage 1 scripts) pas na
+zijn verversinterval van enkele seconden; de vingerafdruk wordt dus met die
+vertraging bijgewerkt.
+
+De service draait zonder asset-shards: de warme invoer zit in dit proces en
+zou anders per run opnieuw naar de workers moeten.
+"""
+import hashlib
+import io
+import os
+import secrets
+import sys
+import time
+import traceback
+from contextlib import redirect_stdout
+from multiprocessing.connection import Client, Listener
+
+DEFAULT_PORT = 6046
+AUTHKEY_ENV = 'PIPELINE_SERVICE_KEY'
+KEY_FILE = os.path.join(os.path.expanduser('~'), '.per_dag_pipeline', 'service.key')
+STAGES = ['2', '3-8', '9', '12']
+
+# (tabel, query) per cache: aggregaten per sleutelgroep, geen volledige rijen.
+# Datum als getal (datum - #1900-01-01#) weegt elke waarde met zijn dag; Null blijft Null.
+FINGERPRINTS = {
+    'transacties': """
+        SELECT asset_type, asset_rollup, transactie_type, COUNT(*), MIN(datum), MAX(datum),
+               SUM(transactie_aantal), SUM(transactie_euro_totaal), SUM(transactie_fee),
+               SUM(transactie_aantal * (datum - #1900-01-01#)),
+               SUM(transactie_euro_totaal * (datum - #1900-01-01#)),
+               SUM(multiplier_close_price), SUM(optie_strike), SUM(optie_exp_date - #1900-01-01#),
+               SUM(Len(uniek_id)), SUM(Len(asset_detail)), SUM(Len(optie_call_put)), SUM(Len(broker))
+        FROM transacties_bron_data
+        WHERE asset_type IN ('aandeel', 'optie', 'sprinter')
+        GROUP BY asset_type, asset_rollup, transactie_type
+    """,
+    'sprinters_referentie': """
+        SELECT asset_detail, COUNT(*), SUM(sprinter_funding), SUM(sprinter_ratio)
+        FROM sprinters_referentie_data
+        GROUP BY asset_detail
+    """,
+    'assets': """
+        SELECT COUNT(*), MIN(asset_rollup), MAX(asset_rollup), SUM(Len(asset_rollup))
+        FROM asset_rollup_data
+    """,
+    # per asset één checksumrij
+    'prijzen': """
+        SELECT asset_rollup, COUNT(*), MIN(datum), MAX(datum),
+               SUM(close_raw), SUM(close_raw * (datum - #1900-01-01#)), SUM(close_raw * close_raw),
+               SUM(multiplier_close_price), SUM(multiplier_close_price * (datum - #1900-01-01#))
+        FROM per_dag_asset_prijs
+        WHERE close_raw IS NOT NULL
+        GROUP BY asset_rollup
+    """,
+}
+# welke vingerafdrukken bepalen een cache
+INPUT_TABLES = ('transacties', 'sprinters_referentie', 'assets')
+PRICE_TABLES = ('prijzen',)
+
+
+def authkey(create=False):
+    """
+    Sleutel van de service: PIPELINE_SERVICE_KEY, anders het sleutelbestand in
+    het gebruikersprofiel (alleen leesbaar voor de gebruiker). Er is geen
+    standaardsleutel: berichten zijn pickles, wie de sleutel kent kan code
+    laten uitvoeren. create=True (serve) maakt het bestand met een willekeurige
+    sleutel aan als het nog niet bestaat.
+    """
+    key = os.environ.get(AUTHKEY_ENV)
+    if key:
+        return key.encode()
+    if not os.path.exists(KEY_FILE):
+        if not create:
+            raise RuntimeError(f"Geen service sleutel: zet {AUTHKEY_ENV} of start eerst de service "
+                               f"(maakt {KEY_FILE} aan)")
+        os.makedirs(os.path.dirname(KEY_FILE), exist_ok=True)
+        fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        print(f"Nieuwe service sleutel aangemaakt in {KEY_FILE}")
+    if os.name != 'nt' and os.stat(KEY_FILE).st_mode & 0o077:
+        raise RuntimeError(f"Sleutelbestand {KEY_FILE} is leesbaar voor anderen (chmod 600)")
+    with open(KEY_FILE) as f:
+        key = f.read().strip()
+    if not key:
+        raise RuntimeError(f"Sleutelbestand {KEY_FILE} is leeg; verwijder het en start de service opnieuw")
+    return key.encode()
+
+
+def request(message, port=DEFAULT_PORT, timeout=None):
+    """Stuurt één verzoek naar de service en wacht op het antwoord (dict)."""
+    with Client(('127.0.0.1', port), authkey=authkey()) as conn:
+        conn.send(message)
+        if timeout is not None and not conn.poll(timeout):
+            raise TimeoutError(f"Geen antwoord van de pipeline service binnen {timeout}s")
+        return conn.recv()
+
+
+def fingerprint(cursor, query):
+    """Hash over de (aggregaat)rijen van query, onafhankelijk van de volgorde waarin Access ze geeft."""
+    cursor.execute(query)
+    rows = sorted(hashlib.sha1(repr(tuple(row)).encode()).digest() for row in cursor.fetchall())
+    return hashlib.sha1(b''.join(rows)).hexdigest()
+
+
+class _Tee(io.TextIOBase):
+    """Schrijft naar de servicelog én naar het antwoord van het verzoek."""
+
+    def __init__(self, *streams):
+        self.streams = streams
+
+    def write(self, s):
+        for stream in self.streams:
+            stream.write(s)
+        return len(s)
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
+
+class DatabaseState:
+    """Verbinding, vingerafdrukken en warme caches van één Access database."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.prints = {}
+        self.inputs = None
+        self.asset_list = None
+        self.bars = None
+
+    def cursor(self):
+        if self.conn is None:
+            import pyodbc
+            from sharding import connection_string
+            self.conn = pyodbc.connect(connection_string(self.db_path))
+        return self.conn.cursor()
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def _changed(self, cursor, tables):
+        changed = False
+        for table in tables:
+            fp = fingerprint(cursor, FINGERPRINTS[table])
+            changed |= self.prints.get(table) != fp
+            self.prints[table] = fp
+        return changed
+
+    def refresh_inputs(self, cursor):
+        from combined_stages import load_inputs
+
+        if self._changed(cursor, INPUT_TABLES) or self.inputs is None:
+            t = time.time()
+            cursor.execute("SELECT asset_rollup FROM asset_rollup_data")
+            self.asset_list = [row[0] for row in cursor.fetchall()]
+            self.inputs = load_inputs(cursor)
+            print(f"Invoer (transacties, sprinters, assets) geladen in {time.time() - t:.2f}s.")
+
+    def refresh_bars(self, cursor):
+        import pandas as pd
+        import price_matrix
+
+        if self._changed(cursor, PRICE_TABLES) or self.bars is None:
+            t = time.time()
+            price_matrix.BAR_CACHE = None
+            bars = price_matrix.load_matrix_bars(cursor, pd.Timestamp('1900-01-01'))
+            self.bars = bars.sort_values('datum', kind='stable').reset_index(drop=True)
+            print(f"{price_matrix.PRICE_TABLE}: {len(self.bars)} bars geladen in {time.time() - t:.2f}s.")
+        price_matrix.BAR_CACHE = self.slice_bars
+
+    def slice_bars(self, start_date, end_date=None):
+        import pandas as pd
+
+        dates = self.bars['datum'].to_numpy()
+        lo = dates.searchsorted(pd.Timestamp(start_date).to_datetime64(), side='left')
+        hi = len(dates) if end_date is None else \
+            dates.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
+        return self.bars.iloc[lo:hi].reset_index(drop=True)
+
+
+class PipelineService:
+    def __init__(self):
+        self.databases = {}
+
+    def warm_up(self):
+        """Laadt de numba kernels (cache op schijf of compilatie) één keer."""
+        from option_kernels import warm_up
+
+        t = time.time()
+        source = warm_up()
+        print(f"Numba kernels geladen ({source}) in {time.time() - t:.2f}s.")
+
+    def state(self, db_path):
+        key = os.path.normcase(os.path.abspath(db_path))
+        if key not in self.databases:
+            self.databases[key] = DatabaseState(db_path)
+        return self.databases[key]
+
+    def run(self, message):
+        """Voert de stages van één verzoek uit. Geeft [(label, seconden), ...]."""
+        import pandas as pd
+        from combined_stages import run_window
+        from portfolio_rollup import refresh_rollups
+        from price_matrix import refresh_price_matrix
+        from risk_stats import refresh_risk
+
+        state = self.state(message['db'])
+        start_ts = pd.Timestamp(message.get('date') or
+                                pd.Timestamp('today') - pd.Timedelta(days=50)).normalize()
+        end_ts = pd.Timestamp('today').normalize()
+        timings = []
+        try:
+            cursor = state.cursor()
+            for stage in message.get('stages') or STAGES:
+                t = time.time()
+                if stage == '2':
+                    refresh_price_matrix(state.conn, cursor)
+                elif stage == '3-8':
+                    state.refresh_inputs(cursor)
+                    state.refresh_bars(cursor)
+                    n_inserted, n_updated, stage_timings = run_window(
+                        state.conn, cursor, state.db_path, state.asset_list, state.inputs,
+                        start_ts, end_ts, trading_days=message.get('trading_days', False),
+                        full_history=message.get('full_history', False)
+                    )
+                    print(f"per_dag_asset_result: {n_inserted} ingevoegd, {n_updated} bijgewerkt.")
+                    timings.extend((f"  {label}", dt) for label, dt in stage_timings)
+                elif stage == '9':
+                    refresh_rollups(state.conn, cursor, start_ts, per_sector=message.get('per_sector', False))
+                elif stage == '12':
+                    state.refresh_bars(cursor)
+                    refresh_risk(state.conn, cursor, start_ts)
+                else:
+                    raise ValueError(f"Onbekende stage {stage!r}; kies uit {', '.join(STAGES)}")
+                timings.append((f"stage {stage}", time.time() - t))
+            cursor.close()
+        except Exception:
+            # Verbinding kan half in een transactie staan: bij het volgende verzoek opnieuw openen
+            state.close()
+            raise
+        finally:
+            import price_matrix
+            price_matrix.BAR_CACHE = None
+        return timings
+
+    def handle(self, message):
+        log = io.StringIO()
+        t0 = time.time()
+        try:
+            with redirect_stdout(_Tee(sys.stdout, log)):
+                print(f"--- verzoek {message.get('db')} vanaf {message.get('date') or 'standaard'}, "
+                      f"stages {', '.join(message.get('stages') or STAGES)} ---")
+                timings = self.run(message)
+            return {'ok': True, 'log': log.getvalue(), 'timings': timings, 'seconds': time.time() - t0}
+        except Exception:
+            traceback.print_exc()
+            return {'ok': False, 'log': log.getvalue(), 'error': traceback.format_exc(),
+                    'seconds': time.time() - t0}
+
+    def close(self):
+        for state in self.databases.values():
+            state.close()
+
+
+def serve(port=DEFAULT_PORT):
+    """Start de service en verwerkt verzoeken één voor één tot een stop-verzoek."""
+    import startup_profile
+
+    service = PipelineService()
+    with startup_profile.timed('import pipeline modules'):
+        import combined_stages  # noqa: F401  (pandas, numba en de stagemodules)
+        import portfolio_rollup  # noqa: F401
+        import risk_stats  # noqa: F401
+    with startup_profile.timed('numba kernels'):
+        service.warm_up()
+    startup_profile.report('pipeline service')
+
+    with Listener(('127.0.0.1', port), authkey=authkey(create=True)) as listener:
+        print(f"Pipeline service luistert op 127.0.0.1:{port}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"Verbinding geweigerd: {e}")
+                    continue
+                stop = False
+                # Een client die wegvalt of een ongeldig bericht stuurt mag de service niet stoppen
+                try:
+                    with conn:
+                        message = conn.recv()
+                        if not isinstance(message, dict):
+                            conn.send({'ok': False, 'log': '', 'seconds': 0.0,
+                                       'error': f"Ongeldig verzoek ({type(message).__name__}), verwacht een dict"})
+                            continue
+                        stop = bool(message.get('stop'))
+                        if stop:
+                            conn.send({'ok': True, 'log': "Pipeline service gestopt.\n"})
+                        else:
+                            conn.send(service.handle(message))
+                except (EOFError, OSError) as e:
+                    print(f"Verbinding met client verbroken: {e!r}")
+                except Exception:
+                    traceback.print_exc()
+                if stop:
+                    break
+        finally:
+            service.close()
+    print("Pipeline service gestopt.")
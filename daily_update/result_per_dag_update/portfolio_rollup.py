@@ -0,0 +1,112 @@
+"""
+Gematerialiseerde portefeuille-totalen per dag.
+
+Elke database is één portefeuille; per_dag_portefeuille_result bevat per datum
+de som over alle assets van de resultaatkolommen van per_dag_asset_result.
+Optioneel per_dag_sector_result: dezelfde sommen per (datum, sector), met de
+sector uit asset_rollup_data.
+
+De pipeline werkt alleen de dagen vanaf de startdatum van de run bij (de dagen
+die de stages hebben aangeraakt); alleen gewijzigde rijen worden geschreven.
+Rapportages lezen dan O(dagen) rijen in plaats van over assets x dagen te sommeren.
+"""
+import pandas as pd
+
+from diff_writer import write_changed_rows
+from typed_load import read_frame
+
+SOURCE_TABLE = "per_dag_asset_result"
+PORTFOLIO_TABLE = "per_dag_portefeuille_result"
+SECTOR_TABLE = "per_dag_sector_result"
+
+ROLLUP_COLS = [
+    'waarde_bezit', 'asset_result', 'asset_fee',
+    'cumulative_aankoop_bedrag', 'cumulative_verkoop_bedrag',
+    'open_premie', 'asset_open_optie_waarde', 'optie_open_fee',
+    'hist_premie', 'optie_closed_fee',
+    'sprinter_resultaat', 'sprinter_fee',
+    'fees_dividend_belasting',
+]
+UNKNOWN_SECTOR = 'onbekend'
+
+
+def _ensure_table(conn, cursor, table, key_defs):
+    cols = ",\n".join(key_defs + [f"{c} DOUBLE" for c in ROLLUP_COLS + ['aantal_assets']])
+    key_names = ",".join(f"[{d.split()[0]}]" for d in key_defs)
+    try:
+        cursor.execute(f"CREATE TABLE {table} (\n{cols}\n)")
+        conn.commit()
+        cursor.execute(f"CREATE INDEX idx_{table}_key ON {table} ({key_names})")
+        conn.commit()
+        print(f"Table {table} created.")
+    except Exception:
+        conn.rollback()  # bestaat al
+
+
+def ensure_rollup_tables(conn, cursor, per_sector=False):
+    _ensure_table(conn, cursor, PORTFOLIO_TABLE, ['datum DATE'])
+    if per_sector:
+        _ensure_table(conn, cursor, SECTOR_TABLE, ['datum DATE', 'sector TEXT(255)'])
+
+
+def load_asset_rows(cursor, start_date, end_date=None):
+    """Resultaatkolommen van per_dag_asset_result voor het venster, in één query."""
+    query = (f"SELECT datum, asset_rollup, {', '.join(ROLLUP_COLS)} "
+             f"FROM {SOURCE_TABLE} WHERE datum >= ?")
+    params = [pd.Timestamp(start_date).to_pydatetime()]
+    if end_date is not None:
+        query += " AND datum <= ?"
+        params.append(pd.Timestamp(end_date).to_pydatetime())
+    df = read_frame(cursor, query, *params)
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    df[ROLLUP_COLS] = df[ROLLUP_COLS].astype(float)
+    return df
+
+
+def load_sectors(cursor):
+    """asset_rollup -> sector uit asset_rollup_data, of None als die kolom ontbreekt."""
+    columns = {row.column_name.lower() for row in cursor.columns(table='asset_rollup_data')}
+    if 'sector' not in columns:
+        return None
+    cursor.execute("SELECT asset_rollup, sector FROM asset_rollup_data")
+    return pd.Series({r[0]: r[1] for r in cursor.fetchall()}, dtype=object)
+
+
+def rollup(df_assets, group_cols):
+    """Som van ROLLUP_COLS (NULL telt als 0) en het aantal assets per groep."""
+    grouped = df_assets.groupby(group_cols, as_index=False, observed=True)
+    out = grouped[ROLLUP_COLS].sum()
+    out['aantal_assets'] = grouped['asset_rollup'].count()['asset_rollup'].astype(float).to_numpy()
+    return out
+
+
+def refresh_rollups(conn, cursor, start_date, end_date=None, per_sector=False):
+    """Herberekent de portefeuille- (en sector-)totalen vanaf start_date en schrijft alleen wijzigingen."""
+    ensure_rollup_tables(conn, cursor, per_sector)
+    df_assets = load_asset_rows(cursor, start_date, end_date)
+    value_cols = ROLLUP_COLS + ['aantal_assets']
+
+    write_changed_rows(
+        conn, cursor, PORTFOLIO_TABLE, rollup(df_assets, ['datum']),
+        key_cols=['datum'], value_cols=value_cols,
+        temp_table=f"Temp{PORTFOLIO_TABLE}",
+        start_date=start_date, end_date=end_date,
+        insert_missing=True, delete_vanished=True
+    )
+
+    if not per_sector:
+        return
+    sectors = load_sectors(cursor)
+    if sectors is None:
+        print(f"asset_rollup_data heeft geen kolom 'sector'; {SECTOR_TABLE} wordt overgeslagen.")
+        return
+    df_assets['sector'] = (
+        df_assets['asset_rollup'].astype(object).map(sectors).fillna(UNKNOWN_SECTOR).astype(str).astype('category')
+    )
+    write_changed_rows(
+        conn, cursor, SECTOR_TABLE, rollup(df_assets, ['datum', 'sector']),
+        key_cols=['datum', 'sector'], value_cols=value_cols,
+        temp_table=f"Temp{SECTOR_TABLE}",
+        start_date=start_date, end_date=end_date,
+        insert_missing=True, delete_vanished=True
+    )
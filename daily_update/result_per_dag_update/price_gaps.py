@@ -0,0 +1,216 @@
+"""
+Gat-index voor historical_data_correct: ontbrekende dagbars per symbool.
+
+Een symbool kan gaten hebben door overgeslagen contracten (fout 200/406),
+pacing-fouten die 1 A na één retry laat vallen, of dagen met een storing.
+scan_gaps vergelijkt per symbool de opgeslagen datums met de verwachte
+handelsdagen en geeft compacte ranges (gap_start, gap_end) terug.
+
+Verwachte handelsdagen komen uit de data zelf: een dag telt als handelsdag
+van een groep (standaard ib_currency) als minstens MIN_SHARE van de
+symbolen in die groep een bar heeft. Beursfeestdagen en de nog niet
+gesloten dag van vandaag vallen daardoor vanzelf weg. Per symbool wordt
+alleen gekeken vanaf zijn eerste bar in het scanvenster.
+
+De index staat in GAP_TABLE; refetch_requests zet hem om naar gerichte
+reqHistoricalData verzoeken (endDateTime + duration) voor 1 A --gaps.
+Gaten die na MAX_ATTEMPTS verzoeken blijven bestaan worden niet meer
+opgevraagd (bijv. handelsstop of delisting).
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from bulk_writer import bulk_insert
+from trading_calendar import MIN_SHARE, MIN_GROUP_SIZE
+from typed_load import read_frame
+
+BARS_TABLE = "historical_data_correct"
+GAP_TABLE = "historical_data_gaps"
+GAP_COLUMNS = ['symbol', 'asset_rollup', 'gap_start', 'gap_end', 'n_days', 'attempts', 'last_request']
+
+SCAN_DAYS = 365
+MAX_ATTEMPTS = 3
+
+# Ranges van één symbool die dichter dan dit (kalenderdagen) bij elkaar liggen
+# worden in één verzoek opgehaald
+MERGE_GAP_DAYS = 10
+
+
+def ensure_gap_table(conn, cursor):
+    try:
+        cursor.execute(f"""
+            CREATE TABLE {GAP_TABLE} (
+                symbol TEXT(255),
+                asset_rollup TEXT(255),
+                gap_start DATE,
+                gap_end DATE,
+                n_days LONG,
+                attempts LONG,
+                last_request DATE
+            )
+        """)
+        conn.commit()
+        print(f"Table {GAP_TABLE} created.")
+    except Exception:
+        conn.rollback()  # bestaat al
+
+
+def load_bar_dates(cursor, start_date, end_date=None):
+    """(datum, symbol, asset_rollup) van alle bars in [start_date, end_date]."""
+    query = f"SELECT datum, symbol, asset_rollup FROM {BARS_TABLE} WHERE datum >= ?"
+    params = [pd.Timestamp(start_date).to_pydatetime()]
+    if end_date is not None:
+        query += " AND datum <= ?"
+        params.append(pd.Timestamp(end_date).to_pydatetime())
+    df = read_frame(cursor, query, *params)
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    return df
+
+
+def _missing_runs(present, expected):
+    """
+    present: bool matrix dagen x symbolen, expected: bool per dag.
+    Geeft (symbool-index, eerste dag-index, laatste dag-index, aantal) per
+    aaneengesloten reeks ontbrekende verwachte dagen; niet-verwachte dagen
+    onderbreken een reeks niet.
+    """
+    exp_idx = np.flatnonzero(expected)
+    if len(exp_idx) == 0 or present.shape[1] == 0:
+        return np.empty((0, 4), dtype=np.int64)
+
+    seen = np.maximum.accumulate(present, axis=0)  # vanaf de eerste bar van het symbool
+    missing = (~present & seen)[exp_idx]
+    before = np.vstack([np.zeros((1, missing.shape[1]), dtype=bool), missing[:-1]])
+    after = np.vstack([missing[1:], np.zeros((1, missing.shape[1]), dtype=bool)])
+
+    # column-major zodat starts en ends per symbool in dezelfde volgorde staan
+    s_sym, s_pos = np.nonzero((missing & ~before).T)
+    e_sym, e_pos = np.nonzero((missing & ~after).T)
+    return np.column_stack([s_sym, exp_idx[s_pos], exp_idx[e_pos], e_pos - s_pos + 1])
+
+
+def scan_gaps(df_bars, groups=None, start_date=None, end_date=None,
+              min_share=MIN_SHARE, min_group_size=MIN_GROUP_SIZE):
+    """
+    Ontbrekende handelsdagen per symbool als ranges.
+    df_bars: datum, symbol, asset_rollup. groups: optioneel dict/Series
+    symbol -> groep (kleine of onbekende groepen gebruiken de kalender van alle symbolen).
+    Kolommen: symbol, asset_rollup, gap_start, gap_end, n_days.
+    """
+    out_cols = ['symbol', 'asset_rollup', 'gap_start', 'gap_end', 'n_days']
+    bars = df_bars.dropna(subset=['datum', 'symbol'])
+    if bars.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    symbols = pd.Index(bars['symbol'].astype(object).unique())
+    start = pd.Timestamp(start_date).normalize() if start_date is not None else bars['datum'].min()
+    end = pd.Timestamp(end_date).normalize() if end_date is not None else bars['datum'].max()
+    days = pd.date_range(start, end, freq='D')
+
+    present = np.zeros((len(days), len(symbols)), dtype=bool)
+    d_idx = days.get_indexer(bars['datum'])
+    s_idx = symbols.get_indexer(bars['symbol'].astype(object))
+    ok = d_idx >= 0
+    present[d_idx[ok], s_idx[ok]] = True
+
+    group_of = pd.Series(groups if groups is not None else {}, dtype=object).reindex(symbols)
+    sizes = group_of.map(group_of.value_counts())
+    group_of[group_of.isna() | (sizes < min_group_size)] = None
+
+    runs = []
+    for group in group_of.unique():
+        cols = np.flatnonzero(group_of.isna() if group is None else (group_of == group).to_numpy())
+        expected = present[:, cols].mean(axis=1) >= min_share
+        found = _missing_runs(present[:, cols], expected)
+        found[:, 0] = cols[found[:, 0]]
+        runs.append(found)
+    runs = np.vstack(runs)
+    if len(runs) == 0:
+        return pd.DataFrame(columns=out_cols)
+
+    rollup_of = (bars.assign(symbol=bars['symbol'].astype(object))
+                 .drop_duplicates('symbol', keep='last')
+                 .set_index('symbol')['asset_rollup'].astype(object))
+    gaps = pd.DataFrame({
+        'symbol': symbols[runs[:, 0]].to_numpy(),
+        'gap_start': days[runs[:, 1]],
+        'gap_end': days[runs[:, 2]],
+        'n_days': runs[:, 3],
+    })
+    gaps.insert(1, 'asset_rollup', gaps['symbol'].map(rollup_of).to_numpy())
+    return gaps.sort_values(['symbol', 'gap_start']).reset_index(drop=True)
+
+
+def load_gap_index(cursor):
+    df = read_frame(cursor, f"SELECT {', '.join(GAP_COLUMNS)} FROM {GAP_TABLE}")
+    for col in ('gap_start', 'gap_end', 'last_request'):
+        df[col] = pd.to_datetime(df[col]).dt.normalize()
+    return df
+
+
+def refresh_gap_index(conn, cursor, groups=None, scan_days=SCAN_DAYS, end_date=None):
+    """
+    Scant de laatste scan_days dagen opnieuw en vervangt GAP_TABLE. attempts en
+    last_request blijven behouden voor ranges die ongewijzigd terugkomen.
+    """
+    ensure_gap_table(conn, cursor)
+    end_ts = pd.Timestamp(end_date if end_date is not None else 'today').normalize()
+    start_ts = end_ts - pd.Timedelta(days=scan_days)
+
+    gaps = scan_gaps(load_bar_dates(cursor, start_ts, end_ts), groups, start_ts, end_ts)
+    old = load_gap_index(cursor)
+    keys = ['symbol', 'gap_start', 'gap_end']
+    gaps = gaps.merge(
+        old[keys + ['attempts', 'last_request']].astype({'symbol': object}),
+        on=keys, how='left'
+    )
+    gaps['attempts'] = gaps['attempts'].fillna(0).astype(int)
+
+    cursor.execute(f"DELETE FROM {GAP_TABLE}")
+    bulk_insert(conn, cursor, GAP_TABLE, gaps, GAP_COLUMNS)
+    conn.commit()
+    print(f"{GAP_TABLE}: {len(gaps)} ranges, {int(gaps['n_days'].sum())} ontbrekende dagen "
+          f"over {gaps['symbol'].nunique()} symbolen.")
+    return gaps
+
+
+def _ib_duration(n_days):
+    # IB accepteert "D" tot 365 dagen, daarboven jaren
+    return f"{n_days} D" if n_days <= 365 else f"{math.ceil(n_days / 365)} Y"
+
+
+def refetch_requests(gaps, max_attempts=MAX_ATTEMPTS, merge_gap_days=MERGE_GAP_DAYS):
+    """
+    Eén verzoek per cluster van ranges per symbool.
+    Kolommen: symbol, asset_rollup, req_start, req_end, end_datetime, duration.
+    """
+    out_cols = ['symbol', 'asset_rollup', 'req_start', 'req_end', 'end_datetime', 'duration']
+    todo = gaps[gaps['attempts'] < max_attempts].sort_values(['symbol', 'gap_start'])
+    if todo.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    prev_end = todo.groupby('symbol', observed=True)['gap_end'].shift(1)
+    new_cluster = prev_end.isna() | ((todo['gap_start'] - prev_end).dt.days > merge_gap_days)
+    requests = todo.groupby(new_cluster.cumsum()).agg(
+        symbol=('symbol', 'first'), asset_rollup=('asset_rollup', 'first'),
+        req_start=('gap_start', 'min'), req_end=('gap_end', 'max'),
+    ).reset_index(drop=True)
+
+    span = (requests['req_end'] - requests['req_start']).dt.days + 1
+    requests['end_datetime'] = requests['req_end'].dt.strftime('%Y%m%d') + '-23:59:59'
+    requests['duration'] = span.map(_ib_duration)
+    return requests[out_cols]
+
+
+def mark_requested(conn, cursor, requests, today=None):
+    """Verhoogt attempts voor alle ranges die binnen een verstuurd verzoek vallen."""
+    today = pd.Timestamp(today if today is not None else 'today').normalize().to_pydatetime()
+    for r in requests.itertuples(index=False):
+        cursor.execute(
+            f"UPDATE {GAP_TABLE} SET attempts = attempts + 1, last_request = ? "
+            f"WHERE symbol = ? AND gap_start >= ? AND gap_end <= ?",
+            today, r.symbol, r.req_start.to_pydatetime(), r.req_end.to_pydatetime()
+        )
+    conn.commit()
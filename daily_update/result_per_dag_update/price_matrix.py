@@ -0,0 +1,213 @@
+"""
+Gematerialiseerde dagelijkse prijsmatrix per asset: per_dag_asset_prijs.
+
+Per (datum, asset_rollup) met een bar:
+  close_raw              ruwe slotkoers van die dag
+  multiplier_close_price multiplier van die bar
+  close_adj              close_raw * multiplier_close_price
+
+De tabel wordt incrementeel bijgewerkt: alleen vanaf de vroegste datum waarop
+een bar of multiplier is gewijzigd (of vanaf het einde van de matrix) wordt
+opnieuw gerekend, en alleen gewijzigde rijen worden weggeschreven.
+Stages vragen prijzen op via lookup_prices() met hun eigen terugkijkvenster
+en zero_policy (as-of over de bars in de matrix).
+"""
+import numpy as np
+import pandas as pd
+
+from asof_prices import AsofPrices
+from diff_writer import diff_rows, write_changed_rows
+from typed_load import read_frame
+
+PRICE_TABLE = "per_dag_asset_prijs"
+SOURCE_TABLE = "hist_data_per_asset_symbol"
+
+# Standaard terugkijkvenster (kalenderdagen) van lookup_prices
+PRICE_LOOKBACK_DAYS = 10
+
+# Gerealiseerde volatiliteit: venster in bars (handelsdagen)
+VOL_WINDOW_BARS = 60
+VOL_MIN_BARS = 20
+TRADING_DAYS_PER_YEAR = 252
+
+KEY_COLS = ['datum', 'asset_rollup']
+VALUE_COLS = ['close_raw', 'multiplier_close_price', 'close_adj']
+
+# Optionele cache voor load_matrix_bars, gezet door de pipeline service:
+# functie (start_date, end_date) -> bars; None = lezen uit de database
+BAR_CACHE = None
+
+
+def ensure_price_matrix_table(conn, cursor):
+    try:
+        cursor.execute(f"""
+            CREATE TABLE {PRICE_TABLE} (
+                datum DATE,
+                asset_rollup TEXT(255),
+                close_raw DOUBLE,
+                multiplier_close_price DOUBLE,
+                close_adj DOUBLE
+            )
+        """)
+        conn.commit()
+        cursor.execute(f"CREATE INDEX idx_{PRICE_TABLE}_datum_asset ON {PRICE_TABLE} ([datum],[asset_rollup])")
+        conn.commit()
+        print(f"Table {PRICE_TABLE} created.")
+    except Exception:
+        conn.rollback()  # bestaat al
+
+
+def load_source_bars(cursor, asset_list=None):
+    """Leest (asset_rollup, datum, close, multiplier) uit hist_data_per_asset_symbol."""
+    df = read_frame(cursor, f"SELECT asset_rollup, datum, close, multiplier_close_price FROM {SOURCE_TABLE}")
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    df['close'] = df['close'].astype(float)
+    df['multiplier_close_price'] = df['multiplier_close_price'].astype(float)
+    if asset_list is not None:
+        df = df[df['asset_rollup'].isin(asset_list)]
+    # Eén bar per asset per dag (laatste wint, zoals pivot_table(aggfunc='last'))
+    return df.drop_duplicates(subset=['asset_rollup', 'datum'], keep='last').reset_index(drop=True)
+
+
+def build_price_matrix(df_bars, start_ts, end_ts):
+    """Matrixrijen voor [start_ts, end_ts]: één rij per bar met close_raw en close_adj."""
+    start_ts = pd.Timestamp(start_ts).normalize()
+    end_ts = pd.Timestamp(end_ts).normalize()
+    bars = df_bars[
+        (df_bars['datum'] >= start_ts) & (df_bars['datum'] <= end_ts) & df_bars['close'].notna()
+    ].rename(columns={'close': 'close_raw'})
+    if bars.empty:
+        return pd.DataFrame(columns=KEY_COLS + VALUE_COLS)
+    bars = bars.assign(close_adj=bars['close_raw'] * bars['multiplier_close_price'])
+    return (
+        bars[KEY_COLS + VALUE_COLS].astype({c: float for c in VALUE_COLS})
+        .sort_values(KEY_COLS, kind='stable').reset_index(drop=True)
+    )
+
+
+def _first_dirty_date(cursor, df_bars, end_ts):
+    """
+    Vroegste datum vanaf waar de matrix opnieuw berekend moet worden:
+    gewijzigde/nieuwe/verdwenen bars of multipliers, of het einde van de matrix.
+    None = matrix is actueel.
+    """
+    df_stored = read_frame(cursor, f"""
+        SELECT datum, asset_rollup, close_raw, multiplier_close_price
+        FROM {PRICE_TABLE}
+        WHERE close_raw IS NOT NULL
+    """)
+    if df_stored.empty:
+        return df_bars['datum'].min() if not df_bars.empty else None
+
+    df_src = df_bars[df_bars['close'].notna()].rename(columns={'close': 'close_raw'})
+    df_insert, df_changed, df_vanished = diff_rows(
+        df_src[['datum', 'asset_rollup', 'close_raw', 'multiplier_close_price']],
+        df_stored, KEY_COLS, ['close_raw', 'multiplier_close_price']
+    )
+    candidates = [d['datum'].min() for d in (df_insert, df_changed, df_vanished) if not d.empty]
+
+    stored_end = pd.to_datetime(df_stored['datum']).max().normalize()
+    if stored_end < end_ts:
+        candidates.append(stored_end + pd.Timedelta(days=1))
+    return min(candidates) if candidates else None
+
+
+def refresh_price_matrix(conn, cursor, asset_list=None, end_date=None):
+    """Werkt per_dag_asset_prijs incrementeel bij. Geeft het herberekende startpunt terug."""
+    ensure_price_matrix_table(conn, cursor)
+    end_ts = pd.Timestamp(end_date if end_date is not None else 'today').normalize()
+
+    df_bars = load_source_bars(cursor, asset_list)
+    dirty_ts = _first_dirty_date(cursor, df_bars, end_ts)
+    if dirty_ts is None:
+        print(f"{PRICE_TABLE} is actueel, niets te doen.")
+        return None
+
+    dirty_ts = pd.Timestamp(dirty_ts).normalize()
+    print(f"{PRICE_TABLE}: herberekenen vanaf {dirty_ts.date()} t/m {end_ts.date()}")
+    df_matrix = build_price_matrix(df_bars, dirty_ts, end_ts)
+
+    write_changed_rows(
+        conn, cursor, PRICE_TABLE, df_matrix,
+        key_cols=KEY_COLS, value_cols=VALUE_COLS,
+        temp_table=f"Temp{PRICE_TABLE}",
+        start_date=dirty_ts, end_date=end_ts,
+        insert_missing=True, delete_vanished=True
+    )
+    return dirty_ts
+
+
+def load_matrix_bars(cursor, start_date, end_date=None):
+    """Leest de echte bars (close_raw niet NULL) uit de matrix voor [start_date, end_date]."""
+    if BAR_CACHE is not None:
+        return BAR_CACHE(start_date, end_date)
+    query = f"""
+        SELECT datum, asset_rollup, close_raw, multiplier_close_price, close_adj
+        FROM {PRICE_TABLE}
+        WHERE close_raw IS NOT NULL AND datum >= ?
+    """
+    params = [pd.Timestamp(start_date).to_pydatetime()]
+    if end_date is not None:
+        query += " AND datum <= ?"
+        params.append(pd.Timestamp(end_date).to_pydatetime())
+    df = read_frame(cursor, query, *params)
+    cols = list(df.columns)
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    df[cols[2:]] = df[cols[2:]].astype(float)
+    return df
+
+
+def lookup_prices(cursor, assets, dates, lookback_days=PRICE_LOOKBACK_DAYS,
+                  zero_policy='skip', fill_value=np.nan):
+    """
+    As-of close (raw en adjusted) voor elke (asset, datum) query, in één
+    gevectoriseerde lookup over de bars uit de matrix.
+    Geeft een DataFrame met asset_rollup, datum, close_raw, close_adj, bar_age.
+    """
+    queries = pd.DataFrame({
+        'asset_rollup': np.asarray(assets, dtype=object),
+        'datum': pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(),
+    })
+    if queries.empty:
+        return queries.assign(close_raw=np.nan, close_adj=np.nan, bar_age=np.nan)
+
+    bars = load_matrix_bars(
+        cursor,
+        queries['datum'].min() - pd.Timedelta(days=lookback_days),
+        queries['datum'].max()
+    )
+    found = AsofPrices(bars, ['close_raw', 'close_adj'], zero_policy=zero_policy).lookup(
+        queries['asset_rollup'], queries['datum'], lookback_days, fill_value
+    )
+    return pd.concat([queries, found], axis=1)
+
+
+def lookup_volatility(cursor, assets, dates, window_bars=VOL_WINDOW_BARS,
+                      min_bars=VOL_MIN_BARS, fill_value=np.nan):
+    """
+    Gerealiseerde jaarvolatiliteit (std van dagelijkse log-returns van close_adj
+    over de laatste `window_bars` bars) per (asset, datum) query, as-of opgezocht.
+    """
+    queries = pd.DataFrame({
+        'asset_rollup': np.asarray(assets, dtype=object),
+        'datum': pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(),
+    })
+    if queries.empty:
+        return np.empty(0, dtype=np.float64)
+
+    # Ruime kalenderbuffer zodat er `window_bars` handelsdagen vóór de eerste query zijn
+    bars = load_matrix_bars(
+        cursor,
+        queries['datum'].min() - pd.Timedelta(days=2 * window_bars + PRICE_LOOKBACK_DAYS),
+        queries['datum'].max()
+    )
+    bars = bars[bars['close_adj'] > 0].sort_values(['asset_rollup', 'datum'])
+    bars['log_ret'] = np.log(bars['close_adj']).groupby(bars['asset_rollup'], observed=True).diff()
+    bars['volatility'] = bars.groupby('asset_rollup', observed=True)['log_ret'].transform(
+        lambda r: r.rolling(window_bars, min_periods=min_bars).std()
+    ) * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    found = AsofPrices(bars, ['volatility'], zero_policy='keep').lookup(
+        queries['asset_rollup'], queries['datum'], PRICE_LOOKBACK_DAYS, fill_value
+    )
+    return found['volatility'].to_numpy()
@@ -0,0 +1,78 @@
+"""
+Herberekening van de volledige historie in tijdvensters (--rebuild).
+
+De historie wordt in vensters van WINDOW_DAYS doorlopen. Cumulatieve standen
+(posities, bedragen, fees, dividend) gaan via de opgeslagen rijen van het
+vorige venster mee: stocks en dividends starten vanaf de stand op
+venster_start - 1, de optie- en sprinter-engines tellen per contract vanaf de
+eerste transactie en klappen alleen het venster uit. Per venster wordt
+geschreven en gecommit en wordt het voltooide venster vastgelegd in
+PROGRESS_TABLE; een onderbroken rebuild met dezelfde startdatum gaat verder
+na het laatst voltooide venster (een half geschreven venster wordt gewoon
+opnieuw gedaan, de diff-upsert is idempotent).
+"""
+import pandas as pd
+
+PROGRESS_TABLE = "rebuild_voortgang"
+WINDOW_DAYS = 90
+
+
+def ensure_progress_table(conn, cursor):
+    try:
+        cursor.execute(f"""
+            CREATE TABLE {PROGRESS_TABLE} (
+                rebuild_start DATE,
+                window_end DATE,
+                voltooid DATETIME
+            )
+        """)
+        conn.commit()
+        print(f"Table {PROGRESS_TABLE} created.")
+    except Exception:
+        conn.rollback()  # bestaat al
+
+
+def first_transaction_date(cursor):
+    """Vroegste transactiedatum (genormaliseerd), of None zonder transacties."""
+    cursor.execute("SELECT MIN(datum) FROM transacties_bron_data")
+    row = cursor.fetchone()
+    return None if row is None or row[0] is None else pd.Timestamp(row[0]).normalize()
+
+
+def windows(start_date, end_date, window_days=WINDOW_DAYS):
+    """[(venster_start, venster_eind), ...] aaneensluitend over [start_date, end_date]."""
+    starts = pd.date_range(pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize(),
+                           freq=f'{window_days}D')
+    end_ts = pd.Timestamp(end_date).normalize()
+    return [(s, min(s + pd.Timedelta(days=window_days - 1), end_ts)) for s in starts]
+
+
+def completed_until(cursor, rebuild_start):
+    """Eind van het laatst voltooide venster van deze rebuild, of None."""
+    cursor.execute(
+        f"SELECT MAX(window_end) FROM {PROGRESS_TABLE} WHERE rebuild_start = ?",
+        pd.Timestamp(rebuild_start).to_pydatetime()
+    )
+    row = cursor.fetchone()
+    return None if row is None or row[0] is None else pd.Timestamp(row[0]).normalize()
+
+
+def mark_window_done(conn, cursor, rebuild_start, window_end):
+    cursor.execute(
+        f"INSERT INTO {PROGRESS_TABLE} (rebuild_start, window_end, voltooid) VALUES (?, ?, ?)",
+        pd.Timestamp(rebuild_start).to_pydatetime(), pd.Timestamp(window_end).to_pydatetime(),
+        pd.Timestamp.now().to_pydatetime()
+    )
+    conn.commit()
+
+
+def pending_windows(conn, cursor, rebuild_start, end_date, window_days=WINDOW_DAYS):
+    """Vensters die nog gedaan moeten worden (na het laatst voltooide venster)."""
+    ensure_progress_table(conn, cursor)
+    all_windows = windows(rebuild_start, end_date, window_days)
+    done = completed_until(cursor, rebuild_start)
+    todo = [w for w in all_windows if done is None or w[1] > done]
+    if done is not None:
+        print(f"Rebuild vanaf {pd.Timestamp(rebuild_start).date()}: hervat na {done.date()}, "
+              f"{len(todo)} van {len(all_windows)} vensters te gaan.")
+    return todo, len(all_windows)
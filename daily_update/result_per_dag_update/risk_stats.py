@@ -0,0 +1,335 @@
+"""
+Rollende risicostatistieken per asset en per portefeuille (stage 12).
+
+Per handelsdag (trading_calendar) en asset_rollup:
+  totaal_resultaat     som van RESULT_PARTS uit per_dag_asset_result
+  kapitaal             waarde_bezit (basis voor het rendement)
+  dag_resultaat        totaal_resultaat - totaal_resultaat vorige handelsdag
+  rendement            dag_resultaat / kapitaal vorige handelsdag (NULL zonder kapitaal)
+  benchmark_rendement  dagrendement van de AEX (INDEX_SYMBOLS, zoals _is_index_symbol in stage 1A)
+  index_waarde/_piek   cumulatief rendement (start 1) en het hoogste punt tot nu toe
+  drawdown             index_waarde / index_piek - 1; max_drawdown het diepste punt
+  volatiliteit         jaarvolatiliteit van rendement over de laatste WINDOW_DAYS handelsdagen
+  beta                 cov(rendement, benchmark) / var(benchmark) over hetzelfde venster
+
+Het venster wordt incrementeel bijgehouden: elke rij bewaart de sommen over
+het venster (SUM_COLS). Een nieuwe dag telt zijn eigen bijdrage op en trekt die
+van de dag die uit het venster valt af (opgeslagen rendement en
+benchmark_rendement van WINDOW_DAYS handelsdagen terug), dus O(assets) per dag
+zonder de historie opnieuw te lezen. De portefeuille (som over alle assets)
+krijgt dezelfde kolommen in een eigen tabel.
+
+Een asset heeft niet elke handelsdag een rij, maar het venster schuift wel
+door. Een vervolgrun start daarom per asset vanaf zijn laatste opgeslagen rij
+en trekt eerst de vertrekkende dagen af van de dagen die hij daarna miste;
+daarvoor worden de laatste 2 x WINDOW_DAYS opgeslagen dagen gelezen.
+Assets die WINDOW_DAYS handelsdagen geen rij hebben, beginnen opnieuw (in een
+doorlopende run en in een vervolgrun gelijk).
+"""
+import numpy as np
+import pandas as pd
+
+from diff_writer import write_changed_rows
+from price_matrix import lookup_prices, TRADING_DAYS_PER_YEAR
+from typed_load import read_frame
+import trading_calendar
+
+SOURCE_TABLE = "per_dag_asset_result"
+ASSET_TABLE = "per_dag_asset_risico"
+PORTFOLIO_TABLE = "per_dag_portefeuille_risico"
+
+# Voorkeursvolgorde van de benchmark-symbolen
+INDEX_SYMBOLS = ('AEX', '^AEX', 'EOE')
+
+WINDOW_DAYS = 60
+MIN_OBS = 20
+
+# Kolommen die samen het resultaat van een asset vormen (fees met hun opgeslagen teken)
+RESULT_PARTS = [
+    'asset_result', 'asset_fee',
+    'open_premie', 'asset_open_optie_waarde', 'optie_open_fee',
+    'hist_premie', 'optie_closed_fee',
+    'sprinter_resultaat', 'sprinter_fee',
+    'fees_dividend_belasting',
+]
+CAPITAL_COL = 'waarde_bezit'
+
+# Venstersommen: alle rendementen (vol) en de paren met een benchmark (beta)
+SUM_COLS = ['n_obs', 'som_r', 'som_rr', 'n_paar', 'som_paar_r', 'som_b', 'som_bb', 'som_rb']
+VALUE_COLS = [
+    'totaal_resultaat', 'kapitaal', 'dag_resultaat', 'rendement', 'benchmark_rendement',
+    'index_waarde', 'index_piek', 'drawdown', 'max_drawdown',
+    'volatiliteit', 'beta',
+] + SUM_COLS
+STATE_COLS = ['totaal_resultaat', 'kapitaal', 'index_waarde', 'index_piek', 'max_drawdown'] + SUM_COLS
+
+
+def _ensure_table(conn, cursor, table, key_defs):
+    cols = ",\n".join(key_defs + [f"{c} DOUBLE" for c in VALUE_COLS])
+    key_names = ",".join(f"[{d.split()[0]}]" for d in key_defs)
+    try:
+        cursor.execute(f"CREATE TABLE {table} (\n{cols}\n)")
+        conn.commit()
+        cursor.execute(f"CREATE INDEX idx_{table}_key ON {table} ({key_names})")
+        conn.commit()
+        print(f"Table {table} created.")
+    except Exception:
+        conn.rollback()  # bestaat al
+
+
+def ensure_risk_tables(conn, cursor):
+    _ensure_table(conn, cursor, ASSET_TABLE, ['datum DATE', 'asset_rollup TEXT(255)'])
+    _ensure_table(conn, cursor, PORTFOLIO_TABLE, ['datum DATE'])
+
+
+def benchmark_asset(cursor):
+    """asset_rollup van de AEX in asset_rollup_data, of None."""
+    cursor.execute("SELECT asset_rollup, ib_symbol FROM asset_rollup_data")
+    by_symbol = {str(sym or '').strip().upper(): asset for asset, sym in cursor.fetchall()}
+    return next((by_symbol[s] for s in INDEX_SYMBOLS if s in by_symbol), None)
+
+
+def stored_days(cursor, before, n=2 * WINDOW_DAYS):
+    """De laatste n opgeslagen handelsdagen vóór `before` (oplopend)."""
+    cursor.execute(
+        f"SELECT TOP {int(n)} datum FROM {PORTFOLIO_TABLE} WHERE datum < ? ORDER BY datum DESC",
+        pd.Timestamp(before).to_pydatetime()
+    )
+    return pd.DatetimeIndex(sorted(pd.Timestamp(r[0]).normalize() for r in cursor.fetchall()))
+
+
+def _load_stored(cursor, table, days, key_cols):
+    if len(days) == 0:
+        return pd.DataFrame(columns=key_cols + VALUE_COLS)
+    df = read_frame(cursor, f"SELECT * FROM {table} WHERE datum >= ? AND datum <= ?",
+                    days[0].to_pydatetime(), days[-1].to_pydatetime())
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    df[VALUE_COLS] = df[VALUE_COLS].astype(float)
+    return df[df['datum'].isin(days)]
+
+
+def load_results(cursor, start_date, end_date, days):
+    """totaal_resultaat en kapitaal per (datum, asset_rollup) op de dagen `days`."""
+    df = read_frame(cursor, f"""
+        SELECT datum, asset_rollup, {', '.join(RESULT_PARTS + [CAPITAL_COL])}
+        FROM {SOURCE_TABLE} WHERE datum >= ? AND datum <= ?
+    """, pd.Timestamp(start_date).to_pydatetime(), pd.Timestamp(end_date).to_pydatetime())
+    df['datum'] = pd.to_datetime(df['datum']).dt.normalize()
+    df = df[df['datum'].isin(days)]
+    return pd.DataFrame({
+        'datum': df['datum'].to_numpy(),
+        'asset_rollup': df['asset_rollup'].astype(object).to_numpy(),
+        'totaal_resultaat': df[RESULT_PARTS].astype(float).fillna(0.0).sum(axis=1).to_numpy(),
+        'kapitaal': df[CAPITAL_COL].astype(float).fillna(0.0).to_numpy(),
+    })
+
+
+def benchmark_returns(cursor, asset, prev_day, days):
+    """Dagrendement van de benchmark op `days` t.o.v. de vorige handelsdag (NaN zonder koers)."""
+    if asset is None:
+        return np.full(len(days), np.nan)
+    dates = pd.DatetimeIndex(([prev_day] if prev_day is not None else []) + list(days))
+    close = lookup_prices(cursor, [asset] * len(dates), dates)['close_adj'].to_numpy()
+    close = np.where(close > 0, close, np.nan)
+    if prev_day is None:
+        close = np.concatenate([[np.nan], close])
+    return close[1:] / close[:-1] - 1.0
+
+
+def _add_to_window(s, sign, rr, bb, keys=slice(None)):
+    """Telt de bijdrage van één dag (rendement rr, benchmark bb) op bij de venstersommen (sign -1: eraf)."""
+    ok = np.isfinite(rr)
+    pair = ok & np.isfinite(bb)
+    r0 = np.where(ok, rr, 0.0)
+    rp = np.where(pair, rr, 0.0)
+    b0 = np.where(pair, bb, 0.0)
+    s['n_obs'][keys] += sign * ok
+    s['som_r'][keys] += sign * r0
+    s['som_rr'][keys] += sign * r0 * r0
+    s['n_paar'][keys] += sign * pair
+    s['som_paar_r'][keys] += sign * rp
+    s['som_b'][keys] += sign * b0
+    s['som_bb'][keys] += sign * b0 * b0
+    s['som_rb'][keys] += sign * rp * b0
+
+
+def _reset(s, keys):
+    """Keys zonder rij in het hele venster: stand weg, sommen 0 (beginnen opnieuw)."""
+    for c in STATE_COLS:
+        s[c][keys] = 0.0 if c in SUM_COLS else np.nan
+
+
+def roll_window(total, capital, present, bench, state, hist_r, hist_b, absent=None,
+                window_days=WINDOW_DAYS, min_obs=MIN_OBS):
+    """
+    Werkt de vensterstatistieken dag voor dag bij.
+    total, capital, present: (nieuwe dagen x keys); bench: (nieuwe dagen,)
+    state: dict STATE_COLS -> (keys,) stand op de vorige handelsdag (NaN = geen stand)
+    hist_r/hist_b: (opgeslagen dagen x keys) rendement/benchmark van de opgeslagen
+    dagen direct vóór de nieuwe dagen (minstens window_days, of alle).
+    absent: (keys,) handelsdagen sinds de laatste rij van elke key (state is dan al
+    bijgewerkt voor die dagen, zie _state_at); None = 0.
+    Geeft dict VALUE_COLS -> (nieuwe dagen x keys); rijen zonder present zijn NaN.
+    """
+    n_days, n_keys = total.shape
+    n_stored = len(hist_r)
+    out = {c: np.full((n_days, n_keys), np.nan) for c in VALUE_COLS}
+    s = {c: np.array(v, dtype=float) for c, v in state.items()}
+    for c in SUM_COLS:
+        s[c] = np.nan_to_num(s[c])
+    ann = np.sqrt(TRADING_DAYS_PER_YEAR)
+    no_leaving = np.full(n_keys, np.nan)
+    absent = np.zeros(n_keys) if absent is None else np.array(absent, dtype=float)
+
+    for d in range(n_days):
+        here = present[d]
+        b = np.full(n_keys, bench[d])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            pnl = total[d] - s['totaal_resultaat']
+            r = np.where(s['kapitaal'] > 0, pnl / s['kapitaal'], np.nan)
+        r = np.where(here, r, np.nan)
+
+        # de dag die uit het venster valt: opgeslagen, of eerder in deze run berekend
+        p = n_stored + d - window_days
+        if p < 0:
+            leaving = (no_leaving, no_leaving)
+        elif p < n_stored:
+            leaving = (hist_r[p], hist_b[p])
+        else:
+            leaving = (out['rendement'][p - n_stored], out['benchmark_rendement'][p - n_stored])
+
+        # bijdrage van vandaag erbij, die van de vertrekkende dag eraf
+        _add_to_window(s, 1.0, r, b)
+        _add_to_window(s, -1.0, *leaving)
+
+        # cumulatieve index en drawdown (nieuwe key start op 1)
+        index_prev = np.where(np.isnan(s['index_waarde']), 1.0, s['index_waarde'])
+        index_now = np.where(np.isfinite(r), index_prev * (1.0 + r), index_prev)
+        peak = np.fmax(np.where(np.isnan(s['index_piek']), 1.0, s['index_piek']), index_now)
+        drawdown = index_now / peak - 1.0
+        max_dd = np.fmin(s['max_drawdown'], drawdown)
+
+        n, n_p = s['n_obs'], s['n_paar']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var_r = (s['som_rr'] - s['som_r'] ** 2 / n) / (n - 1)
+            cov_rb = s['som_rb'] - s['som_paar_r'] * s['som_b'] / n_p
+            var_b = s['som_bb'] - s['som_b'] ** 2 / n_p
+            vol = np.where(n >= min_obs, np.sqrt(np.clip(var_r, 0.0, None)) * ann, np.nan)
+            beta = np.where((n_p >= min_obs) & (var_b > 0), cov_rb / var_b, np.nan)
+
+        # stand bijwerken voor keys met een rij vandaag
+        for c, v in (('totaal_resultaat', total[d]), ('kapitaal', capital[d]), ('index_waarde', index_now),
+                     ('index_piek', peak), ('max_drawdown', max_dd)):
+            s[c] = np.where(here, v, s[c])
+        absent = np.where(here, 0.0, absent + 1.0)
+        _reset(s, absent >= window_days)
+
+        row = dict(s, dag_resultaat=pnl, rendement=r, benchmark_rendement=b,
+                   drawdown=drawdown, volatiliteit=vol, beta=beta)
+        for c in VALUE_COLS:
+            out[c][d] = np.where(here, row[c], np.nan)
+    return out
+
+
+def _state_at(stored, key_col, keys, history, hist_r, hist_b, window_days=WINDOW_DAYS):
+    """
+    Stand per key op de laatste opgeslagen dag: de laatste opgeslagen rij van de
+    key, bijgewerkt voor de dagen daarna waarop hij geen rij had (het venster
+    schoof door, dus de vertrekkende dagen gaan er nog af). Geeft (state, absent).
+    """
+    n_stored = len(history)
+    last = stored.sort_values('datum').drop_duplicates(key_col, keep='last').set_index(key_col)
+    state = {c: last[c].reindex(keys).to_numpy(dtype=float, copy=True) for c in STATE_COLS}
+    for c in SUM_COLS:
+        state[c] = np.nan_to_num(state[c])
+
+    last_pos = pd.DatetimeIndex(history).get_indexer(pd.to_datetime(last['datum']).reindex(keys))
+    has_state = last_pos >= 0
+    absent = np.where(has_state, n_stored - 1 - last_pos, 0).astype(float)
+    for j in range(n_stored):
+        p = j - window_days
+        if p < 0:
+            continue
+        # dagen j na de laatste rij van een key: alleen de vertrekkende dag eraf
+        missed = has_state & (last_pos < j)
+        _add_to_window(state, -1.0, hist_r[p][missed], hist_b[p][missed], keys=missed)
+    _reset(state, absent >= window_days)
+    return state, absent
+
+
+def _rolled_frame(df_results, stored, key_col, keys, history, new_days, bench):
+    """Zet resultaten en opgeslagen rijen om naar matrices en draait roll_window."""
+    def matrix(df, col, days):
+        if df.empty:
+            return np.full((len(days), len(keys)), np.nan)
+        wide = df.pivot_table(index='datum', columns=key_col, values=col, aggfunc='last', observed=True)
+        return wide.reindex(index=days, columns=keys).to_numpy(dtype=float)
+
+    total = matrix(df_results, 'totaal_resultaat', new_days)
+    present = ~np.isnan(total)
+
+    hist_r = matrix(stored, 'rendement', history)
+    hist_b = matrix(stored, 'benchmark_rendement', history)
+    state, absent = _state_at(stored, key_col, keys, history, hist_r, hist_b)
+
+    out = roll_window(total, matrix(df_results, 'kapitaal', new_days), present, bench, state,
+                      hist_r, hist_b, absent)
+    # Afrondingsruis van de lopende sommen niet als wijziging laten tellen
+    for c in SUM_COLS:
+        out[c] = np.round(out[c], 12)
+
+    day_idx, key_idx = np.nonzero(present)
+    return pd.DataFrame({
+        'datum': new_days[day_idx],
+        key_col: np.asarray(keys, dtype=object)[key_idx],
+        **{c: out[c][day_idx, key_idx] for c in VALUE_COLS},
+    })
+
+
+def refresh_risk(conn, cursor, start_date, end_date=None):
+    """Herberekent de risicotabellen vanaf start_date (alleen gewijzigde rijen worden geschreven)."""
+    ensure_risk_tables(conn, cursor)
+    start_ts = pd.Timestamp(start_date).normalize()
+    end_ts = pd.Timestamp(end_date if end_date is not None else 'today').normalize()
+
+    history = stored_days(cursor, start_ts)
+    if len(history) == 0:
+        cursor.execute(f"SELECT MIN(datum) FROM {SOURCE_TABLE}")
+        first = cursor.fetchone()[0]
+        if first is None:
+            print(f"{SOURCE_TABLE} is leeg, geen risicostatistieken.")
+            return
+        start_ts = min(start_ts, pd.Timestamp(first).normalize())
+        print(f"Geen opgeslagen risicostand vóór de startdatum; opbouw vanaf {start_ts.date()}.")
+
+    new_days = trading_calendar.trading_days(cursor, start_ts, end_ts)
+    if start_ts.dayofweek >= 5:
+        new_days = new_days.drop(start_ts)  # trading_days neemt de startdatum altijd mee
+
+    df_results = load_results(cursor, start_ts, end_ts, new_days)
+    bench = benchmark_returns(cursor, benchmark_asset(cursor),
+                              history[-1] if len(history) else None, new_days)
+    if np.isnan(bench).all():
+        print(f"Geen benchmarkkoersen ({'/'.join(INDEX_SYMBOLS)}) gevonden; beta blijft leeg.")
+
+    # --- per asset ---
+    stored = _load_stored(cursor, ASSET_TABLE, history, ['datum', 'asset_rollup'])
+    keys = sorted(set(df_results['asset_rollup']) | set(stored['asset_rollup'].astype(object)))
+    df_assets = _rolled_frame(df_results, stored, 'asset_rollup', keys, history, new_days, bench)
+
+    # --- portefeuille: som over de assets ---
+    df_port_results = df_results.groupby('datum', as_index=False)[['totaal_resultaat', 'kapitaal']].sum()
+    df_port_results['portefeuille'] = 'portefeuille'
+    stored_port = _load_stored(cursor, PORTFOLIO_TABLE, history, ['datum']).assign(portefeuille='portefeuille')
+    df_port = _rolled_frame(df_port_results, stored_port, 'portefeuille', ['portefeuille'],
+                            history, new_days, bench).drop(columns='portefeuille')
+
+    for table, df, key_cols in ((ASSET_TABLE, df_assets, ['datum', 'asset_rollup']),
+                                (PORTFOLIO_TABLE, df_port, ['datum'])):
+        write_changed_rows(
+            conn, cursor, table, df,
+            key_cols=key_cols, value_cols=VALUE_COLS,
+            temp_table=f"Temp{table}",
+            start_date=start_ts, end_date=end_ts,
+            insert_missing=True, delete_vanished=True
+        )
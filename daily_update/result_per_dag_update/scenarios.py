@@ -0,0 +1,232 @@
+"""
+Scenario-herwaardering van alle open posities op één peildatum (stage 13).
+
+Uitgangspunt is de stand van de peildatum:
+  aandelen   waarde_bezit uit per_dag_asset_result (stage 3)
+  opties     de open rijen van per_dag_open_opties_opgerold (stage 4)
+  sprinters  de stapfuncties van stage 7 (sprinter_resultaat = A * close + B)
+
+Een scenario is een koersschok per asset_rollup (prijs x (1 + schok)); een
+grid van n scenario's is een matrix schokken (n x assets). Aandelen en
+sprinters zijn lineair in de koers en worden in één gebroadcaste
+vermenigvuldiging herwaardeerd. Voor de opties gaan alle (scenario, optierij)
+paren in één aanroep van de numba kernel (option_kernels.value_options,
+parallel en gecachet), met de opgeslagen volatiliteit en looptijd;
+horizon_days schuift de looptijd op. Honderden scenario's kosten zo geen aparte run van stages 3-7.
+
+Resultaat per scenario en asset: waarde van de posities en het verschil met
+het basisscenario (schok 0, zelfde kernel, dus zonder afrondingsverschil).
+Sprinters worden lineair doorgerekend zoals in stage 7 (geen knock-out).
+"""
+import numpy as np
+import pandas as pd
+
+from open_options import OPEN_TABLE
+from price_matrix import lookup_prices
+from sprinters import build_sprinter_state
+from typed_load import read_frame
+
+RESULT_TABLE = 'per_dag_asset_result'
+BASE_SCENARIO = 'basis'
+# Waardekolommen per scenario; opties_itm is de intrinsieke waarde (asset_open_optie_waarde)
+PART_COLS = ['aandelen', 'opties', 'opties_itm', 'sprinters']
+
+# Standaardgrid: marktbrede schokken van -30% tot +30%
+DEFAULT_MARKET_SHOCKS = np.round(np.arange(-0.30, 0.3001, 0.05), 4)
+
+
+def latest_date(cursor):
+    """Laatste datum in per_dag_asset_result (standaard peildatum)."""
+    cursor.execute(f"SELECT MAX(datum) FROM {RESULT_TABLE}")
+    value = cursor.fetchone()[0]
+    return None if value is None else pd.Timestamp(value).normalize()
+
+
+def load_positions(cursor, as_of):
+    """
+    Open posities op peildatum as_of. Geeft een dict met
+      assets     alle asset_rollups met een positie (volgorde van de schokmatrix)
+      aandelen   waarde_bezit per asset (array)
+      opties     optierijen (asset_idx, call/put, strike, close, aantal, vol, looptijd)
+      sprinters  prijs_factor * close en vast per asset (arrays)
+    """
+    from option_kernels import DEFAULT_VOLATILITY
+
+    as_of = pd.Timestamp(as_of).normalize()
+    day = as_of.to_pydatetime()
+
+    df_stock = read_frame(cursor, f"""
+        SELECT asset_rollup, waarde_bezit FROM {RESULT_TABLE}
+        WHERE datum = ? AND cumulative_aantal <> 0
+    """, day)
+    df_opt = read_frame(cursor, f"""
+        SELECT asset_rollup, optie_exp_date, optie_strike, optie_call_put,
+               optie_aantal, asset_close, optie_volatiliteit
+        FROM {OPEN_TABLE} WHERE datum = ?
+    """, day)
+
+    cursor.execute("SELECT asset_rollup FROM asset_rollup_data")
+    asset_list = [row[0] for row in cursor.fetchall()]
+    sprinter_list = read_frame(cursor, "SELECT * FROM sprinters_referentie_data")
+    df_sprint_tx = read_frame(cursor, "SELECT * FROM transacties_bron_data WHERE asset_type='sprinter'")
+    state = build_sprinter_state(df_sprint_tx, sprinter_list, asset_list, [as_of])
+    state = state[(state['prijs_factor'] != 0) | (state['vast'] != 0)]
+    close = lookup_prices(
+        cursor, state['asset_rollup'], state['datum'], lookback_days=9, zero_policy='skip', fill_value=0
+    )['close_raw'].to_numpy(dtype=np.float64)
+
+    stock_assets = df_stock['asset_rollup'].astype(object).to_numpy()
+    opt_assets = df_opt['asset_rollup'].astype(object).to_numpy()
+    sprint_assets = state['asset_rollup'].astype(object).to_numpy()
+    assets = pd.Index(sorted(set(stock_assets) | set(opt_assets) | set(sprint_assets), key=str))
+
+    def per_asset(keys, values):
+        out = np.zeros(len(assets), dtype=np.float64)
+        np.add.at(out, assets.get_indexer(keys), np.nan_to_num(np.asarray(values, dtype=np.float64)))
+        return out
+
+    t_years = (
+        (pd.to_datetime(df_opt['optie_exp_date']).dt.normalize() - as_of).dt.days
+        .clip(lower=0).astype(np.float64) / 365.0
+    )
+    vol = df_opt['optie_volatiliteit'].astype(np.float64).to_numpy()
+
+    return {
+        'as_of': as_of,
+        'assets': assets,
+        'aandelen': per_asset(stock_assets, df_stock['waarde_bezit']),
+        'opties': {
+            'asset_idx': assets.get_indexer(opt_assets),
+            'call_put': np.where(df_opt['optie_call_put'].astype(object).to_numpy() == 'call', 0, 1).astype(np.int32),
+            'strike': df_opt['optie_strike'].astype(np.float64).to_numpy(),
+            'close': df_opt['asset_close'].astype(np.float64).to_numpy(),
+            'aantal': df_opt['optie_aantal'].astype(np.float64).to_numpy(),
+            'volatiliteit': np.where(np.isnan(vol), DEFAULT_VOLATILITY, vol),
+            't_years': t_years.to_numpy(),
+        },
+        'sprinter_exposure': per_asset(sprint_assets, state['prijs_factor'].to_numpy() * close),
+        'sprinter_vast': per_asset(sprint_assets, state['vast']),
+    }
+
+
+def _pct(level):
+    """0.025 -> '+2.5%'"""
+    return f"{level * 100:+.4g}%"
+
+
+def scenario_grid(assets, market_shocks=(), asset_shocks=(), betas=None, cross=False):
+    """
+    Bouwt de schokmatrix (scenario's x assets). Geeft (namen, schokken).
+      market_shocks  marktbrede schokken; met betas krijgt elke asset schok * beta
+      asset_shocks   [(asset_rollup, schok), ...] voor één asset, de rest 0
+      cross          ook elke marktschok gecombineerd met elke asset-schok
+    Het basisscenario (alles 0) staat altijd op rij 0. Schokken onder -100% worden -100%.
+    """
+    assets = pd.Index(assets)
+    beta = np.ones(len(assets))
+    if betas is not None:
+        beta = pd.Series(betas, dtype=float).reindex(assets).fillna(1.0).to_numpy()
+
+    def market(level):
+        return level * beta
+
+    def single(asset, level):
+        row = np.zeros(len(assets))
+        pos = assets.get_indexer([asset])[0]
+        if pos < 0:
+            raise ValueError(f"Geen open positie in {asset!r} op de peildatum")
+        row[pos] = level
+        return row
+
+    names, rows = [BASE_SCENARIO], [np.zeros(len(assets))]
+    for m in market_shocks:
+        names.append(f"markt {_pct(m)}")
+        rows.append(market(m))
+    for asset, level in asset_shocks:
+        names.append(f"{asset} {_pct(level)}")
+        rows.append(single(asset, level))
+    if cross:
+        for m in market_shocks:
+            for asset, level in asset_shocks:
+                names.append(f"markt {_pct(m)}, {asset} {_pct(level)}")
+                # schokken stapelen multiplicatief
+                rows.append((1.0 + market(m)) * (1.0 + single(asset, level)) - 1.0)
+    return names, np.clip(np.vstack(rows), -1.0, None)
+
+
+def revalue(positions, shocks, horizon_days=0):
+    """
+    Herwaardeert de posities onder elke rij van shocks (scenario's x assets).
+    Geeft een dict van PART_COLS -> array (scenario's x assets).
+    """
+    from option_kernels import value_options, RISK_FREE_RATE
+
+    factor = 1.0 + np.asarray(shocks, dtype=np.float64)
+    n_scen, n_assets = factor.shape
+    out = {
+        'aandelen': factor * positions['aandelen'],
+        'sprinters': factor * positions['sprinter_exposure'] + positions['sprinter_vast'],
+    }
+
+    opt = positions['opties']
+    n_opt = len(opt['strike'])
+    opties = np.zeros((n_scen, n_assets))
+    opties_itm = np.zeros((n_scen, n_assets))
+    if n_opt:
+        # (scenario, optierij) paren als één platte batch voor de kernel
+        close = (factor[:, opt['asset_idx']] * opt['close']).ravel()
+        t_years = np.clip(opt['t_years'] - horizon_days / 365.0, 0.0, None)
+        _, _, open_value_itm, bs_price, _, _, _, _, _ = value_options(
+            np.tile(opt['call_put'], n_scen), np.tile(opt['strike'], n_scen), close,
+            np.tile(opt['aantal'], n_scen), np.tile(t_years, n_scen),
+            np.tile(opt['volatiliteit'], n_scen), RISK_FREE_RATE
+        )
+        value = (bs_price.reshape(n_scen, n_opt) * opt['aantal']).T
+        value_itm = open_value_itm.reshape(n_scen, n_opt).T
+        # optierijen -> assets (np.add.at telt dubbele indices op)
+        np.add.at(opties.T, opt['asset_idx'], value)
+        np.add.at(opties_itm.T, opt['asset_idx'], value_itm)
+    out['opties'] = opties
+    out['opties_itm'] = opties_itm
+    return out
+
+
+def scenario_summary(names, values):
+    """
+    Totalen per scenario: PART_COLS, totaal (aandelen + opties + sprinters) en
+    resultaat (totaal min het basisscenario op rij 0).
+    """
+    df = pd.DataFrame({col: values[col].sum(axis=1) for col in PART_COLS}, index=pd.Index(names, name='scenario'))
+    df['totaal'] = df['aandelen'] + df['opties'] + df['sprinters']
+    df['resultaat'] = df['totaal'] - df['totaal'].iloc[0]
+    return df
+
+
+def scenario_per_asset(names, assets, values):
+    """Lang formaat: scenario, asset_rollup, PART_COLS, totaal en resultaat t.o.v. het basisscenario."""
+    total = values['aandelen'] + values['opties'] + values['sprinters']
+    df = pd.DataFrame({
+        'scenario': np.repeat(np.asarray(names, dtype=object), len(assets)),
+        'asset_rollup': np.tile(np.asarray(assets, dtype=object), len(names)),
+    })
+    for col in PART_COLS:
+        df[col] = values[col].ravel()
+    df['totaal'] = total.ravel()
+    df['resultaat'] = (total - total[0]).ravel()
+    return df
+
+
+def latest_betas(cursor, as_of):
+    """Laatste beta per asset uit stage 12 op of vóór as_of (leeg als stage 12 nog niet draaide)."""
+    from risk_stats import ASSET_TABLE
+    try:
+        df = read_frame(cursor, f"""
+            SELECT asset_rollup, datum, beta FROM {ASSET_TABLE}
+            WHERE datum <= ? AND datum >= ? AND beta IS NOT NULL
+        """, pd.Timestamp(as_of).to_pydatetime(), (pd.Timestamp(as_of) - pd.Timedelta(days=14)).to_pydatetime())
+    except Exception:
+        return pd.Series(dtype=float)
+    if df.empty:
+        return pd.Series(dtype=float)
+    df = df.sort_values('datum').drop_duplicates('asset_rollup', keep='last')
+    return pd.Series(df['beta'].astype(float).to_numpy(), index=df['asset_rollup'].astype(object).to_numpy())
@@ -0,0 +1,143 @@
+"""
+Asset-shards voor de waarderingsstages (3, 4, 6, 7) in een process pool.
+
+De berekeningen zijn onafhankelijk per asset_rollup. balanced_shards verdeelt
+de assets over n shards, gewogen naar het aantal transacties (greedy: zwaarste
+asset eerst naar de lichtste shard). run_sharded draait een stagefunctie per
+shard in een ProcessPoolExecutor en plakt de deelresultaten aan elkaar; het
+schrijven gebeurt daarna één keer in het hoofdproces.
+
+Gedeelde invoer (frames) gaat één keer per worker mee via de initializer en
+wordt in de worker per shard gefilterd op asset_rollup (frames zonder die
+kolom gaan ongefilterd mee). Elke worker opent zijn eigen Access-verbinding
+voor de prijslookups. Numba draait in een worker met één thread, de
+parallelliteit zit dan in de shards.
+
+Let op: onder Windows (spawn) importeert elke worker het hoofdscript opnieuw;
+alleen scripts met een main() achter `if __name__ == "__main__"` kunnen
+run_sharded gebruiken.
+"""
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import stage_flags
+
+# CLI-vlag van de stages; 0 = geen pool (huidige gedrag)
+FLAG, FLAG_HELP = stage_flags.SHARDS, stage_flags.SHARDS_HELP
+
+_worker = {}
+
+
+def shard_count(requested):
+    return (os.cpu_count() or 1) if requested < 0 else requested
+
+
+def connection_string(db_path):
+    return r'DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};' f'DBQ={db_path}'
+
+
+def transaction_weights(cursor, asset_type=None):
+    """Aantal transacties per asset_rollup (optioneel voor één asset_type)."""
+    query = "SELECT asset_rollup, COUNT(*) FROM transacties_bron_data"
+    params = []
+    if asset_type is not None:
+        query += " WHERE asset_type = ?"
+        params.append(asset_type)
+    cursor.execute(query + " GROUP BY asset_rollup", *params)
+    return pd.Series({r[0]: int(r[1]) for r in cursor.fetchall()}, dtype=float)
+
+
+def balanced_shards(asset_list, weights=None, n_shards=2):
+    """
+    Verdeelt asset_list over n_shards lijsten met ongeveer gelijk gewicht.
+    Gewicht per asset: 1 (grid-rijen) + aantal transacties.
+    """
+    assets = list(asset_list)
+    n_shards = max(1, min(n_shards, len(assets)))
+    w = 1.0 + pd.Series(weights if weights is not None else {}, dtype=float).reindex(assets).fillna(0.0)
+    order = np.argsort(-w.to_numpy(), kind='stable')
+
+    shards = [[] for _ in range(n_shards)]
+    load = np.zeros(n_shards)
+    for i in order:
+        k = int(np.argmin(load))
+        shards[k].append(assets[i])
+        load[k] += w.iloc[i]
+    return [s for s in shards if s]
+
+
+def _init_worker(db_path, frames):
+    # NUMBA_NUM_THREADS werkt alleen vóór de import van numba; set_num_threads
+    # beperkt ook een al geïmporteerde threadpool
+    try:
+        import numba
+        numba.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker['db_path'] = db_path
+    _worker['frames'] = frames
+    _worker['conn'] = None
+
+
+def _worker_cursor():
+    if _worker['conn'] is None:
+        import pyodbc
+        _worker['conn'] = pyodbc.connect(connection_string(_worker['db_path']))
+    return _worker['conn'].cursor()
+
+
+def _shard_frame(df, assets):
+    if 'asset_rollup' not in df.columns:
+        return df
+    return df[df['asset_rollup'].isin(assets)]
+
+
+def _call(func, asset_list, frames, cursor_factory, kwargs):
+    params = inspect.signature(func).parameters
+    call_kwargs = dict(kwargs, **frames)
+    if 'asset_list' in params:
+        call_kwargs['asset_list'] = asset_list
+    if 'cursor' in params:
+        call_kwargs['cursor'] = cursor_factory()
+    return func(**call_kwargs)
+
+
+def _run_shard(func, shard, asset_list, kwargs):
+    frames = {name: _shard_frame(df, shard) for name, df in _worker['frames'].items()}
+    return _call(func, asset_list, frames, _worker_cursor, kwargs)
+
+
+def run_sharded(func, db_path, asset_list, n_shards, weights=None, frames=None, cursor=None, **kwargs):
+    """
+    Roept func per shard aan met asset_list=shard (als func die parameter heeft),
+    de frames gefilterd op de shard, een eigen cursor (als func 'cursor' heeft)
+    en kwargs. Geeft de deelresultaten samengevoegd terug.
+    Met n_shards <= 1 draait alles ongefilterd in dit proces op `cursor`.
+    """
+    frames = frames or {}
+    asset_list = list(asset_list)
+    if n_shards <= 1:
+        return _call(func, asset_list, frames, lambda: cursor, kwargs)
+
+    # Assets die alleen in de frames voorkomen (niet in asset_rollup_data) krijgen
+    # ook een shard, zodat hun rijen net als zonder shards meekomen
+    listed = set(asset_list)
+    extra = set()
+    for df in frames.values():
+        if 'asset_rollup' in df.columns:
+            extra.update(a for a in df['asset_rollup'].dropna().astype(object).unique() if a not in listed)
+    shards = balanced_shards(asset_list + sorted(extra), weights, n_shards)
+    print(f"{func.__name__}: {len(shards)} shards "
+          f"({', '.join(str(len(s)) for s in shards)} assets)")
+    with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_worker,
+                             initargs=(db_path, frames)) as pool:
+        parts = list(pool.map(
+            _run_shard, [func] * len(shards), shards,
+            [[a for a in s if a in listed] for s in shards], [kwargs] * len(shards)
+        ))
+    parts = [p for p in parts if not p.empty] or parts[:1]
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,110 @@
+"""
+Kolomsgewijze sprinterwaardering (stage 7).
+
+Per contract (uniek_id, multiplier_close_price) met lopende stand
+(aantal, euro, fee) op dag d geldt, met funding/ratio uit
+sprinters_referentie_data (eerste rij per asset_detail):
+
+    open   (aantal != 0): resultaat = aantal*mult/ratio * close + euro - aantal*funding/ratio
+                          bezit     = aantal/ratio
+    dicht  (aantal == 0): resultaat = euro, bezit = 0
+    fee altijd de cumulatieve transactie_fee
+
+Het resultaat is dus lineair in de close-prijs: per asset en dag is
+sprinter_resultaat = A * close + B, waarbij A, B, fee en bezit stapfuncties
+zijn die alleen op transactiedagen veranderen. Die worden met
+step_functions.spread_steps over alle assets x dagen uitgezet en daarna in één
+keer tegen de as-of close-prijzen gezet.
+"""
+import numpy as np
+import pandas as pd
+
+from price_matrix import lookup_prices
+from step_functions import transaction_day, contract_deltas, spread_steps
+
+SUM_COLS = ['transactie_euro_totaal', 'transactie_aantal', 'transactie_fee']
+CONTRACT_KEYS = ['uniek_id', 'multiplier_close_price']
+RESULT_COLS = ['sprinter_resultaat', 'sprinter_fee', 'sprinter_aantal_bezit']
+_STATE_COLS = ['prijs_factor', 'vast', 'sprinter_fee', 'sprinter_aantal_bezit']
+
+
+def sprinter_reference(sprinter_list):
+    """Eerste funding/ratio per asset_detail (zoals .loc[...].iloc[0])."""
+    return (
+        sprinter_list.drop_duplicates(subset='asset_detail', keep='first')
+        .set_index('asset_detail')[['sprinter_funding', 'sprinter_ratio']]
+    )
+
+
+def build_sprinter_state(df_tx, sprinter_list, asset_list, days):
+    """
+    Geeft per asset_rollup x dag de stapfuncties prijs_factor (A), vast (B),
+    sprinter_fee en sprinter_aantal_bezit terug.
+    """
+    days = pd.DatetimeIndex(days)
+    tx = df_tx[df_tx['asset_rollup'].isin(asset_list)].dropna(subset=CONTRACT_KEYS + ['datum']).copy()
+    if tx.empty:
+        return spread_steps(pd.DataFrame(columns=['dag', 'asset_rollup'] + _STATE_COLS),
+                            'asset_rollup', _STATE_COLS, days, keys=asset_list)
+
+    tx['dag'] = transaction_day(tx['datum'])
+    for col in SUM_COLS:
+        tx[col] = tx[col].astype(float).fillna(0.0)
+
+    tx['contract_id'] = tx.groupby(CONTRACT_KEYS, sort=False, observed=True).ngroup()
+    contracts = tx.groupby('contract_id')[CONTRACT_KEYS + ['asset_rollup', 'asset_detail']].first()
+    contracts = contracts.join(sprinter_reference(sprinter_list), on='asset_detail')
+
+    per_day = tx.groupby(['contract_id', 'dag'], as_index=False, sort=True)[SUM_COLS].sum()
+    per_day[SUM_COLS] = per_day.groupby('contract_id')[SUM_COLS].cumsum()
+    per_day = per_day.join(contracts, on='contract_id')
+
+    aantal = per_day['transactie_aantal']
+    is_open = aantal.round(9) != 0
+
+    missing = is_open & (per_day['sprinter_funding'].isna() | per_day['sprinter_ratio'].isna())
+    if missing.any():
+        print("⚠️ Geen sprinters_referentie_data voor asset_detail: "
+              f"{sorted(per_day.loc[missing, 'asset_detail'].astype(str).unique())}; "
+              "deze contracten tellen niet mee.")
+        keep = ~per_day['contract_id'].isin(per_day.loc[missing, 'contract_id'])
+        per_day, aantal, is_open = per_day[keep], aantal[keep], is_open[keep]
+
+    ratio = per_day['sprinter_ratio'].astype(float)
+    state = pd.DataFrame({
+        'prijs_factor': np.where(is_open, aantal * per_day['multiplier_close_price'] / ratio, 0.0),
+        'vast': np.where(is_open,
+                         per_day['transactie_euro_totaal'] - aantal * per_day['sprinter_funding'] / ratio,
+                         per_day['transactie_euro_totaal']),
+        'sprinter_fee': per_day['transactie_fee'].to_numpy(),
+        'sprinter_aantal_bezit': np.where(is_open, aantal / ratio, 0.0),
+    }, index=per_day.index)
+
+    deltas = contract_deltas(state, per_day['contract_id']).assign(
+        asset_rollup=per_day['asset_rollup'].to_numpy(),
+        dag=per_day['dag'].to_numpy(),
+    )
+    return spread_steps(deltas, 'asset_rollup', _STATE_COLS, days, keys=asset_list)
+
+
+def value_sprinters(state, close_price):
+    """state uit build_sprinter_state + close-prijs per rij -> asset_rollup, datum, RESULT_COLS."""
+    out = state[['asset_rollup', 'datum']].copy()
+    out['sprinter_resultaat'] = state['prijs_factor'].to_numpy() * np.asarray(close_price, dtype=float) \
+        + state['vast'].to_numpy()
+    out['sprinter_fee'] = state['sprinter_fee'].to_numpy()
+    out['sprinter_aantal_bezit'] = state['sprinter_aantal_bezit'].to_numpy()
+    out[RESULT_COLS] = out[RESULT_COLS].round(9).fillna(0)
+    return out
+
+
+def sprinter_rows(cursor, df_tx, sprinter_list, asset_list, days):
+    """
+    sprinter_resultaat, sprinter_fee en sprinter_aantal_bezit per asset_rollup x dag.
+    Close-prijzen: één as-of lookup (niet-nul close, vandaag + 9 dagen terug, anders 0).
+    """
+    state = build_sprinter_state(df_tx, sprinter_list, asset_list, days)
+    prices = lookup_prices(
+        cursor, state['asset_rollup'], state['datum'], lookback_days=9, zero_policy='skip', fill_value=0
+    )
+    return value_sprinters(state, prices['close_raw'])
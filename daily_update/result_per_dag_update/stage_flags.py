@@ -0,0 +1,20 @@
+"""
+CLI-vlaggen die door meerdere stages worden gedeeld.
+
+Alleen standaardbibliotheek (zoals startup_profile): een stage bouwt zijn
+argparse parser vóór de zware imports (pyodbc, pandas, numba, de
+pipelinemodules), zodat --help en een fout in de argumenten direct terugkomen.
+De modules met de bijbehorende logica geven de vlag door als FLAG/FLAG_HELP.
+"""
+
+# trading_calendar: rekenen op handelsdagen, aanvullen bij het schrijven
+TRADING_DAYS = '--trading-days'
+TRADING_DAYS_HELP = "Reken alleen op handelsdagen; overige dagen krijgen bij het schrijven de vorige handelsdag"
+
+# sharding: 0 = geen pool (huidige gedrag)
+SHARDS = '--shards'
+SHARDS_HELP = "Aantal asset-shards/processen voor de berekening (0 = één proces, -1 = aantal cores)"
+
+# write_queue
+WRITE_BEHIND = '--write-behind'
+WRITE_BEHIND_HELP = "Schrijf resultaten via een lokale wachtrij op de achtergrond (met retry bij locks)"
@@ -0,0 +1,81 @@
+"""
+Meet de vaste opstartkosten van een stage: imports en JIT-compilatie/cache-load.
+
+Gebruik in een stage (dit module als eerste importeren, het is zelf licht):
+
+    import startup_profile
+    with startup_profile.timed('import pandas/numpy/pyodbc'):
+        import pandas as pd
+    ...
+    startup_profile.report('script 4')
+
+Met --profile-startup op de commandline worden de import/compile tijden
+geprint; het piekgeheugen (peak RSS) van de stage wordt altijd gerapporteerd.
+"""
+import sys
+import time
+from contextlib import contextmanager
+
+FLAG = '--profile-startup'
+
+ENABLED = FLAG in sys.argv
+_T0 = time.perf_counter()
+_timings = []
+
+
+@contextmanager
+def timed(label):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings.append((label, time.perf_counter() - t))
+
+
+def _peak_rss_windows():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+        ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+    )
+    return counters.PeakWorkingSetSize if ok else None
+
+
+def peak_rss_mb():
+    """Piekgeheugen van dit proces in MB (None als het niet te bepalen is)."""
+    try:
+        if sys.platform == 'win32':
+            peak = _peak_rss_windows()
+            return None if peak is None else peak / 2 ** 20
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux: KB, macOS: bytes
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    except Exception:
+        return None
+
+
+def report(stage):
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"{stage}: piek RSS {rss:.0f} MB")
+    if not ENABLED:
+        return
+    total = sum(dt for _, dt in _timings)
+    print(f"--- startup profile {stage} ---")
+    for label, dt in _timings:
+        print(f"  {label:<45} {dt:8.3f}s")
+    print(f"  {'totaal import/compile':<45} {total:8.3f}s "
+          f"(van {time.perf_counter() - _T0:.3f}s sinds start stage)")
@@ -0,0 +1,54 @@
+"""
+Helpers voor per-dag standen die alleen op transactiedagen veranderen.
+
+Een contract heeft op elke transactiedag een nieuwe stand (cumsum van zijn
+transacties). contract_deltas zet die standen om naar sprongen; spread_steps
+sommeert de sprongen per sleutel (meestal asset_rollup) en zet ze met één
+cumsum + forward-fill uit over een datumbereik.
+"""
+import numpy as np
+import pandas as pd
+
+
+def transaction_day(datum):
+    """
+    Eerste dag (middernacht) waarop een transactie meetelt: de oude per-datum
+    loops gebruikten `datum <= date` met date op middernacht.
+    """
+    return pd.to_datetime(datum).dt.ceil('D')
+
+
+def contract_deltas(state, contract_ids):
+    """Stand per (contract, dag), gesorteerd op dag binnen contract -> sprong t.o.v. de vorige stand."""
+    prev = state.groupby(np.asarray(contract_ids)).shift(1).fillna(0)
+    return state - prev
+
+
+def spread_steps(deltas, key_col, value_cols, days, keys=None, day_col='dag'):
+    """
+    Sommeert sprongen per (dag, key_col) en geeft de cumulatieve stand terug op
+    elke dag in `days`, voor alle keys (standaard: de keys die in deltas voorkomen).
+    Kolommen: key_col, datum, value_cols.
+    """
+    value_cols = list(value_cols)
+    days = pd.DatetimeIndex(days)
+    steps = deltas.groupby([day_col, key_col], observed=True)[value_cols].sum()
+    if keys is None:
+        keys = steps.index.get_level_values(key_col).unique()
+    keys = pd.Index(keys)
+
+    columns = {}
+    for col in value_cols:
+        if steps.empty:
+            columns[col] = np.zeros(len(days) * len(keys))
+            continue
+        wide = steps[col].unstack(key_col, fill_value=0).sort_index().cumsum()
+        wide = wide.reindex(columns=keys, fill_value=0)
+        wide = wide.reindex(wide.index.union(days)).ffill().fillna(0).reindex(days)
+        columns[col] = wide.to_numpy(dtype=float).ravel()
+
+    return pd.DataFrame({
+        key_col: np.tile(keys.to_numpy(), len(days)),
+        'datum': np.repeat(days.to_numpy(), len(keys)),
+        **columns,
+    })
@@ -0,0 +1,199 @@
+"""
+Aandelenposities per asset en dag (stage 3): cumulatieve aantallen en bedragen
+vanaf de opgeslagen stand op start - 1, gewaardeerd met de as-of close uit de
+prijsmatrix.
+"""
+import numpy as np
+import pandas as pd
+
+from price_matrix import lookup_prices
+from trading_calendar import snap_to_days
+from typed_load import read_frame
+
+STOCK_RESULT_COLS = [
+    'cumulative_aantal',
+    'cumulative_aantal_aankopen', 'cumulative_aantal_verkopen',
+    'cumulative_aankoop_bedrag', 'cumulative_verkoop_bedrag',
+    'close_price', 'waarde_bezit', 'asset_result', 'asset_fee'
+]
+
+
+def load_stock_transactions(cursor):
+    return read_frame(cursor, "SELECT * FROM transacties_bron_data WHERE asset_type='aandeel'")
+
+
+def build_stock_rows(cursor, asset_list, start_ts, end_ts, lookback_days=5, days=None, df_tx=None):
+    """
+    Geeft per asset_rollup x dag in [start_ts, end_ts] de kolommen
+    datum, asset_rollup en STOCK_RESULT_COLS van per_dag_asset_result.
+    lookback_days: terugkijkvenster voor prijzen.
+    days: optioneel grid (bijv. handelsdagen); transacties op andere dagen
+    tellen mee op de eerstvolgende grid-dag.
+    df_tx: al geladen aandelentransacties (anders uit transacties_bron_data).
+    """
+    start_ts = pd.Timestamp(start_ts).normalize()
+    end_ts = pd.Timestamp(end_ts).normalize()
+    prev_ts = start_ts - pd.Timedelta(days=1)
+
+    # -----------------------------
+    # 1) Data in één keer laden
+    # -----------------------------
+    # transacties
+    df_tx = load_stock_transactions(cursor) if df_tx is None else df_tx.copy()
+
+    # baseline cumulatieven ophalen
+    cursor.execute("""
+        SELECT asset_rollup, datum,
+               cumulative_aantal, cumulative_aantal_aankopen,
+               cumulative_aantal_verkopen, cumulative_aankoop_bedrag,
+               cumulative_verkoop_bedrag, asset_fee
+        FROM per_dag_asset_result
+        WHERE [datum] = ?
+    """, prev_ts)
+    rows = cursor.fetchall()
+    prev_cols = [c[0] for c in cursor.description]
+    df_prev = pd.DataFrame.from_records(rows, columns=prev_cols)
+
+    if df_prev.empty:
+        df_prev = pd.DataFrame({
+            'asset_rollup': asset_list,
+            'datum': pd.to_datetime(prev_ts),
+            'cumulative_aantal': 0.0,
+            'cumulative_aantal_aankopen': 0.0,
+            'cumulative_aantal_verkopen': 0.0,
+            'cumulative_aankoop_bedrag': 0.0,
+            'cumulative_verkoop_bedrag': 0.0,
+            'asset_fee': 0.0
+        })
+
+    # -----------------------------
+    # 2) Normaliseren & filteren
+    # -----------------------------
+    if 'datum' in df_tx.columns:
+        df_tx['datum'] = pd.to_datetime(df_tx['datum']).dt.normalize()
+    df_prev['datum'] = pd.to_datetime(df_prev['datum']).dt.normalize()
+
+    df_tx = df_tx[df_tx['asset_rollup'].isin(asset_list)].copy()
+
+    df_tx = df_tx[(df_tx['datum'] >= start_ts) & (df_tx['datum'] <= end_ts)].copy()
+
+    all_days = pd.date_range(start_ts, end_ts, freq='D') if days is None else pd.DatetimeIndex(days)
+    if days is not None:
+        df_tx['datum'] = snap_to_days(df_tx['datum'], all_days).to_numpy()
+        outside = df_tx['datum'].isna()
+        if outside.any():
+            # grid eindigt vóór end_ts (stage_days neemt end_ts altijd op)
+            print(f"Let op: {int(outside.sum())} aandelentransacties na de laatste grid-dag "
+                  f"{all_days[-1].date()} niet meegenomen.")
+        df_tx = df_tx[~outside]
+
+    # -----------------------------
+    # 3) Dagelijkse transacties
+    # -----------------------------
+    df_tx['aantal_aankoop'] = np.where(
+        df_tx['transactie_type'] == 'koop',
+        df_tx['transactie_aantal'].astype(float), 0.0
+    )
+    df_tx['aantal_verkopen'] = np.where(
+        df_tx['transactie_type'] == 'verkoop',
+        df_tx['transactie_aantal'].astype(float), 0.0
+    )
+    df_tx['aankoop_bedrag'] = np.where(
+        df_tx['transactie_type'] == 'koop',
+        df_tx['transactie_euro_totaal'].astype(float), 0.0
+    )
+    df_tx['verkoop_bedrag'] = np.where(
+        df_tx['transactie_type'] == 'verkoop',
+        df_tx['transactie_euro_totaal'].astype(float), 0.0
+    )
+    df_tx['fee_dag'] = df_tx['transactie_fee'].astype(float)
+
+    daily = df_tx.groupby(['asset_rollup', 'datum'], as_index=False, observed=True).agg({
+        'aantal_aankoop': 'sum',
+        'aantal_verkopen': 'sum',
+        'aankoop_bedrag': 'sum',
+        'verkoop_bedrag': 'sum',
+        'fee_dag': 'sum'
+    })
+
+    # skeleton (alle dagen × alle assets)
+    skeleton = (
+        pd.Series(asset_list, name='asset_rollup').to_frame()
+        .assign(key=1)
+        .merge(pd.DataFrame({'datum': all_days, 'key': 1}), on='key')
+        .drop(columns='key')
+    )
+    daily_full = skeleton.merge(daily, on=['asset_rollup', 'datum'], how='left')
+
+    for col in ['aantal_aankoop', 'aantal_verkopen',
+                'aankoop_bedrag', 'verkoop_bedrag', 'fee_dag']:
+        daily_full[col] = daily_full[col].fillna(0.0)
+
+    # -----------------------------
+    # 4) Prijsreeksen
+    # -----------------------------
+    # as-of lookup in de prijsmatrix: laatste niet-nul close binnen lookback_days
+    prices = lookup_prices(
+        cursor, daily_full['asset_rollup'], daily_full['datum'],
+        lookback_days=lookback_days, zero_policy='skip', fill_value=0.0
+    )
+    daily_full['close_price_adj'] = prices['close_adj'].to_numpy()
+    daily_full['close_price_raw'] = prices['close_raw'].to_numpy()
+
+    # -----------------------------
+    # 5) Merge & cumulatieven
+    # -----------------------------
+    df_all = (
+        daily_full
+        .sort_values(['asset_rollup', 'datum'])
+        .reset_index(drop=True)
+    )
+    df_all['close_price_adj'] = df_all['close_price_adj'].astype(float).fillna(0.0)
+    df_all['close_price_raw'] = df_all['close_price_raw'].astype(float).fillna(0.0)
+
+    df_all['cum_aantal_aankopen'] = df_all.groupby('asset_rollup')['aantal_aankoop'].cumsum()
+    df_all['cum_aantal_verkopen'] = df_all.groupby('asset_rollup')['aantal_verkopen'].cumsum()
+    df_all['cum_aankoop_bedrag'] = df_all.groupby('asset_rollup')['aankoop_bedrag'].cumsum()
+    df_all['cum_verkoop_bedrag'] = df_all.groupby('asset_rollup')['verkoop_bedrag'].cumsum()
+    df_all['cum_fee'] = df_all.groupby('asset_rollup')['fee_dag'].cumsum()
+
+    baseline = df_prev[[
+        'asset_rollup', 'cumulative_aantal_aankopen',
+        'cumulative_aantal_verkopen', 'cumulative_aankoop_bedrag',
+        'cumulative_verkoop_bedrag', 'asset_fee'
+    ]]
+    df_all = df_all.merge(baseline, on='asset_rollup', how='left')
+
+    for col_cum, col_base in [
+        ('cum_aantal_aankopen', 'cumulative_aantal_aankopen'),
+        ('cum_aantal_verkopen', 'cumulative_aantal_verkopen'),
+        ('cum_aankoop_bedrag', 'cumulative_aankoop_bedrag'),
+        ('cum_verkoop_bedrag', 'cumulative_verkoop_bedrag'),
+        ('cum_fee', 'asset_fee')
+    ]:
+        df_all[col_base] = df_all[col_base].fillna(0.0)
+        df_all[col_cum] = df_all[col_cum] + df_all[col_base]
+
+    df_all['cumulative_aantal_aankopen'] = df_all['cum_aantal_aankopen']
+    df_all['cumulative_aantal_verkopen'] = df_all['cum_aantal_verkopen']
+    df_all['cumulative_aankoop_bedrag'] = df_all['cum_aankoop_bedrag']
+    df_all['cumulative_verkoop_bedrag'] = df_all['cum_verkoop_bedrag']
+    df_all['asset_fee'] = df_all['cum_fee']
+    df_all['cumulative_aantal'] = (
+        df_all['cumulative_aantal_aankopen'] + df_all['cumulative_aantal_verkopen']
+    )
+
+    # waarde en resultaat berekenen met adjusted close
+    df_all['waarde_bezit'] = df_all['cumulative_aantal'] * df_all['close_price_adj']
+    df_all['asset_result'] = (
+        df_all['cumulative_aankoop_bedrag'] +
+        df_all['cumulative_verkoop_bedrag'] +
+        df_all['waarde_bezit']
+    )
+
+    # -----------------------------
+    # 6) Output (met raw close)
+    # -----------------------------
+    out_cols = ['datum', 'asset_rollup'] + STOCK_RESULT_COLS
+    return df_all.rename(columns={'close_price_raw': 'close_price'})[out_cols].copy()
+
@@ -0,0 +1,76 @@
+"""
+Vervolgrun van stage 12 moet gelijk zijn aan een doorlopende run, ook voor
+assets die de laatste opgeslagen dag(en) vóór de startdatum geen rij hebben.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import risk_stats  # noqa: E402
+
+DAYS = pd.bdate_range('2023-01-02', periods=400)
+KEYS = ['A', 'B', 'C', 'D']
+# handelsdagen zonder rij per asset (A en D missen de grensdag, B en C een heel venster)
+MISSING = {
+    'A': set(range(198, 200)),
+    'B': set(range(150, 200)),
+    'C': set(range(0, 30)) | set(range(120, 200)),
+    'D': set(range(199, 201)) | set(range(300, 302)),
+}
+
+
+def _results():
+    rng = np.random.default_rng(1)
+    bench = rng.normal(0, 0.01, len(DAYS))
+    bench[5] = np.nan
+    rows = []
+    for key, beta in zip(KEYS, [0.5, 1.0, 1.5, 0.8]):
+        capital, total = 1000.0, 0.0
+        for i, day in enumerate(DAYS):
+            total += (beta * np.nan_to_num(bench[i]) + rng.normal(0, 0.005)) * capital
+            if i in MISSING[key]:
+                continue
+            rows.append((day, key, total, capital))
+            capital = max(capital + rng.normal(0, 10), 1.0)
+    return pd.DataFrame(rows, columns=['datum', 'asset_rollup', 'totaal_resultaat', 'kapitaal']), bench
+
+
+def _run(df, stored, history, days, bench):
+    return risk_stats._rolled_frame(df, stored, 'asset_rollup', KEYS, history, days, bench)
+
+
+@pytest.mark.parametrize('split', [199, 200, 201, 250, 301, 302])
+def test_split_run_equals_full_run(split):
+    df, bench = _results()
+    empty = pd.DataFrame(columns=['datum', 'asset_rollup'] + risk_stats.VALUE_COLS)
+    full = _run(df, empty, pd.DatetimeIndex([]), DAYS, bench)
+
+    history = DAYS[:split][-2 * risk_stats.WINDOW_DAYS:]
+    stored = full[full['datum'].isin(history)]
+    second = _run(df[df['datum'] >= DAYS[split]], stored, history, DAYS[split:], bench[split:])
+
+    expected = full[full['datum'] >= DAYS[split]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(second[['datum', 'asset_rollup']], expected[['datum', 'asset_rollup']])
+    for col in risk_stats.VALUE_COLS:
+        np.testing.assert_allclose(second[col].to_numpy(float), expected[col].to_numpy(float),
+                                   rtol=1e-9, atol=1e-9, err_msg=col)
+
+
+def test_missed_days_leave_the_window():
+    df, bench = _results()
+    empty = pd.DataFrame(columns=['datum', 'asset_rollup'] + risk_stats.VALUE_COLS)
+    full = _run(df, empty, pd.DatetimeIndex([]), DAYS, bench)
+    a = full[full['asset_rollup'] == 'A'].set_index('datum')
+
+    # twee gemiste dagen: 58 rendementen in het venster van 60 handelsdagen
+    assert a.loc[DAYS[201], 'n_obs'] == risk_stats.WINDOW_DAYS - 2
+    returns = a['rendement'].reindex(DAYS)
+    expected = returns.rolling(risk_stats.WINDOW_DAYS, min_periods=risk_stats.MIN_OBS).std() \
+        * np.sqrt(risk_stats.TRADING_DAYS_PER_YEAR)
+    np.testing.assert_allclose(a['volatiliteit'].to_numpy(float), expected.reindex(a.index).to_numpy(float),
+                               rtol=1e-9, atol=1e-12)
@@ -0,0 +1,133 @@
+"""
+Handelsdagkalender voor de stage-grids.
+
+De stages bouwen standaard een grid over alle kalenderdagen; weekenden en
+feestdagen worden dan als rijen berekend die alleen de vorige dag herhalen.
+Met een handelsdag-grid rekenen ze alleen op dagen waarop een beurs open was
+en worden de overige dagen pas bij het schrijven aangevuld (expand_to_calendar).
+
+Handelsdagen komen uit de opgeslagen bars in per_dag_asset_prijs: per beurs-
+groep (GROUP_COL uit asset_rollup_data, anders één groep) telt een dag als
+minstens MIN_SHARE van de assets in die groep een bar heeft. Het grid is de
+vereniging over de groepen. Na de laatste dag met bars (vandaag, nog geen
+slotkoers) tellen werkdagen mee. De startdatum zit altijd in het grid, zodat
+aanvullen naar kalenderdagen nooit een beginwaarde mist; stage_days neemt
+ook de einddatum op.
+"""
+import numpy as np
+import pandas as pd
+
+import stage_flags
+from typed_load import read_frame
+
+PRICE_TABLE = "per_dag_asset_prijs"
+GROUP_COL = "ib_currency"
+MIN_SHARE = 0.5
+MIN_GROUP_SIZE = 3
+
+# CLI-vlag van de stages: rekenen op handelsdagen, aanvullen bij het schrijven
+FLAG, FLAG_HELP = stage_flags.TRADING_DAYS, stage_flags.TRADING_DAYS_HELP
+
+
+def load_exchange_groups(cursor):
+    """asset_rollup -> beursgroep uit asset_rollup_data, of None als GROUP_COL ontbreekt."""
+    columns = {row.column_name.lower() for row in cursor.columns(table='asset_rollup_data')}
+    if GROUP_COL not in columns:
+        return None
+    cursor.execute(f"SELECT asset_rollup, {GROUP_COL} FROM asset_rollup_data")
+    return pd.Series({r[0]: r[1] for r in cursor.fetchall()}, dtype=object)
+
+
+def consensus_days(df_bars, groups=None, min_share=MIN_SHARE, min_group_size=MIN_GROUP_SIZE,
+                   key_col='asset_rollup'):
+    """
+    Handelsdagen uit bars (datum, key_col): vereniging over de groepen van de
+    dagen waarop minstens min_share van de keys in de groep een bar heeft.
+    Kleine of onbekende groepen vallen samen in één restgroep.
+    """
+    bars = df_bars.dropna(subset=['datum', key_col])
+    if bars.empty:
+        return pd.DatetimeIndex([])
+    keys = bars[key_col].astype(object)
+    group_of = pd.Series(groups if groups is not None else {}, dtype=object).reindex(keys.unique())
+    sizes = group_of.map(group_of.value_counts())
+    group_of[group_of.isna() | (sizes < min_group_size)] = '_overig'
+
+    # per (datum, groep) aantal keys met een bar t.o.v. de groepsgrootte
+    per_day = (pd.DataFrame({'datum': bars['datum'].to_numpy(), 'key': keys.to_numpy(),
+                             'groep': keys.map(group_of).to_numpy()})
+               .drop_duplicates(['datum', 'key'])
+               .groupby(['datum', 'groep'])['key'].count())
+    share = per_day / per_day.index.get_level_values('groep').map(group_of.value_counts()).to_numpy()
+    return pd.DatetimeIndex(sorted(share[share >= min_share].index.get_level_values('datum').unique()))
+
+
+def trading_days(cursor, start_date, end_date=None, min_share=MIN_SHARE):
+    """Handelsdagen in [start_date, end_date] volgens de bars in de prijsmatrix."""
+    start_ts = pd.Timestamp(start_date).normalize()
+    end_ts = pd.Timestamp(end_date if end_date is not None else 'today').normalize()
+    bars = read_frame(cursor, f"""
+        SELECT datum, asset_rollup FROM {PRICE_TABLE}
+        WHERE close_raw IS NOT NULL AND datum >= ? AND datum <= ?
+    """, start_ts.to_pydatetime(), end_ts.to_pydatetime())
+    bars['datum'] = pd.to_datetime(bars['datum']).dt.normalize()
+
+    days = consensus_days(bars, load_exchange_groups(cursor), min_share)
+    last_bar = days[-1] if len(days) else start_ts - pd.Timedelta(days=1)
+    tail = pd.bdate_range(last_bar + pd.Timedelta(days=1), end_ts)
+    return days.union(tail).union(pd.DatetimeIndex([start_ts]))
+
+
+def stage_days(cursor, start_date, end_date=None, trading_only=False):
+    """
+    Grid voor een stage: alle kalenderdagen, of alleen handelsdagen. De
+    einddatum zit altijd in het grid: transacties na de laatste handelsdag
+    (bijv. op een zaterdag als einddatum) vallen anders buiten het grid en
+    ontbreken in de beginstand van de volgende run.
+    """
+    start_ts = pd.Timestamp(start_date).normalize()
+    end_ts = pd.Timestamp(end_date if end_date is not None else 'today').normalize()
+    if not trading_only:
+        return pd.date_range(start_ts, end_ts, freq='D')
+    days = trading_days(cursor, start_ts, end_ts).union(pd.DatetimeIndex([end_ts]))
+    print(f"Handelsdagen: {len(days)} van {(end_ts - start_ts).days + 1} kalenderdagen.")
+    return days
+
+
+def snap_to_days(dates, days):
+    """Elke datum naar de eerste grid-dag >= datum (NaT na de laatste grid-dag)."""
+    days = pd.DatetimeIndex(days)
+    dates = pd.to_datetime(pd.Series(dates)).dt.normalize()
+    pos = days.searchsorted(dates.to_numpy(), side='left')
+    out = np.full(len(dates), np.datetime64('NaT'), dtype='datetime64[ns]')
+    ok = (pos < len(days)) & dates.notna().to_numpy()
+    out[ok] = days.to_numpy()[pos[ok]]
+    return pd.Series(out, index=dates.index)
+
+
+def expand_to_calendar(df, key_cols, days, end_date=None, date_col='datum'):
+    """
+    Vult een frame op het grid `days` aan tot alle kalenderdagen: op een dag
+    buiten het grid krijgt elke key de rij van de vorige grid-dag (een key die
+    op die grid-dag ontbreekt, ontbreekt ook op de aangevulde dagen).
+    """
+    if df.empty:
+        return df
+    key_cols = list(key_cols)
+    dates = pd.to_datetime(df[date_col]).dt.normalize()
+    grid = pd.DatetimeIndex(days).normalize().sort_values()
+    end_ts = pd.Timestamp(end_date).normalize() if end_date is not None else grid[-1]
+    calendar = pd.date_range(grid[0], end_ts, freq='D')
+
+    # per kalenderdag de grid-dag waarvan hij de waarden overneemt
+    source = pd.Series(grid[grid.searchsorted(calendar, side='right') - 1], index=calendar)
+    fill = source[source.index != source.to_numpy()]
+    if fill.empty:
+        return df
+
+    extra = pd.DataFrame({date_col: fill.index, '_bron': fill.to_numpy()}).merge(
+        df.assign(_bron=dates.to_numpy()), on='_bron', suffixes=('', '_grid')
+    )
+    extra = extra.drop(columns=['_bron', f'{date_col}_grid'])[df.columns]
+    out = pd.concat([df.assign(**{date_col: dates.to_numpy()}), extra], ignore_index=True)
+    return out.sort_values([date_col] + key_cols, kind='stable').reset_index(drop=True)
@@ -0,0 +1,77 @@
+"""
+Getypeerde load-laag voor Access resultaten.
+
+pd.DataFrame.from_records(cursor.fetchall()) geeft object-kolommen voor alle
+tekst en float64 voor alle getallen. read_frame zet een resultaat in één keer om:
+  - tekstsleutels (CATEGORY_COLS) -> category (int codes + één kopie per waarde)
+  - datums -> datetime64 (vaste breedte); day_numbers() geeft int dagnummers
+    voor joins/sortering op integer sleutels
+  - ja/nee kolommen -> bool, gehele kolommen -> kleinste int type
+  - per kolom vastgelegde precisie (COLUMN_DTYPES); bedragen blijven float64
+
+Groupby op category kolommen altijd met observed=True (anders levert pandas
+ook lege combinaties van alle categorieën op).
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLS = (
+    'asset_rollup', 'asset', 'asset_detail', 'asset_type', 'broker', 'symbol',
+    'uniek_id', 'optie_call_put', 'transactie_type', 'fee_type', 'sector',
+)
+DATE_COLS = ('datum', 'optie_exp_date')
+
+# Kolommen waarvoor lagere precisie volstaat (nooit bedragen of aantallen die gesommeerd worden)
+COLUMN_DTYPES = {
+    'Id': 'int32',
+    'volume': 'float32',
+}
+
+
+def day_numbers(dates):
+    """Datums -> int64 dagnummers sinds 1970-01-01 (tijd van de dag valt weg)."""
+    return pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+def from_day_numbers(days):
+    return pd.to_datetime(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+
+
+def compact_frame(df, categories=CATEGORY_COLS, date_cols=DATE_COLS, dtypes=COLUMN_DTYPES):
+    """Zet kolommen van een vers geladen frame om naar compacte typen (in place, geeft df terug)."""
+    for col in df.columns:
+        series = df[col]
+        if col in dtypes:
+            numeric = pd.to_numeric(series, errors='coerce')
+            target = dtypes[col]
+            if target.startswith('int') and numeric.isna().any():
+                target = target.capitalize()  # nullable Int32 e.d.
+            df[col] = numeric.astype(target)
+        elif col in categories:
+            df[col] = series.astype('category')
+        elif col in date_cols:
+            df[col] = pd.to_datetime(series)
+        elif series.dtype == object:
+            non_null = series.dropna()
+            if non_null.empty:
+                continue
+            if non_null.map(type).eq(bool).all():
+                df[col] = series.astype('boolean') if len(non_null) < len(series) else series.astype(bool)
+            elif non_null.map(lambda v: isinstance(v, (int, float)) or hasattr(v, 'as_integer_ratio')).all():
+                df[col] = pd.to_numeric(series, errors='coerce').astype(float)
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+    return df
+
+
+def read_frame(cursor, query, *params, **compact_kwargs):
+    """Voert query uit en geeft een compact getypeerd DataFrame terug."""
+    cursor.execute(query, *params)
+    columns = [c[0] for c in cursor.description]
+    rows = cursor.fetchall()
+    df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns)
+    return compact_frame(df, **compact_kwargs)
+
+
+def frame_memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20
@@ -0,0 +1,232 @@
+"""
+Write-behind queue: de berekening geeft afgeronde resultaatbatches af en gaat
+door, één writer-thread schrijft ze op volgorde naar de Access database.
+
+Elke batch (naam van de schrijffunctie + argumenten) wordt eerst als record
+achter aan een lokaal append-only bestand geschreven (lengte + pickle, fsync)
+en pas daarna aan de writer gegeven. De writer heeft een eigen verbinding en
+voert de batches één voor één uit; na elke geslaagde batch wordt het
+volgnummer vastgelegd in het .done bestand. Lock-fouten (OneDrive, een open
+Access-venster) worden met oplopende wachttijd opnieuw geprobeerd op een
+nieuwe verbinding. Lukt een batch niet, dan blijven hij en alle volgende in
+het bestand staan en worden ze bij de volgende run met dezelfde database
+eerst opnieuw uitgevoerd (de schrijffuncties zijn diff-upserts, dus opnieuw
+uitvoeren is veilig).
+
+Berekeningen die opgeslagen resultaten lezen (bijv. de beginstand van stocks
+en dividend) moeten eerst wait() aanroepen. Frames die aan submit() zijn
+gegeven niet meer wijzigen.
+"""
+import hashlib
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import pyodbc
+
+from diff_writer import write_changed_rows, write_column_groups
+from open_options import write_open_option_table
+from rebuild import mark_window_done
+from sharding import connection_string
+import stage_flags
+
+# CLI-vlag van de stages
+FLAG, FLAG_HELP = stage_flags.WRITE_BEHIND, stage_flags.WRITE_BEHIND_HELP
+
+QUEUE_DIR = os.environ.get('PER_DAG_QUEUE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.per_dag_pipeline', 'write_queue'))
+
+# Schrijffuncties die via de wachtrij mogen: func(conn, cursor, *args, **kwargs)
+WRITERS = {
+    'write_changed_rows': write_changed_rows,
+    'write_column_groups': write_column_groups,
+    'write_open_option_table': write_open_option_table,
+    'mark_window_done': mark_window_done,
+}
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 60
+# Stukjes uit foutmeldingen van de Access driver die op een (tijdelijke) lock wijzen
+LOCK_MARKERS = (
+    'lock', 'vergrendeld', 'in use', 'in gebruik', 'already opened', 'al geopend',
+    '3218', '3260', '3262', '3045', '3050', '3188', '3734',
+)
+
+_HEADER = struct.Struct('<Q')
+
+
+def is_lock_error(error):
+    return isinstance(error, pyodbc.Error) and any(m in str(error).lower() for m in LOCK_MARKERS)
+
+
+def queue_path(db_path):
+    """Wachtrijbestand per database (lokaal, niet naast de database op OneDrive)."""
+    key = os.path.normcase(os.path.abspath(db_path))
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return os.path.join(QUEUE_DIR, f"{stem}.{hashlib.sha1(key.encode()).hexdigest()[:8]}.queue")
+
+
+def _read_records(path):
+    """Alle volledige records uit het wachtrijbestand; een half geschreven staart wordt afgekapt."""
+    records, good = [], 0
+    if not os.path.exists(path):
+        return records
+    with open(path, 'rb') as f:
+        data = f.read()
+    while good + _HEADER.size <= len(data):
+        (n,) = _HEADER.unpack_from(data, good)
+        end = good + _HEADER.size + n
+        if end > len(data):
+            break
+        records.append(pickle.loads(data[good + _HEADER.size:end]))
+        good = end
+    if good < len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(good)
+    return records
+
+
+def replay_pending(db_path):
+    """Schrijft openstaande batches van een eerdere run weg voordat er zonder wachtrij wordt geschreven."""
+    if os.path.exists(queue_path(db_path)):
+        WriteQueue(db_path).close()
+
+
+class WriteQueue:
+    def __init__(self, db_path, path=None):
+        self.db_path = db_path
+        self.path = path or queue_path(db_path)
+        self.done_path = self.path + '.done'
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.error = None
+        self._items = queue.Queue()
+        self._conn = None
+        records = _read_records(self.path)
+        done = self._read_done()
+        self._seq = max([done] + [r['seq'] for r in records])
+        self._file = open(self.path, 'ab')
+
+        self._thread = threading.Thread(target=self._drain, name='write-behind', daemon=True)
+        self._thread.start()
+
+        pending = [r for r in records if r['seq'] > done]
+        if pending:
+            print(f"Write-behind: {len(pending)} openstaande batches uit een vorige run worden eerst geschreven.")
+        for r in pending:
+            self._items.put((r, Future()))
+
+    # --- hoofdthread ---
+
+    def submit(self, kind, *args, **kwargs):
+        """Legt de batch vast in het wachtrijbestand en geeft een Future met het resultaat."""
+        self._raise_error()
+        if kind not in WRITERS:
+            raise ValueError(f"Onbekende schrijffunctie {kind!r}")
+        self._seq += 1
+        record = {'seq': self._seq, 'kind': kind, 'args': args, 'kwargs': kwargs}
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(_HEADER.pack(len(payload)) + payload)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        future = Future()
+        self._items.put((record, future))
+        return future
+
+    def wait(self):
+        """Wacht tot alle ingediende batches in de database staan."""
+        self._items.join()
+        self._raise_error()
+
+    def close(self):
+        """Schrijft de wachtrij leeg en stopt de writer; een lege wachtrij wordt opgeruimd."""
+        self._items.put(None)
+        self._thread.join()
+        self._file.close()
+        self._raise_error()
+        for path in (self.path, self.done_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(
+                f"Write-behind gestopt: {self.error}. De openstaande batches staan in {self.path} "
+                f"en worden bij de volgende run opnieuw geschreven."
+            ) from self.error
+
+    # --- writer-thread ---
+
+    def _read_done(self):
+        try:
+            with open(self.done_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _mark_done(self, seq):
+        tmp = self.done_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.done_path)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = pyodbc.connect(connection_string(self.db_path))
+        return self._conn
+
+    def _disconnect(self):
+        if self._conn is not None:
+            try:
+                self._conn.rollback()
+                self._conn.close()
+            except pyodbc.Error:
+                pass
+        self._conn = None
+
+    def _write(self, record):
+        func = WRITERS[record['kind']]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                conn = self._connect()
+                cursor = conn.cursor()
+                result = func(conn, cursor, *record['args'], **record['kwargs'])
+                cursor.close()
+                return result
+            except Exception as e:
+                self._disconnect()
+                if not is_lock_error(e) or attempt == MAX_ATTEMPTS:
+                    raise
+                wait = min(2 ** (attempt - 1), MAX_BACKOFF_SECONDS)
+                print(f"Write-behind: database vergrendeld bij {record['kind']} "
+                      f"(poging {attempt}/{MAX_ATTEMPTS}), opnieuw over {wait}s: {e}")
+                time.sleep(wait)
+
+    def _drain(self):
+        while True:
+            item = self._items.get()
+            if item is None:
+                self._items.task_done()
+                break
+            record, future = item
+            try:
+                if self.error is not None:
+                    raise RuntimeError("eerdere batch mislukt")
+                t = time.time()
+                future.set_result(self._write(record))
+                self._mark_done(record['seq'])
+                print(f"Write-behind: {record['kind']} #{record['seq']} geschreven in {time.time() - t:.2f}s")
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                future.set_exception(e)
+            finally:
+                self._items.task_done()
+        self._disconnect()